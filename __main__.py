@@ -1,19 +1,41 @@
+import os
+import shutil
+
 from granian import Granian
 from granian.constants import Interfaces
 from granian.log import LogLevels
 
+from app.settings import Settings
+
 
 if __name__ == '__main__':
+   settings = Settings.from_env()
+   owner = None
+   if settings.workers > 1:
+      # NOTE: Workers don't share memory, the storage lives in a separate process
+      # and every worker talks to it over a Unix socket, see app/remote.py.
+      # The storage modules are only imported here, a single worker imports them itself.
+      from app.remote import start_owner
+      owner, socket_path = start_owner(settings)
+      os.environ["STORAGE_SOCKET"] = socket_path
+
    g = Granian(
-      target="app.app:app", 
-      address="0.0.0.0", # listen on any address 
-      port=5051, 
-      interface=Interfaces.ASGI, 
-      websockets=False, 
-      log_access=True, 
-      log_enabled=True, 
-      log_level=LogLevels.debug, 
+      target="app.app:app",
+      address="0.0.0.0", # listen on any address
+      port=settings.port,
+      interface=Interfaces.ASGI,
+      workers=settings.workers,
+      websockets=True,
+      log_access=True,
+      log_enabled=True,
+      log_level=LogLevels.debug,
    )
 
-   g.serve()
-    
\ No newline at end of file
+   try:
+      g.serve()
+   finally:
+      if owner is not None:
+         # SIGTERM lets the owner flush its write-ahead log
+         owner.terminate()
+         owner.join()
+         shutil.rmtree(os.path.dirname(socket_path), ignore_errors=True)
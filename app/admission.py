@@ -0,0 +1,189 @@
+import time
+from http import HTTPStatus
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Optional
+
+from .settings import Settings
+
+if TYPE_CHECKING:
+    from asgiref.typing import HTTPScope
+
+
+# Requests are admitted against budgets, the default one and a separate one for expensive routes
+# such as dumping or clearing the whole storage. A budget bounds the requests in flight and the
+# rate of every client with a token bucket. Requests over the limits are answered right away,
+# 503 when the server is busy and 429 when the client sends too fast, both with Retry-After.
+DEFAULT = "default"
+EXPENSIVE = "expensive"
+
+# Reasons requests are rejected for
+IN_FLIGHT = "in_flight"
+RATE = "rate"
+
+_monotonic = time.monotonic
+
+# Rejections have no body, their messages are built once per status and Retry-After value.
+_EMPTY_BODY = {"type": "http.response.body", "body": b"", "more_body": False}
+
+
+class RateLimiter:
+    """Token bucket of every client, rate tokens per second up to burst, a request takes one"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 100_000) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._max_clients = max_clients
+        # client -> [tokens, monotonic time of the last refill]
+        self._buckets: dict[str | bytes, list[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, client: str | bytes, now: float) -> float:
+        """Take a token of client, returns 0 if there was one or else the seconds until there will be"""
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= self._max_clients:
+                self._sweep(now)
+            self._buckets[client] = [self.burst - 1, now]
+            return 0.0
+        tokens = bucket[0] + (now - bucket[1]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def _sweep(self, now: float) -> None:
+        # NOTE: Clients with a full bucket are forgotten, they'd start with a full one anyway.
+        buckets, rate, burst = self._buckets, self.rate, self.burst
+        for client in [client for client, (tokens, stamp) in buckets.items() if tokens + (now - stamp) * rate >= burst]:
+            del buckets[client]
+        if len(buckets) >= self._max_clients:
+            # every client is busy, the ones seen first are forgotten
+            for client in list(islice(buckets, len(buckets) // 2)):
+                del buckets[client]
+
+
+class _Budget:
+    __slots__ = ("max_in_flight", "in_flight", "limiter", "rejected")
+
+    def __init__(self, max_in_flight: int, limiter: Optional[RateLimiter]) -> None:
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.limiter = limiter
+        self.rejected = {IN_FLIGHT: 0, RATE: 0}
+
+
+class AdmissionControl:
+    """Decides which requests are served and which are rejected right away.
+
+    Expensive requests count against the in-flight limit of the default budget and of their own,
+    and against their own rate limit. Clients are told apart by the API key header if they send
+    it, by their address otherwise. Limits apply per worker process.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 0,
+        max_in_flight_expensive: int = 0,
+        rate: float = 0.0,
+        burst: float = 0.0,
+        rate_expensive: float = 0.0,
+        burst_expensive: float = 0.0,
+        key_header: str = "x-api-key",
+        retry_after: int = 1,
+        max_clients: int = 100_000,
+    ) -> None:
+        self._default = _Budget(max_in_flight, RateLimiter(rate, burst or rate, max_clients) if rate > 0 else None)
+        self._expensive = _Budget(max_in_flight_expensive, RateLimiter(rate_expensive, burst_expensive or rate_expensive, max_clients) if rate_expensive > 0 else None)
+        self._key_header = key_header.lower().encode()
+        self._retry_after = max(1, retry_after)
+        self._starts: dict[tuple[int, int], dict[str, Any]] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["AdmissionControl"]:
+        """Create admission control if any limit is configured"""
+        if not (settings.max_in_flight or settings.max_in_flight_expensive or settings.rate_limit > 0 or settings.rate_limit_expensive > 0):
+            return None
+        return cls(
+            max_in_flight=settings.max_in_flight,
+            max_in_flight_expensive=settings.max_in_flight_expensive,
+            rate=settings.rate_limit,
+            burst=settings.rate_limit_burst,
+            rate_expensive=settings.rate_limit_expensive,
+            burst_expensive=settings.rate_limit_burst_expensive,
+            key_header=settings.rate_limit_key_header,
+            retry_after=settings.overload_retry_after,
+            max_clients=settings.rate_limit_max_clients,
+        )
+
+    def _client(self, scope: "HTTPScope") -> str | bytes:
+        # NOTE: API keys are kept as bytes and addresses as str, so a key never matches an address.
+        key_header = self._key_header
+        for name, value in scope["headers"]:
+            if name == key_header:
+                return value
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    def _rejection(self, status: int, retry_after: float) -> dict[str, Any]:
+        # NOTE: Retry-After is in whole seconds, rounded up so clients don't come back too early.
+        seconds = max(1, -int(-retry_after // 1))
+        message = self._starts.get((status, seconds))
+        if message is None:
+            message = self._starts[(status, seconds)] = {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-length", b"0"), (b"retry-after", str(seconds).encode())],
+            }
+        return message
+
+    def admit(self, scope: "HTTPScope", expensive: bool = False) -> Optional[dict[str, Any]]:
+        """Take a place for the request, None if it's admitted, else the start message of its rejection.
+
+        Every admitted request has to be released once it's served.
+        """
+        budget = self._expensive if expensive else self._default
+        if budget.limiter is not None:
+            wait = budget.limiter.acquire(self._client(scope), _monotonic())
+            if wait:
+                budget.rejected[RATE] += 1
+                return self._rejection(HTTPStatus.TOO_MANY_REQUESTS, wait)
+
+        default = self._default
+        if default.max_in_flight and default.in_flight >= default.max_in_flight:
+            default.rejected[IN_FLIGHT] += 1
+            return self._rejection(HTTPStatus.SERVICE_UNAVAILABLE, self._retry_after)
+        if expensive:
+            if budget.max_in_flight and budget.in_flight >= budget.max_in_flight:
+                budget.rejected[IN_FLIGHT] += 1
+                return self._rejection(HTTPStatus.SERVICE_UNAVAILABLE, self._retry_after)
+            budget.in_flight += 1
+        default.in_flight += 1
+        return None
+
+    def release(self, expensive: bool = False) -> None:
+        self._default.in_flight -= 1
+        if expensive:
+            self._expensive.in_flight -= 1
+
+    async def reject(self, send: Any, message: dict[str, Any]) -> None:
+        """Send a rejection returned by admit"""
+        await send(message)
+        await send(_EMPTY_BODY)
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            name: {
+                "in_flight": budget.in_flight,
+                "max_in_flight": budget.max_in_flight,
+                "clients": len(budget.limiter) if budget.limiter is not None else 0,
+                "rejected": dict(budget.rejected),
+            }
+            for name, budget in ((DEFAULT, self._default), (EXPENSIVE, self._expensive))
+        }
@@ -1,149 +1,728 @@
 import json
+import math
+import time
+import asyncio
+import base64
 from typing import TYPE_CHECKING, Any, Optional
-from yarl import URL
+from urllib.parse import quote
 from http import HTTPMethod, HTTPStatus
 from loguru import logger
 
+from .settings import Settings
+from .storage import StorageEngine, EntryTooLargeError, Value
+from .router import Router, RouteNotFound, MethodNotAllowed
+from .persistence import Persistence
+from .store import LocalStore, PreconditionFailed
+from .remote import RemoteStore, StorageUnavailable
+from .log import LogPipeline, DEBUG
+from .metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from . import response
+from .watch import WatchHub, Subscriber
+from .admission import AdmissionControl
+from .replication import ReplicationLog, Follower, LEADER, FOLLOWER
+from . import batch, etag, keyindex, ranges, replication
+from .body import SpooledBody, BodyTooLarge, MalformedBody, ClientDisconnected, content_length
+
 
 if TYPE_CHECKING:
+    from multidict import MultiDictProxy
     from asgiref.typing import (
         Scope,
         HTTPScope, 
+        WebSocketScope,
         ASGIReceiveCallable, 
         ASGISendCallable, 
         LifespanScope, 
     )
 
+
+# Number of entries serialized per chunk of a streamed storage dump.
+DUMP_CHUNK_KEYS = 1000
+# Upper bound of ?limit= for a paginated storage dump.
+DUMP_MAX_LIMIT = 10_000
+# Metric labels of requests which didn't match any route, the method isn't used as is to keep their number bounded.
+UNMATCHED_ROUTE = ("*", "unmatched")
+# Status recorded for requests the client disconnected from before a response was sent.
+CLIENT_CLOSED_REQUEST = 499
+# WebSocket endpoint watching keys for changes.
+WATCH_PATH = "/api/v1/watch"
+# Close codes of watch connections, subscribers falling behind may try again later.
+WS_POLICY_VIOLATION = 1008
+WS_TRY_AGAIN_LATER = 1013
+# Endpoint followers stream the mutations of a replication leader from.
+REPLICATION_PATH = "/api/v1/replication"
+
+
+def _ndjson_lines(items: list[tuple[str, Value]]) -> bytes:
+    """Serialize storage entries as newline delimited json"""
+    lines: list[str] = []
+    for key, value in items:
+        if isinstance(value, (bytes, memoryview)):
+            try:
+                record = {"key": key, "value": str(value, "utf-8")}
+            except UnicodeDecodeError:
+                # NOTE: Binary values can't be represented in json directly.
+                record = {"key": key, "value": base64.b64encode(value).decode(), "encoding": "base64"}
+        else:
+            record = {"key": key, "value": value}
+        lines.append(json.dumps(record))
+    lines.append("")
+    return "\n".join(lines).encode()
+
+
+def _query(scope: "HTTPScope | WebSocketScope", encoded: bool = False) -> "MultiDictProxy[str]":
+    """Parameters of the query string, with encoded set percent-encoded values are decoded"""
+    # NOTE: yarl is only imported by the first request with a query string, keys are never
+    # passed in the query on the hot paths so most workers start and serve without it.
+    from yarl import URL
+    return URL.build(query_string=scope.get("query_string", b"").decode(), encoded=encoded).query
+
+
+def _header(scope: "HTTPScope", name: bytes) -> Optional[str]:
+    """Value of a request header, None if it's missing"""
+    for header, value in scope["headers"]:
+        if header == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _condition(scope: "HTTPScope", name: bytes) -> Optional[frozenset[str]]:
+    """Entity tags of an If-Match or If-None-Match header"""
+    value = _header(scope, name)
+    return etag.parse(value) if value is not None else None
+
+
+def _ttl(scope: "HTTPScope", from_query: bool = False) -> Optional[float]:
+    """TTL in seconds from the X-TTL header, or the ttl query parameter if from_query is set.
+
+    Raises ValueError if it's not a positive number.
+    """
+    value = _header(scope, b"x-ttl")
+    if value is None and from_query and scope.get("query_string"):
+        value = _query(scope).get("ttl")
+    if value is None:
+        return None
+    ttl = float(value)
+    if not (ttl > 0 and math.isfinite(ttl)):
+        raise ValueError(f"ttl must be a positive number of seconds, got {value}")
+    return ttl
+
+
+def _accepts_encoding(scope: "HTTPScope", encoding: str) -> bool:
+    """Check whether the client accepts content encoding according to its Accept-Encoding header"""
+    for name, value in scope["headers"]:
+        if name != b"accept-encoding":
+            continue
+        for item in value.decode("latin-1").split(","):
+            token, _, params = item.partition(";")
+            if token.strip().lower() not in (encoding, "*"):
+                continue
+            name, _, q = params.strip().partition("=")
+            try:
+                return name.strip() != "q" or float(q) > 0
+            except ValueError:
+                return False
+    return False
+
+
 class ASGIApp:
-    def __init__(self) -> None:
-        self._storage: dict[str, Any] = {}
+    def __init__(
+        self,
+        storage: Optional[StorageEngine] = None,
+        persistence: Optional[Persistence] = None,
+        settings: Optional[Settings] = None,
+        log: Optional[LogPipeline] = None,
+        store: Optional[LocalStore | RemoteStore] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        settings = settings if settings is not None else Settings.from_env()
+        self._settings = settings
+        self._storage: Optional[StorageEngine] = None
+        self._persistence: Optional[Persistence] = None
+        if store is None and settings.storage_socket:
+            # NOTE: One of several workers, storage is owned by a separate process shared by all of them.
+            store = RemoteStore(settings.storage_socket)
+        if store is None:
+            self._storage = storage if storage is not None else StorageEngine.from_settings(settings)
+            # NOTE: Persistence is optional, when disabled mutations only live in memory.
+            self._persistence = persistence if persistence is not None else Persistence.from_settings(settings)
+            store = LocalStore(self._storage, self._persistence)
+        self._store = store
+        self._replication: Optional[ReplicationLog] = None
+        self._follower: Optional[Follower] = None
+        if settings.replication_role in (LEADER, FOLLOWER) and not isinstance(store, LocalStore):
+            raise ValueError("replication needs the storage in the server process, run a single worker")
+        if settings.replication_role == LEADER:
+            self._replication = ReplicationLog.from_settings(settings)
+            store.replication = self._replication
+            self._storage = store.storage
+        elif settings.replication_role == FOLLOWER:
+            if not settings.replication_leader:
+                raise ValueError("a replication follower needs the url of its leader")
+            self._follower = Follower.from_settings(settings, store)
+        elif settings.replication_role:
+            raise ValueError(f"unknown replication role {settings.replication_role}")
+        # NOTE: Changes of the store are published to WebSocket subscribers of this worker.
+        self._watch = WatchHub.from_settings(settings)
+        store.changes = self._watch
+        # NOTE: The pipeline takes over logging on lifespan startup, until then records are only queued.
+        self._log = log if log is not None else LogPipeline.from_settings(settings)
+        self._metrics = metrics if metrics is not None else Metrics.from_settings(settings)
+        # NOTE: Admission control is optional, without limits every request is served.
+        self._admission = AdmissionControl.from_settings(settings)
+        self._route_names: dict[Any, str] = {}
+        self._route_labels: dict[Any, tuple[str, str]] = {}
+        self._router = self._build_router()
+
+
+    def _build_router(self) -> Router:
+        """Compile the route table, done once at startup"""
+        routes = (
+            (HTTPMethod.GET, "/api/v1/storage", self._dump_storage),
+            (HTTPMethod.PUT, "/api/v1/storage", self._put_query_handler),
+            (HTTPMethod.DELETE, "/api/v1/storage", self._clear_handler),
+            (HTTPMethod.GET, "/api/v1/storage/{key}", self._get_handler),
+            (HTTPMethod.PUT, "/api/v1/storage/{key}", self._put_handler),
+            (HTTPMethod.DELETE, "/api/v1/storage/{key}", self._del_handler),
+            # NOTE: Batch operations use custom method suffixes, so they never shadow a key.
+            (HTTPMethod.POST, "/api/v1/storage:mget", self._mget_handler),
+            (HTTPMethod.POST, "/api/v1/storage:mset", self._mset_handler),
+            (HTTPMethod.POST, "/api/v1/storage:mdel", self._mdel_handler),
+            (HTTPMethod.GET, "/api/v1/stats", self._stats_handler),
+            (HTTPMethod.GET, "/metrics", self._metrics_handler),
+            (HTTPMethod.GET, REPLICATION_PATH, self._replication_handler),
+        )
+        # NOTE: Followers only serve reads, writes are redirected to the leader.
+        self._writes = {
+            self._put_query_handler,
+            self._clear_handler,
+            self._put_handler,
+            self._del_handler,
+            self._mset_handler,
+            self._mdel_handler,
+        }
+        # Routes working on the whole storage have an admission budget of their own, monitoring
+        # and the long-lived replication stream aren't limited.
+        self._expensive = {self._dump_storage, self._clear_handler}
+        self._unlimited = {self._stats_handler, self._metrics_handler, self._replication_handler}
+        router = Router()
+        for method, path, handler in routes:
+            router.add_route(method, path, handler)
+            # route names, e.g. "GET /api/v1/storage/{key}", are used to sample logs per route
+            self._route_names[handler] = f"{method} {path}"
+            self._route_labels[handler] = (str(method), path)
+        return router
         
 
-    async def _get_handler(self, scope: "HTTPScope", send: "ASGISendCallable") -> None:
+    async def _get_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable", key: str) -> None:
         """Get value from the storage"""
-        key = URL(scope["path"]).parts[-1]
-        logger.info({"key": key})
-        if v := self._storage.get(key, None):
-            await self._send_response(HTTPStatus.OK, send, body=v)
-        else: 
+        pathsend = "http.response.pathsend" in (scope.get("extensions") or {})
+        lookup = await self._store.get(key, with_path=pathsend, if_none_match=_condition(scope, b"if-none-match"))
+        if not lookup.modified:
+            # NOTE: The client already holds this version, the value isn't even read.
+            await self._send_response(HTTPStatus.NOT_MODIFIED, send, headers={"etag": etag.format_etag(lookup.etag)})
+            return
+        v, encoding, path = lookup.value, lookup.encoding, lookup.path
+        if v is None:
             await self._send_response(HTTPStatus.NOT_FOUND, send, body=f"key {key} doesn't exist")
+            return
+
+        headers = {"etag": etag.format_etag(lookup.etag)}
+        if encoding is not None:
+            # NOTE: Compressed values go out as is if the client can decode them.
+            if _accepts_encoding(scope, encoding):
+                headers = {"etag": etag.format_etag(lookup.etag, encoding), "content-encoding": encoding, "vary": "accept-encoding"}
+            else:
+                v = self._store.decode(v, encoding)
+                headers["vary"] = "accept-encoding"
+
+        headers["accept-ranges"] = "bytes"
+        range_header = _header(scope, b"range")
+        if range_header is not None:
+            if_range = _header(scope, b"if-range")
+            # NOTE: Ranges refer to the representation sent, a compressed one if it's sent compressed.
+            if if_range is None or ranges.if_range(if_range, headers["etag"]):
+                await self._send_ranges(range_header, send, v, headers)
+                return
+
+        # NOTE: Values from the cold tier come as memoryview, they are sent without copying.
+        # Values with a file of their own are sent by the server straight from disk if it supports pathsend.
+        if path is not None and isinstance(v, memoryview):
+            await self._send_path(HTTPStatus.OK, send, path, len(v), headers)
+            return
+        await self._send_response(HTTPStatus.OK, send, body=v, headers=headers)
     
     
-    async def _put_handler(self, scope: "HTTPScope", send: "ASGISendCallable", receive: "ASGIReceiveCallable") -> None:
-        """Put value into a storage"""
-        # NOTE: If query string is present, retrieve key-value pair(s) from query string, 
-        # otherwise the last part of the URL should serve as a key and body holds a value.
-        url = URL(scope["path"])
-        if query := url.query:
-            logger.info({"query": query})
-            for k, v in query.items():
-                self._storage[k] = v
-            await self._send_response(HTTPStatus.ACCEPTED, send)
-        elif key := url.parts[-1]:
-            logger.info({"key": key})
-            body = await self._read_body(receive)
-            self._storage[key] = body
-            await self._send_response(HTTPStatus.ACCEPTED, send)
-        else:
-            logger.error(f"url {url} doesn't contain key")
-            await self._send_response(HTTPStatus.INTERNAL_SERVER_ERROR, send, body="key is not specified")
+    async def _send_ranges(self, range_header: str, send: "ASGISendCallable", v: Value, headers: dict[str, str]) -> None:
+        """Send the ranges of a value a Range header asks for, the whole value if the header is ignored"""
+        content_type = None
+        if isinstance(v, str):
+            v = v.encode()
+            content_type = response.TEXT
+        try:
+            selected = ranges.parse(range_header, len(v))
+        except ranges.RangeNotSatisfiable as ex:
+            logger.debug({"range": str(ex)})
+            await self._send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, send, headers={"content-range": f"bytes */{len(v)}"})
+            return
+        if selected is None:
+            await response.send_response(send, HTTPStatus.OK, v, content_type, headers)
+            return
+        if len(selected) == 1:
+            start, stop = selected[0]
+            headers["content-range"] = ranges.content_range(start, stop, len(v))
+            await response.send_response(send, HTTPStatus.PARTIAL_CONTENT, memoryview(v)[start:stop], content_type, headers)
+            return
+        multipart_type, parts = ranges.multipart(v, selected, content_type)
+        await response.send_parts(send, HTTPStatus.PARTIAL_CONTENT, parts, multipart_type, headers)
 
 
-    async def _del_handler(self, scope: "HTTPScope", send: "ASGISendCallable") -> None:
-        """Delete value from the storage"""
-        key = URL(scope["path"]).parts[-1]
+    async def _put_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable", key: str) -> None:
+        """Put value into a storage, the last part of the URL serves as a key and body holds a value"""
+        if_match = _condition(scope, b"if-match")
+        try:
+            ttl = _ttl(scope, from_query=True)
+        except ValueError as ex:
+            await self._send_response(HTTPStatus.BAD_REQUEST, send, body=str(ex))
+            return
+
+        body = await self._read_body(scope, receive, spill=True)
         try:
-            v = self._storage.pop(key)
-        except KeyError:
+            if isinstance(body, SpooledBody):
+                tag = await self._store.put_file(key, body, if_match, ttl)
+            else:
+                tag = await self._store.put(key, body, if_match, ttl)
+        except EntryTooLargeError as ex:
+            await self._send_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, send, body=str(ex))
+            return
+        finally:
+            if isinstance(body, SpooledBody):
+                body.close()
+        await self._send_response(HTTPStatus.ACCEPTED, send, headers={"etag": etag.format_etag(tag)})
+
+
+    async def _put_query_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Put key-value pair(s) from the query string into a storage"""
+        # NOTE: The ttl parameter applies to the keys put, as it does for a single key, it isn't a key itself.
+        items = [(name, value) for name, value in _query(scope).items() if name != "ttl"]
+        if not items:
+            logger.error(f"url {scope['path']} doesn't contain key")
+            await self._send_response(HTTPStatus.BAD_REQUEST, send, body="key is not specified")
+            return
+
+        try:
+            ttl = _ttl(scope, from_query=True)
+        except ValueError as ex:
+            await self._send_response(HTTPStatus.BAD_REQUEST, send, body=str(ex))
+            return
+
+        if self._log.enabled(DEBUG):
+            self._log.emit("DEBUG", {"query": dict(items)})
+        try:
+            await self._store.put_many(items, ttl)
+        except EntryTooLargeError as ex:
+            await self._send_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, send, body=str(ex))
+            return
+        await self._send_response(HTTPStatus.ACCEPTED, send)
+
+
+    async def _del_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable", key: str) -> None:
+        """Delete value from the storage"""
+        if not await self._store.delete(key, _condition(scope, b"if-match")):
             await self._send_response(HTTPStatus.NOT_FOUND, send, body=f"key {key} doesn't exist") 
             return
+        await self._send_response(HTTPStatus.OK, send)
+
 
+    async def _clear_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Remove all items from the storage"""
+        # NOTE: This should require JWT authentication
+        logger.debug("Removed all items from the storage")
+        await self._store.clear()
         await self._send_response(HTTPStatus.OK, send)
 
 
-    async def _read_body(self, receive: "ASGIReceiveCallable") -> bytes:
-        """Read request body"""
+    async def _mget_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Get values of several keys, body holds length-prefixed keys"""
+        try:
+            keys = batch.decode_keys(await self._read_body(scope, receive))
+        except batch.BatchFormatError as ex:
+            await self._send_response(HTTPStatus.BAD_REQUEST, send, body=str(ex))
+            return
+
+        if self._log.enabled(DEBUG):
+            self._log.emit("DEBUG", {"mget": len(keys)})
+        values = [v.encode() if isinstance(v, str) else v for v in await self._store.get_many(keys)]
+        await self._send_response(HTTPStatus.OK, send, body=batch.encode_values(values), headers={"content-type": batch.CONTENT_TYPE})
+
+
+    async def _mset_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Put several key-value pairs, body holds length-prefixed keys and values"""
+        try:
+            ttl = _ttl(scope)
+            items = batch.decode_items(await self._read_body(scope, receive))
+        except (ValueError, batch.BatchFormatError) as ex:
+            await self._send_response(HTTPStatus.BAD_REQUEST, send, body=str(ex))
+            return
+
+        if self._log.enabled(DEBUG):
+            self._log.emit("DEBUG", {"mset": len(items)})
+        try:
+            await self._store.put_many(items, ttl)
+        except EntryTooLargeError as ex:
+            await self._send_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, send, body=str(ex))
+            return
+        await self._send_response(HTTPStatus.ACCEPTED, send)
+
+
+    async def _mdel_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Delete several keys, responds with one byte per key set to 1 if the key existed"""
+        try:
+            keys = batch.decode_keys(await self._read_body(scope, receive))
+        except batch.BatchFormatError as ex:
+            await self._send_response(HTTPStatus.BAD_REQUEST, send, body=str(ex))
+            return
+
+        if self._log.enabled(DEBUG):
+            self._log.emit("DEBUG", {"mdel": len(keys)})
+        deleted = await self._store.delete_many(keys)
+        await self._send_response(HTTPStatus.OK, send, body=bytes(deleted), headers={"content-type": batch.CONTENT_TYPE})
+
+
+    async def _stats_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Report storage statistics"""
+        stats = await self._store.stats()
+        if self._replication is not None:
+            stats["replication"] = self._replication.stats
+        elif self._follower is not None:
+            stats["replication"] = self._follower.stats
+        if self._admission is not None:
+            stats["admission"] = self._admission.stats
+        await self._send_response(HTTPStatus.OK, send, body=stats)
+
+
+    async def _metrics_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Report request metrics and storage statistics in the Prometheus text format"""
+        stats = await self._store.stats()
+        body = self._metrics.render(stats["storage"], self._admission.stats if self._admission is not None else None).encode()
+        await self._send_response(HTTPStatus.OK, send, body=body, headers={"content-type": METRICS_CONTENT_TYPE})
+
+
+    async def _replication_handler(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Stream the mutations of this leader to a follower, see app/replication.py.
+
+        The follower passes the epoch and the last sequence number it applied, since=0 for none.
+        """
+        if self._replication is None or self._storage is None:
+            await self._send_response(HTTPStatus.NOT_FOUND, send, body="this server isn't a replication leader")
+            return
+        query = _query(scope)
+        try:
+            since = int(query.get("since") or 0)
+        except ValueError:
+            since = -1
+        if since < 0:
+            await self._send_response(HTTPStatus.BAD_REQUEST, send, body="since must be a non-negative integer")
+            return
+
+        logger.info({"replication": "follower connected", "client": scope.get("client"), "since": since})
+        await send({
+            "type": "http.response.start",
+            "status": HTTPStatus.OK,
+            "headers": response.encode_headers({"content-type": replication.CONTENT_TYPE, replication.EPOCH_HEADER: self._replication.epoch}),
+        })
+
+        async def send_frame(frame: bytes) -> None:
+            await send({"type": "http.response.body", "body": frame, "more_body": True})
+
+        streaming = asyncio.create_task(replication.stream(
+            self._replication, self._storage, since, query.get("epoch"), send_frame, self._settings.replication_heartbeat,
+        ))
+        disconnected = asyncio.create_task(self._wait_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait((streaming, disconnected), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            streaming.cancel()
+            disconnected.cancel()
+        if streaming in done:
+            try:
+                # NOTE: The stream ends when the follower fell behind the log, it reconnects and gets a snapshot.
+                streaming.result()
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            except (OSError, RuntimeError):
+                # the follower went away while frames were being sent
+                pass
+        logger.info({"replication": "follower disconnected", "client": scope.get("client")})
+
+
+    async def _wait_disconnect(self, receive: "ASGIReceiveCallable") -> None:
+        """Return once the client of a streamed response disconnects"""
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+
+    async def _redirect_to_leader(self, scope: "HTTPScope", send: "ASGISendCallable") -> None:
+        """Send a write to a follower on to the leader, 307 keeps the method and the body"""
+        location = self._settings.replication_leader.rstrip("/") + (scope.get("raw_path") or quote(scope["path"]).encode()).decode("latin-1")
+        if scope.get("query_string"):
+            location += "?" + scope["query_string"].decode("latin-1")
+        await self._send_response(HTTPStatus.TEMPORARY_REDIRECT, send, body="writes go to the replication leader", headers={"location": location})
+
+
+    async def _dump_storage(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Stream the whole storage, or a single page of it, as newline delimited json.
+
+        With prefix, start or end set only the keys in that range are returned, in key order.
+        """
+        # NOTE: Keys in the query, cursors of ordered scans included, come percent-encoded.
+        query = _query(scope, encoded=True)
+        headers = {"content-type": "application/x-ndjson"}
+
+        ordered = "prefix" in query or "start" in query or "end" in query
+        start, end = query.get("start", ""), query.get("end")
+        if (prefix := query.get("prefix")) is not None:
+            start = max(start, prefix)
+            if (end_of_prefix := keyindex.prefix_end(prefix)) is not None and (end is None or end_of_prefix < end):
+                end = end_of_prefix
+
+        if "cursor" in query or "limit" in query:
+            try:
+                # NOTE: Ordered scans continue after the last key of the previous page, it's their cursor.
+                cursor = 0 if ordered else int(query.get("cursor") or 0)
+                limit = min(int(query.get("limit") or DUMP_CHUNK_KEYS), DUMP_MAX_LIMIT)
+            except ValueError:
+                await self._send_response(HTTPStatus.BAD_REQUEST, send, body="cursor and limit must be integers")
+                return
+            if cursor < 0 or limit < 1:
+                await self._send_response(HTTPStatus.BAD_REQUEST, send, body="cursor and limit are out of range")
+                return
+
+            if ordered:
+                next_key, items = await self._store.range_scan(start, end, query.get("cursor") or None, limit)
+                if next_key is not None:
+                    headers["x-next-cursor"] = quote(next_key, safe="")
+            else:
+                next_cursor, items = await self._store.scan(cursor, limit)
+                if next_cursor is not None:
+                    headers["x-next-cursor"] = str(next_cursor)
+            await self._send_response(HTTPStatus.OK, send, body=_ndjson_lines(items), headers=headers)
+            return
+
+        # NOTE: Only one chunk of entries is held in memory at a time,
+        # and the event loop gets control back between chunks so other requests are served.
+        await send({
+            "type": "http.response.start",
+            "status": HTTPStatus.OK,
+            "headers": response.encode_headers(headers),
+        })
+        next_cursor: Optional[int] = 0
+        next_key: Optional[str] = None
+        while True:
+            if ordered:
+                next_key, items = await self._store.range_scan(start, end, next_key, DUMP_CHUNK_KEYS)
+            else:
+                next_cursor, items = await self._store.scan(next_cursor, DUMP_CHUNK_KEYS)
+            if items:
+                await send({"type": "http.response.body", "body": _ndjson_lines(items), "more_body": True})
+            if (next_key if ordered else next_cursor) is None:
+                break
+            await asyncio.sleep(0)
+
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+    async def _read_body(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", spill: bool = False) -> bytes | memoryview | SpooledBody:
+        """Read request body.
+
+        Bodies larger than max_body_bytes are rejected with BodyTooLarge, as early as Content-Length allows.
+        With spill enabled bodies above body_spill_bytes are written to a temporary file instead of memory.
+        """
+        max_size = self._settings.max_body_bytes
+        spill_size = self._settings.body_spill_bytes if spill else max_size
+        expected = content_length(scope)
+        if expected is not None and expected > max_size:
+            raise BodyTooLarge(f"request body of {expected} bytes exceeds limit of {max_size} bytes")
+
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        if msg["type"] != "http.request":
+            raise RuntimeError("Unknown ASGI event", msg["type"])
+
+        # msg["body"] contains the request body 
+        # if body is missing, defaults to b""
+        chunk = msg.get("body", b"")
+        if not msg.get("more_body", False):
+            # NOTE: Most bodies arrive in a single message, they are returned without copying.
+            if len(chunk) > max_size:
+                raise BodyTooLarge(f"request body exceeds limit of {max_size} bytes")
+            if expected is not None and len(chunk) != expected:
+                raise MalformedBody(f"request body of {len(chunk)} bytes doesn't match content-length {expected}")
+            return chunk
+
+        # NOTE: Nothing is allocated from Content-Length before the bytes arrive, chunks are joined
+        # once at the end. Bodies known to be large go to a temporary file right away.
         body_chunks: list[bytes] = []
+        spooled: Optional[SpooledBody] = None
+        if expected is not None and expected > spill_size:
+            spooled = SpooledBody(self._settings.body_spill_dir)
 
-        while True: 
-            msg = await receive()
-            if msg["type"] == "http.request":
-                # msg["body"] contains the request body 
-                # if body is missing, defaults to b""
-                chunk = msg["body"]
+        received = 0
+        more_body = True
+        try:
+            while True: 
                 if chunk:
-                    logger.debug({"chunk": chunk})
-                    body_chunks.append(chunk)
+                    received += len(chunk)
+                    if received > max_size:
+                        raise BodyTooLarge(f"request body exceeds limit of {max_size} bytes")
+                    if expected is not None and received > expected:
+                        raise MalformedBody(f"request body is longer than content-length {expected}")
 
-                if not msg["more_body"]:
+                    if spooled is not None:
+                        spooled.write(chunk)
+                    else:
+                        body_chunks.append(chunk)
+                        if received > spill_size:
+                            spooled = SpooledBody(self._settings.body_spill_dir)
+                            for spilled in body_chunks:
+                                spooled.write(spilled)
+                            body_chunks.clear()
+
+                if not more_body:
                     break
-            elif msg["type"] == "http.disconnected": 
-                raise RuntimeError("Disconnected event")
-            else:
-                raise RuntimeError("Unknown ASGIN event", msg["type"])
-                
+
+                msg = await receive()
+                if msg["type"] == "http.request":
+                    chunk = msg.get("body", b"")
+                    more_body = msg.get("more_body", False)
+                elif msg["type"] == "http.disconnect": 
+                    raise ClientDisconnected()
+                else:
+                    raise RuntimeError("Unknown ASGI event", msg["type"])
+        except BaseException:
+            if spooled is not None:
+                spooled.close()
+            raise
+
+        if expected is not None and received != expected:
+            if spooled is not None:
+                spooled.close()
+            raise MalformedBody(f"request body is shorter than content-length {expected}")
+
+        if spooled is not None:
+            return spooled
         return b"".join(body_chunks)
         
         
-    async def _send_response(self, http_status: HTTPStatus, send: "ASGISendCallable", body: bytes | str | dict = b"", headers: Optional[dict[str, str]] = None) -> None:
+    async def _send_response(self, http_status: HTTPStatus, send: "ASGISendCallable", body: bytes | memoryview | str | dict = b"", headers: Optional[dict[str, str]] = None) -> None:
         """Send response to the server"""
-        headers = dict(headers) if headers else {}  
-
         # We always send data in bytes
+        content_type = None
         if isinstance(body, str):
             body = body.encode()
-            headers["content-type"] = "text/plain"
+            content_type = response.TEXT
         elif isinstance(body, dict): 
             body = json.dumps(body).encode()
-            headers["content-type"] = "application/json"
-        
-        # convert headers to binary stream  
-        def headers_to_bytes(headers: dict[str, str]) -> list[tuple[bytes, bytes]]:
-            return [(k.lower().encode(), v.encode()) for k, v in headers.items()] 
-        
+            content_type = response.JSON
+        if headers and "content-type" in headers:
+            content_type = None
+
+        # NOTE: Header lists and messages of the common responses are prebuilt, see app/response.py.
+        await response.send_response(send, http_status, body, content_type, headers)
+
+
+    async def _send_path(self, http_status: HTTPStatus, send: "ASGISendCallable", path: str, length: int, headers: Optional[dict[str, str]] = None) -> None:
+        """Send file as response body using the pathsend extension"""
+        headers = dict(headers) if headers else {}
+        headers["content-length"] = str(length)
         await send({
             "type": "http.response.start",
-            "status": http_status,  
-            "headers": headers_to_bytes(headers)
+            "status": http_status,
+            "headers": response.encode_headers(headers),
         })
-
-        await send({"type": "http.response.body", "body": body, "more_body": False})
+        await send({"type": "http.response.pathsend", "path": path})
 
 
     async def _handle_http_protocol(self, scope: "HTTPScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
         """Handle http calls"""
-        method = scope["method"] 
-        if method not in (HTTPMethod.PUT, HTTPMethod.GET, HTTPMethod.POST, HTTPMethod.DELETE):
-            raise RuntimeError(f"Unsupported method {scope['method']}")
+        start = time.perf_counter_ns()
+        status = 0
 
-        if method == HTTPMethod.GET:
-            logger.info({"method": HTTPMethod.GET, "url": scope["path"]})
+        async def send_and_record(message: Any) -> None:
+            # the status is taken from the response as it goes out, whichever code path sends it
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
 
-            # We whould have to get a book's id somehow.
+        labels = UNMATCHED_ROUTE
+        try:
+            try:
+                handler, params = self._router.resolve(scope["method"], scope["path"])
+            except RouteNotFound:
+                if self._log.sample("unmatched"):
+                    self._log.emit("INFO", {"method": scope["method"], "url": scope["path"], "status": HTTPStatus.NOT_FOUND})
+                await self._send_response(HTTPStatus.NOT_FOUND, send_and_record, body=f"path {scope['path']} not found")
+                return
+            except MethodNotAllowed as ex:
+                if self._log.sample("unmatched"):
+                    self._log.emit("INFO", {"method": scope["method"], "url": scope["path"], "status": HTTPStatus.METHOD_NOT_ALLOWED})
+                await self._send_response(HTTPStatus.METHOD_NOT_ALLOWED, send_and_record, body=f"unsupported method {scope['method']}", headers={"allow": ", ".join(ex.allowed)})
+                return
 
-            # GET data from the whole storage 
-            if scope["path"].removesuffix("/") == "/api/v1/storage":
-                logger.info("retrive the whole storage")
-                storage = self._storage.copy() 
-                await self._send_response(HTTPStatus.OK, send, body=storage)
-            else:
-                await self._get_handler(scope, send)
+            labels = self._route_labels[handler]
+            if self._follower is not None and handler in self._writes:
+                await self._redirect_to_leader(scope, send_and_record)
+                return
 
-        elif method == HTTPMethod.PUT:
-            logger.info({"method": HTTPMethod.PUT, "url": scope["path"]})
-            await self._put_handler(scope, send, receive)
-        
-        elif method == HTTPMethod.DELETE:
-            logger.info({"method": HTTPMethod.DELETE, "url": scope["path"]})
-            # NOTE: If the path doesn't contain a key, 
-            # that signifies that the whole storage should be cleared. 
-            if scope["path"].removesuffix("/") == "/api/v1/storage":
-                # NOTE: This should require JWT authentication
-                logger.debug("Removed all items from the storage")
-                self._storage.clear()
-                await self._send_response(HTTPStatus.OK, send)
-            else:
-                await self._del_handler(scope, send)
+            # NOTE: Routes with a parameter take a key, their keys are counted to find the hot ones.
+            if params:
+                self._metrics.touch(params[0])
+
+            # NOTE: Sampling is decided before the record is built, records which aren't logged cost nothing.
+            if self._log.sample(self._route_names[handler]):
+                self._log.emit("INFO", {"method": scope["method"], "url": scope["path"]})
+
+            # NOTE: Requests over the limits are rejected before any work is done for them,
+            # a place is taken right before the handler runs so it's always released.
+            admission = self._admission
+            if admission is not None:
+                if handler in self._unlimited:
+                    admission = None
+                else:
+                    expensive = handler in self._expensive
+                    if (rejection := admission.admit(scope, expensive)) is not None:
+                        await admission.reject(send_and_record, rejection)
+                        return
+
+            try:
+                await handler(scope, receive, send_and_record, *params)
+            except BodyTooLarge as ex:
+                await self._send_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, send_and_record, body=str(ex))
+            except MalformedBody as ex:
+                await self._send_response(HTTPStatus.BAD_REQUEST, send_and_record, body=str(ex))
+            except PreconditionFailed as ex:
+                await self._send_response(HTTPStatus.PRECONDITION_FAILED, send_and_record, body=str(ex))
+            except StorageUnavailable as ex:
+                # NOTE: A response already started can't be replaced, the server aborts it.
+                if status:
+                    raise
+                await self._send_response(HTTPStatus.SERVICE_UNAVAILABLE, send_and_record, body=str(ex))
+            except ClientDisconnected:
+                logger.debug({"disconnected": scope["path"]})
+                status = status or CLIENT_CLOSED_REQUEST
+            except Exception:
+                logger.exception({"method": scope["method"], "url": scope["path"], "status": HTTPStatus.INTERNAL_SERVER_ERROR})
+                # NOTE: A response already started can't be replaced, the server aborts it.
+                if status:
+                    raise
+                await self._send_response(HTTPStatus.INTERNAL_SERVER_ERROR, send_and_record, body="internal server error")
+            finally:
+                if admission is not None:
+                    admission.release(expensive)
+        finally:
+            # NOTE: Nothing sent means the request failed with an exception, the server answers it with 500.
+            self._metrics.record(labels[0], labels[1], status or HTTPStatus.INTERNAL_SERVER_ERROR, (time.perf_counter_ns() - start) // 1000)
         
 
     async def _handle_lifespan_protocol(self, scope: "LifespanScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
@@ -151,27 +730,94 @@ class ASGIApp:
         while True:
             event = await receive()
             if event["type"] == "lifespan.startup":
-               await send({"type": "lifespan.startup.complete"}) 
+                self._log.start()
+                try:
+                    await self._store.open()
+                except Exception as ex:
+                    logger.exception("failed to open storage")
+                    await send({"type": "lifespan.startup.failed", "message": str(ex)})
+                    return
+                if self._follower is not None:
+                    await self._follower.start()
+                await send({"type": "lifespan.startup.complete"}) 
             elif event["type"] == "lifespan.shutdown":
                 break
-                
+
+        if self._follower is not None:
+            await self._follower.close()
+        await self._store.close()
+        self._log.stop()
         await send({"type": "lifespan.shutdown.complete"})
 
 
+    async def _handle_websocket_protocol(self, scope: "WebSocketScope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> None:
+        """Stream changes of watched keys to the client.
+
+        Keys and prefixes to watch are given with the key and prefix query parameters and
+        changed with {"op": "subscribe" | "unsubscribe", "keys": [...], "prefixes": [...]} messages.
+        Events carry the new entity tag, and the value as well with values=1 in the query.
+        """
+        if (await receive())["type"] != "websocket.connect":
+            return
+        if scope["path"] != WATCH_PATH:
+            # NOTE: Closing before accepting rejects the handshake with 403.
+            await send({"type": "websocket.close", "code": WS_POLICY_VIOLATION})
+            return
+
+        query = _query(scope)
+        subscriber = self._watch.subscriber(with_values=query.get("values", "") in ("1", "true"))
+        self._watch.subscribe(subscriber, query.getall("key", []), query.getall("prefix", []))
+        await send({"type": "websocket.accept"})
+        commands = asyncio.create_task(self._watch_commands(receive, subscriber))
+        try:
+            while messages := await subscriber.next_messages():
+                for text in messages:
+                    await send({"type": "websocket.send", "text": text})
+            if subscriber.overflowed:
+                await send({"type": "websocket.close", "code": WS_TRY_AGAIN_LATER, "reason": "too slow to keep up with changes"})
+        except (OSError, RuntimeError):
+            # the client went away while events were being sent
+            pass
+        finally:
+            self._watch.remove(subscriber)
+            commands.cancel()
+
+
+    async def _watch_commands(self, receive: "ASGIReceiveCallable", subscriber: Subscriber) -> None:
+        """Apply subscribe and unsubscribe messages of a watch connection until it's closed"""
+        try:
+            while (message := await receive())["type"] == "websocket.receive":
+                try:
+                    command = json.loads(message.get("text") or message.get("bytes") or b"")
+                    keys, prefixes = command.get("keys", []), command.get("prefixes", [])
+                    if not isinstance(keys, list) or not isinstance(prefixes, list) or not all(isinstance(item, str) for item in [*keys, *prefixes]):
+                        raise ValueError("keys and prefixes must be lists of strings")
+                    if command.get("op") == "subscribe":
+                        self._watch.subscribe(subscriber, keys, prefixes)
+                    elif command.get("op") == "unsubscribe":
+                        self._watch.unsubscribe(subscriber, keys, prefixes)
+                    else:
+                        raise ValueError(f"unknown op {command.get('op')}")
+                except (ValueError, TypeError, AttributeError) as ex:
+                    # NOTE: Invalid commands are ignored, the connection keeps the subscriptions it has.
+                    logger.debug({"watch": "invalid command", "error": str(ex)})
+        finally:
+            subscriber.close()
+
+
     async def __call__(self, scope: "Scope", receive: "ASGIReceiveCallable", send: "ASGISendCallable") -> Any:
         """Granian server entry point"""
-        try:
-            if scope["type"] == "lifespan":
-                logger.debug("lifespan protocol is used")
-                await self._handle_lifespan_protocol(scope, receive, send)
-            elif scope["type"] == "http":
-                logger.debug("http protocol is used")
-                await self._handle_http_protocol(scope, receive, send)
-            else:
-                raise RuntimeError("Unknown ASGI protocol type", scope["type"])
-            
-        except Exception as ex:
-            print(ex)
+        # NOTE: Errors of a request are answered with 500 by the http handler, anything else
+        # goes to the server which logs it and closes the connection.
+        if scope["type"] == "lifespan":
+            logger.debug("lifespan protocol is used")
+            await self._handle_lifespan_protocol(scope, receive, send)
+        elif scope["type"] == "http":
+            await self._handle_http_protocol(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._handle_websocket_protocol(scope, receive, send)
+        else:
+            raise RuntimeError("Unknown ASGI protocol type", scope["type"])
 
 # this would be invoked by the granian server
 app = ASGIApp()
@@ -0,0 +1,115 @@
+import struct
+from typing import Optional
+
+
+# Wire format of batch requests and responses, all lengths are unsigned 32-bit big-endian integers.
+#   keys   (mget, mdel request): (key length | key) * n
+#   items  (mset request):       (key length | key | value length | value) * n
+#   values (mget response):      (value length | value) * n, missing values have length MISSING and no payload
+#   flags  (mdel response):      one byte per key, 1 if the key was deleted
+CONTENT_TYPE = "application/x-kv-batch"
+MISSING = 0xFFFFFFFF
+
+# Upper bound of keys in a single batch request.
+MAX_BATCH_KEYS = 10_000
+
+_LEN = struct.Struct(">I")
+
+
+class BatchFormatError(ValueError):
+    """Raised when a batch body can't be decoded"""
+
+
+def _read_chunk(view: memoryview, pos: int) -> tuple[memoryview, int]:
+    if pos + _LEN.size > len(view):
+        raise BatchFormatError(f"truncated length at offset {pos}")
+    (length, ) = _LEN.unpack_from(view, pos)
+    pos += _LEN.size
+    if pos + length > len(view):
+        raise BatchFormatError(f"truncated chunk at offset {pos}")
+    return view[pos:pos + length], pos + length
+
+
+def _read_key(view: memoryview, pos: int) -> tuple[str, int]:
+    chunk, pos = _read_chunk(view, pos)
+    try:
+        return str(chunk, "utf-8"), pos
+    except UnicodeDecodeError:
+        raise BatchFormatError(f"key at offset {pos - len(chunk)} is not valid utf-8") from None
+
+
+def _check_count(count: int) -> None:
+    if count > MAX_BATCH_KEYS:
+        raise BatchFormatError(f"batch holds more than {MAX_BATCH_KEYS} keys")
+
+
+def encode_keys(keys: list[str]) -> bytes:
+    parts: list[bytes] = []
+    for key in keys:
+        key_bytes = key.encode()
+        parts.append(_LEN.pack(len(key_bytes)))
+        parts.append(key_bytes)
+    return b"".join(parts)
+
+
+def decode_keys(body: bytes) -> list[str]:
+    view = memoryview(body)
+    keys: list[str] = []
+    pos = 0
+    while pos < len(view):
+        key, pos = _read_key(view, pos)
+        keys.append(key)
+        _check_count(len(keys))
+    return keys
+
+
+def encode_items(items: list[tuple[str, bytes]]) -> bytes:
+    parts: list[bytes] = []
+    for key, value in items:
+        key_bytes = key.encode()
+        parts.append(_LEN.pack(len(key_bytes)))
+        parts.append(key_bytes)
+        parts.append(_LEN.pack(len(value)))
+        parts.append(value)
+    return b"".join(parts)
+
+
+def decode_items(body: bytes) -> list[tuple[str, memoryview]]:
+    """Decode key-value pairs, values are views into body"""
+    view = memoryview(body)
+    items: list[tuple[str, memoryview]] = []
+    pos = 0
+    while pos < len(view):
+        key, pos = _read_key(view, pos)
+        value, pos = _read_chunk(view, pos)
+        items.append((key, value))
+        _check_count(len(items))
+    return items
+
+
+def encode_values(values: list[Optional[bytes | memoryview]]) -> bytes:
+    parts: list[bytes | memoryview] = []
+    for value in values:
+        if value is None:
+            parts.append(_LEN.pack(MISSING))
+        else:
+            parts.append(_LEN.pack(len(value)))
+            parts.append(value)
+    return b"".join(parts)
+
+
+def decode_values(body: bytes) -> list[Optional[bytes]]:
+    view = memoryview(body)
+    values: list[Optional[bytes]] = []
+    pos = 0
+    while pos < len(view):
+        if pos + _LEN.size > len(view):
+            raise BatchFormatError(f"truncated length at offset {pos}")
+        (length, ) = _LEN.unpack_from(view, pos)
+        if length == MISSING:
+            values.append(None)
+            pos += _LEN.size
+        else:
+            value, pos = _read_chunk(view, pos)
+            values.append(bytes(value))
+    return values
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import zlib
+from typing import BinaryIO, Optional
+
+from . import etag
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds the configured limit"""
+
+
+class MalformedBody(Exception):
+    """Raised when a request body doesn't match its Content-Length"""
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away while its request body is being read"""
+
+
+class SpooledBody:
+    """Request body spilled to a temporary file instead of being held in memory"""
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.file: BinaryIO = tempfile.TemporaryFile(dir=directory or None)
+        self.length = 0
+        self._crc = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.length += len(chunk)
+        # NOTE: The entity tag is computed as the body arrives, it's never read back for it.
+        self._crc = zlib.crc32(chunk, self._crc)
+
+    @property
+    def etag(self) -> int:
+        return etag.combine(self.length, self._crc)
+
+    def fileno(self) -> int:
+        self.file.flush()
+        return self.file.fileno()
+
+    def read(self) -> bytes:
+        """Load the whole body into memory"""
+        self.file.flush()
+        return os.pread(self.file.fileno(), self.length, 0)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __len__(self) -> int:
+        return self.length
+
+
+def content_length(scope: dict) -> Optional[int]:
+    """Value of the Content-Length header, None if it's missing"""
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                length = int(value)
+            except ValueError:
+                raise MalformedBody(f"invalid content-length {value!r}") from None
+            if length < 0:
+                raise MalformedBody(f"invalid content-length {length}")
+            return length
+    return None
@@ -0,0 +1,246 @@
+import mmap
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+
+# Dead segments are unlinked only after this many seconds,
+# a server may still be sending them to a client through http.response.pathsend.
+_RETIRE_GRACE = 30.0
+
+# A sealed segment is compacted once less than this fraction of it holds live values.
+_COMPACT_RATIO = 0.5
+
+
+class ColdTierFullError(Exception):
+    """Raised when the cold tier reached its disk budget"""
+
+
+class ColdRef:
+    """Location of a value in the cold tier.
+
+    Refs are shared between the storage and the tier, compaction moves values
+    by updating refs in place.
+    """
+
+    __slots__ = ("segment", "offset", "length", "compressed")
+
+    def __init__(self, segment: "_Segment", offset: int, length: int) -> None:
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.compressed = False
+
+
+class _Segment:
+    """Memory-mapped segment file holding cold values back to back"""
+
+    def __init__(self, path: Path, size: int, dedicated: bool = False) -> None:
+        self.path = path
+        self.size = size
+        self.dedicated = dedicated
+        self.used = 0
+        self.live_bytes = 0
+        self.refs: set[ColdRef] = set()
+        self.sealed = dedicated
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.ftruncate(self.fd, size)
+        self.mmap = mmap.mmap(self.fd, size, access=mmap.ACCESS_READ)
+
+    def append(self, data: bytes) -> int:
+        # NOTE: Written with pwrite rather than through the mapping,
+        # so pages aren't mapped into the process until a value is read.
+        offset = self.used
+        os.pwrite(self.fd, data, offset)
+        self.used += len(data)
+        return offset
+
+    def append_file(self, fd: int, length: int) -> int:
+        """Copy length bytes from the start of a file, inside the kernel where possible"""
+        offset = self.used
+        copied = 0
+        while copied < length:
+            try:
+                n = os.copy_file_range(fd, self.fd, length - copied, copied, offset + copied)
+            except OSError:
+                # e.g. across filesystems on older kernels
+                n = os.pwrite(self.fd, os.pread(fd, min(length - copied, 1024 * 1024), copied), offset + copied)
+            if n == 0:
+                raise OSError(f"source file is shorter than {length} bytes")
+            copied += n
+        self.used += length
+        return offset
+
+    def close(self) -> None:
+        self.mmap.close()
+        os.close(self.fd)
+
+
+@dataclass
+class ColdTierStats:
+    segments: int = 0
+    disk_bytes: int = 0
+    live_bytes: int = 0
+    values: int = 0
+    compactions: int = 0
+
+
+class ColdTier:
+    """Tier for large values, kept in memory-mapped segment files instead of the Python heap.
+
+    Values are appended to the active segment, values of at least segment_size bytes
+    get a dedicated segment file, which can be handed over to the server as a whole (pathsend).
+    Pages of the segments belong to the page cache, they are file-backed memory the kernel
+    may drop under pressure and read back on demand, unlike heap memory of the process.
+
+    The tier only lives as long as the process, durability is provided by the write-ahead log.
+    """
+
+    def __init__(self, directory: str | Path, threshold: int = 64 * 1024, segment_size: int = 64 * 1024 * 1024, max_bytes: int = 8 * 1024 * 1024 * 1024) -> None:
+        # NOTE: The directory is prepared with the first segment, constructing the tier does no I/O
+        # as it happens when the app module is imported.
+        self._directory = Path(directory)
+        self._prepared = False
+
+        self.threshold = threshold
+        self._segment_size = segment_size
+        self._max_bytes = max_bytes
+        self._next_id = 0
+        self._active: Optional[_Segment] = None
+        self._segments: set[_Segment] = set()
+        self._retired: list[tuple[float, _Segment]] = []
+        self._disk_bytes = 0
+        self._compactions = 0
+
+    def _prepare(self) -> None:
+        """Create the directory and remove segments left behind by a previous process"""
+        self._directory.mkdir(parents=True, exist_ok=True)
+        for stale in self._directory.glob("cold-*.seg"):
+            stale.unlink()
+        self._prepared = True
+
+    def _new_segment(self, size: int, dedicated: bool = False) -> _Segment:
+        if not self._prepared:
+            self._prepare()
+        if self._disk_bytes + size > self._max_bytes:
+            self._reap()
+            if self._disk_bytes + size > self._max_bytes:
+                raise ColdTierFullError(f"cold tier budget of {self._max_bytes} bytes exhausted")
+
+        self._next_id += 1
+        segment = _Segment(self._directory / f"cold-{self._next_id:08d}.seg", size, dedicated)
+        self._segments.add(segment)
+        self._disk_bytes += size
+        return segment
+
+    def _allocate(self, length: int) -> _Segment:
+        """Find a segment with room for a value of length bytes"""
+        if length >= self._segment_size:
+            return self._new_segment(length, dedicated=True)
+        if self._active is None or self._active.used + length > self._active.size:
+            if self._active is not None:
+                self._active.sealed = True
+                self._maybe_compact(self._active)
+            self._active = self._new_segment(self._segment_size)
+        return self._active
+
+    def _track(self, segment: _Segment, offset: int, length: int) -> ColdRef:
+        ref = ColdRef(segment, offset, length)
+        segment.refs.add(ref)
+        segment.live_bytes += length
+        return ref
+
+    def write(self, data: bytes) -> ColdRef:
+        """Move value into the tier"""
+        segment = self._allocate(len(data))
+        return self._track(segment, segment.append(data), len(data))
+
+    def write_file(self, fd: int, length: int) -> ColdRef:
+        """Move value held in a file into the tier, without loading it into memory"""
+        segment = self._allocate(length)
+        return self._track(segment, segment.append_file(fd, length), length)
+
+    def read(self, ref: ColdRef) -> memoryview:
+        """Get value as a view into the mapped segment, nothing is copied"""
+        return memoryview(ref.segment.mmap)[ref.offset:ref.offset + ref.length]
+
+    def path(self, ref: ColdRef) -> Optional[str]:
+        """Path of a file holding exactly this value, if there is one"""
+        return str(ref.segment.path) if ref.segment.dedicated else None
+
+    def free(self, ref: ColdRef) -> None:
+        """Release space taken by a value which is no longer stored"""
+        segment = ref.segment
+        segment.refs.discard(ref)
+        segment.live_bytes -= ref.length
+        if segment.sealed:
+            if not segment.refs:
+                self._retire(segment)
+            else:
+                self._maybe_compact(segment)
+
+    def _maybe_compact(self, segment: _Segment) -> None:
+        if segment.dedicated or segment.live_bytes >= segment.size * _COMPACT_RATIO:
+            return
+
+        # NOTE: Live values are copied into the active segment and their refs repointed,
+        # views handed out earlier keep the old mapping alive until they are released.
+        self._compactions += 1
+        for ref in list(segment.refs):
+            data = memoryview(segment.mmap)[ref.offset:ref.offset + ref.length]
+            try:
+                moved = self.write(data)
+            finally:
+                data.release()
+            segment.refs.discard(ref)
+            moved.segment.refs.discard(moved)
+            ref.segment, ref.offset = moved.segment, moved.offset
+            ref.segment.refs.add(ref)
+        segment.live_bytes = 0
+        self._retire(segment)
+
+    def _retire(self, segment: _Segment) -> None:
+        if segment not in self._segments:
+            return
+        self._segments.discard(segment)
+        if segment is self._active:
+            self._active = None
+        self._retired.append((time.monotonic(), segment))
+        self._reap()
+
+    def _reap(self) -> None:
+        """Unlink retired segments once their grace period is over and no views reference them"""
+        now = time.monotonic()
+        pending: list[tuple[float, _Segment]] = []
+        for retired_at, segment in self._retired:
+            if now - retired_at < _RETIRE_GRACE and segment.dedicated:
+                pending.append((retired_at, segment))
+                continue
+            try:
+                segment.close()
+            except BufferError:
+                # a response is still being sent from this segment
+                pending.append((retired_at, segment))
+                continue
+            try:
+                os.unlink(segment.path)
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= segment.size
+            logger.debug({"cold_segment": "released", "path": str(segment.path)})
+        self._retired = pending
+
+    @property
+    def stats(self) -> ColdTierStats:
+        return ColdTierStats(
+            segments=len(self._segments),
+            disk_bytes=self._disk_bytes,
+            live_bytes=sum(segment.live_bytes for segment in self._segments),
+            values=sum(len(segment.refs) for segment in self._segments),
+            compactions=self._compactions,
+        )
@@ -0,0 +1,91 @@
+import time
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Optional
+
+
+# Content-Encoding token used for values compressed with the lz4 frame format.
+LZ4_ENCODING = "lz4"
+
+# Values at least this large are first probed by compressing a sample of them.
+_SAMPLE_FROM = 64 * 1024
+_SAMPLE_SIZE = 4 * 1024
+
+
+class Compressed:
+    """Value stored in compressed form"""
+
+    __slots__ = ("data", )
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+@dataclass
+class CompressionStats:
+    attempts: int = 0
+    compressed: int = 0
+    skipped: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    compress_seconds: float = 0.0
+    decompressions: int = 0
+    decompress_seconds: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """Compressed size relative to the original size of compressed values"""
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+
+
+class Compressor:
+    """LZ4 compression of stored values.
+
+    Values smaller than threshold are left alone, values whose compressed size
+    is above max_ratio of the original are stored as is, they would cost CPU
+    on every read without saving much memory.
+    """
+
+    def __init__(self, threshold: int = 1024, max_ratio: float = 0.9, level: int = 0) -> None:
+        # NOTE: lz4 is loaded once compression is enabled, not with the storage.
+        import lz4.frame
+        self._lz4: ModuleType = lz4.frame
+        self.threshold = threshold
+        self._max_ratio = max_ratio
+        self._level = level
+        self.stats = CompressionStats()
+
+    def compress(self, value: bytes | memoryview) -> Optional[Compressed]:
+        """Compress value, returns None if it doesn't compress well"""
+        stats = self.stats
+        stats.attempts += 1
+        start = time.perf_counter()
+        try:
+            # NOTE: Probing a sample first keeps the cost of incompressible blobs (media, archives) low.
+            if len(value) >= _SAMPLE_FROM:
+                sample = self._lz4.compress(value[:_SAMPLE_SIZE], compression_level=self._level)
+                if len(sample) > _SAMPLE_SIZE * self._max_ratio:
+                    stats.skipped += 1
+                    return None
+
+            data = self._lz4.compress(value, compression_level=self._level)
+            if len(data) > len(value) * self._max_ratio:
+                stats.skipped += 1
+                return None
+        finally:
+            stats.compress_seconds += time.perf_counter() - start
+
+        stats.compressed += 1
+        stats.bytes_in += len(value)
+        stats.bytes_out += len(data)
+        return Compressed(data)
+
+    def decompress(self, data: bytes | memoryview) -> bytes:
+        start = time.perf_counter()
+        value = self._lz4.decompress(data)
+        self.stats.decompressions += 1
+        self.stats.decompress_seconds += time.perf_counter() - start
+        return value
@@ -0,0 +1,45 @@
+import zlib
+from typing import Optional
+
+
+# Entity tags are computed once when a value is written: its length and crc32 packed into one integer.
+# Both have to match for two values to get the same tag, which is plenty to tell versions of a key apart.
+# Tags are strong, representations in a content encoding get the encoding appended, e.g. "5-3610a686-lz4".
+
+
+def combine(length: int, crc: int) -> int:
+    return (length << 32) | crc
+
+
+def compute(value: bytes | str | memoryview) -> int:
+    """Tag of a value"""
+    if isinstance(value, str):
+        value = value.encode()
+    return combine(len(value), zlib.crc32(value))
+
+
+def format_etag(tag: int, encoding: Optional[str] = None) -> str:
+    """Value of the ETag header"""
+    suffix = f"-{encoding}" if encoding else ""
+    return f'"{tag >> 32:x}-{tag & 0xFFFFFFFF:08x}{suffix}"'
+
+
+def parse(header: str) -> frozenset[str]:
+    """Tags listed in an If-Match or If-None-Match header, "*" stands for any tag"""
+    return frozenset(item.strip() for item in header.split(",") if item.strip())
+
+
+def matches(tag: Optional[int], condition: frozenset[str], weak: bool = False) -> bool:
+    """Evaluate a precondition against the tag of the current value, None if there is no value.
+
+    With weak comparison (If-None-Match) weak tags "W/..." match as well.
+    """
+    if tag is None:
+        return False
+    if "*" in condition:
+        return True
+    if weak:
+        condition = frozenset(item.removeprefix("W/") for item in condition)
+    current = format_etag(tag)
+    # the tag of a representation in a content encoding refers to the same value
+    return any(item == current or item.startswith(current[:-1] + "-") for item in condition)
@@ -0,0 +1,107 @@
+import math
+from collections import deque
+from typing import Optional
+
+
+# Resolution of the wheel in seconds, keys expire at most this late.
+TICK = 0.1
+
+# Every level has 256 slots, a slot of level n spans 256**n ticks.
+# Four levels cover 256**4 ticks (13 years), later deadlines wait in the last level.
+_SLOT_BITS = 8
+_SLOTS = 1 << _SLOT_BITS
+_SLOT_MASK = _SLOTS - 1
+_LEVELS = 4
+
+
+class TimerWheel:
+    """Hierarchical timer wheel tracking deadlines of keys.
+
+    Scheduling a key is O(1): it goes into a slot of the lowest level whose span covers its deadline.
+    Whenever the lowest level wraps around, the next slot of the level above is cascaded down,
+    an entry moves at most once per level before it expires, so expiring a key is O(1) amortized.
+    Nothing is ever scanned or sorted, and no timer exists per key.
+
+    Rescheduled and cancelled keys aren't searched for in the slots, deadlines holds the
+    current deadline of every key and entries not matching it are dropped when they come up.
+    """
+
+    def __init__(self, now: float) -> None:
+        self.deadlines: dict[str, float] = {}
+        # NOTE: The wheel's clock rounds down and deadlines round up, so keys never expire early.
+        self._tick = int(now // TICK)
+        self._levels: list[list[list[tuple[str, float]]]] = [[[] for _ in range(_SLOTS)] for _ in range(_LEVELS)]
+        self._due: deque[tuple[str, float]] = deque()
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def deadline(self, key: str) -> Optional[float]:
+        return self.deadlines.get(key)
+
+    def schedule(self, key: str, deadline: float) -> None:
+        self.deadlines[key] = deadline
+        self._insert(key, deadline)
+
+    def cancel(self, key: str) -> None:
+        self.deadlines.pop(key, None)
+
+    def clear(self) -> None:
+        self.deadlines.clear()
+        for level in self._levels:
+            for slot in level:
+                slot.clear()
+        self._due.clear()
+
+    def _insert(self, key: str, deadline: float) -> None:
+        tick = math.ceil(deadline / TICK)
+        delta = tick - self._tick
+        if delta <= 0:
+            self._due.append((key, deadline))
+            return
+        for level in range(_LEVELS):
+            if delta < 1 << (_SLOT_BITS * (level + 1)) or level == _LEVELS - 1:
+                self._levels[level][(tick >> (_SLOT_BITS * level)) & _SLOT_MASK].append((key, deadline))
+                return
+
+    def advance(self, now: float, limit: int = 10_000) -> list[str]:
+        """Move the wheel up to now, returns up to limit keys whose deadline passed.
+
+        Returned keys are no longer tracked, it's up to the caller to remove them.
+        Keys over the limit are returned by the following calls.
+        """
+        target = int(now // TICK)
+        while self._tick < target:
+            self._tick += 1
+            slot_index = self._tick & _SLOT_MASK
+            if slot_index == 0:
+                self._cascade(1)
+            slot = self._levels[0][slot_index]
+            if slot:
+                self._due.extend(slot)
+                slot.clear()
+
+        deadlines = self.deadlines
+        pending = self._due
+        due: list[str] = []
+        while pending and len(due) < limit:
+            key, deadline = pending.popleft()
+            if deadlines.get(key) == deadline:
+                del deadlines[key]
+                due.append(key)
+        return due
+
+    def _cascade(self, level: int) -> None:
+        """Redistribute the current slot of a level over the levels below it"""
+        slot_index = (self._tick >> (_SLOT_BITS * level)) & _SLOT_MASK
+        if slot_index == 0 and level + 1 < _LEVELS:
+            self._cascade(level + 1)
+        slot = self._levels[level][slot_index]
+        if not slot:
+            return
+        entries = slot[:]
+        slot.clear()
+        deadlines = self.deadlines
+        for key, deadline in entries:
+            if deadlines.get(key) == deadline:
+                self._insert(key, deadline)
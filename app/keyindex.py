@@ -0,0 +1,129 @@
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+
+# Keys are kept in a list of sorted chunks along with the last key of every chunk. A lookup bisects
+# the last keys and then a single chunk, an insert or a delete shifts the keys of that chunk only.
+# Chunks growing to twice the load are split in half and chunks shrinking below half of it are
+# merged with a neighbour, so a scan of k keys touches O(k / load + 1) chunks.
+DEFAULT_LOAD = 1000
+
+
+def prefix_end(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with prefix, None if there is none"""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+class KeyIndex:
+    """Keys in sorted order, for prefix and range scans"""
+
+    def __init__(self, load: int = DEFAULT_LOAD) -> None:
+        self._load = load
+        self._chunks: list[list[str]] = []
+        self._maxes: list[str] = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, key: str) -> bool:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        chunk = self._chunks[i]
+        return chunk[bisect_left(chunk, key)] == key
+
+    def add(self, key: str) -> None:
+        """Insert key, nothing happens if it's already there"""
+        maxes = self._maxes
+        if not maxes:
+            self._chunks.append([key])
+            maxes.append(key)
+            self._len = 1
+            return
+        i = bisect_left(maxes, key)
+        if i == len(maxes):
+            # NOTE: Keys written in ascending order, e.g. with a counter or a timestamp, land here.
+            i -= 1
+            chunk = self._chunks[i]
+            chunk.append(key)
+            maxes[i] = key
+        else:
+            chunk = self._chunks[i]
+            j = bisect_left(chunk, key)
+            if chunk[j] == key:
+                return
+            chunk.insert(j, key)
+        self._len += 1
+        if len(chunk) > 2 * self._load:
+            self._split(i)
+
+    def discard(self, key: str) -> None:
+        """Remove key, nothing happens if it isn't there"""
+        maxes = self._maxes
+        i = bisect_left(maxes, key)
+        if i == len(maxes):
+            return
+        chunks = self._chunks
+        chunk = chunks[i]
+        j = bisect_left(chunk, key)
+        if chunk[j] != key:
+            return
+        del chunk[j]
+        self._len -= 1
+        if not chunk:
+            del chunks[i]
+            del maxes[i]
+        elif len(chunk) < self._load // 2 and len(chunks) > 1:
+            self._merge(i if i + 1 < len(chunks) else i - 1)
+        elif j == len(chunk):
+            maxes[i] = chunk[-1]
+
+    def clear(self) -> None:
+        self._chunks.clear()
+        self._maxes.clear()
+        self._len = 0
+
+    def _split(self, i: int) -> None:
+        chunk = self._chunks[i]
+        half = len(chunk) // 2
+        self._chunks.insert(i + 1, chunk[half:])
+        del chunk[half:]
+        self._maxes[i] = chunk[-1]
+        self._maxes.insert(i + 1, self._chunks[i + 1][-1])
+
+    def _merge(self, i: int) -> None:
+        """Merge chunk i with the one after it"""
+        chunks, maxes = self._chunks, self._maxes
+        chunks[i].extend(chunks[i + 1])
+        del chunks[i + 1]
+        del maxes[i]
+        maxes[i] = chunks[i][-1]
+        if len(chunks[i]) > 2 * self._load:
+            self._split(i)
+
+    def keys(self, start: str = "", end: Optional[str] = None, after: Optional[str] = None, count: int = 1000) -> list[str]:
+        """Up to count keys with start <= key < end in ascending order, all of them greater than after if set"""
+        maxes, chunks = self._maxes, self._chunks
+        if after is not None and after >= start:
+            i = bisect_right(maxes, after)
+            j = bisect_right(chunks[i], after) if i < len(chunks) else 0
+        else:
+            i = bisect_left(maxes, start)
+            j = bisect_left(chunks[i], start) if i < len(chunks) else 0
+
+        keys: list[str] = []
+        while i < len(chunks) and len(keys) < count:
+            chunk = chunks[i]
+            stop = j + count - len(keys)
+            if end is not None and maxes[i] >= end:
+                keys += chunk[j:min(stop, bisect_left(chunk, end, j))]
+                break
+            keys += chunk[j:stop]
+            i, j = i + 1, 0
+        return keys
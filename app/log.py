@@ -0,0 +1,200 @@
+import json
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Optional, TextIO
+
+from loguru import logger
+
+from .settings import Settings
+
+
+_LEVELS = {"TRACE": 5, "DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+DEBUG = _LEVELS["DEBUG"]
+INFO = _LEVELS["INFO"]
+
+_LOGURU_FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}"
+
+# Handler writing loguru messages to stderr, loguru's default one until a pipeline replaces it.
+# Handlers added by anyone else are left alone.
+_stderr_handler_id: Optional[int] = 0
+
+
+def _remove_stderr_handler() -> bool:
+    """Remove the stderr handler, returns whether there was one"""
+    global _stderr_handler_id
+    handler_id, _stderr_handler_id = _stderr_handler_id, None
+    if handler_id is None:
+        return False
+    try:
+        logger.remove(handler_id)
+    except ValueError:
+        # removed already by whoever configured loguru
+        return False
+    return True
+
+
+def _restore_stderr_handler(level: str) -> None:
+    global _stderr_handler_id
+    _stderr_handler_id = logger.add(sys.stderr, level=level, format=_LOGURU_FORMAT)
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """Parse "GET /api/v1/storage/{key}=0.01,PUT /api/v1/storage/{key}=0.1" into a mapping"""
+    rates: dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, rate = item.rpartition("=")
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+class LogPipeline:
+    """Logging for the request hot path.
+
+    Records are appended to an in-memory queue as raw fields, a background thread
+    formats them and writes them out in batches, so a request never waits on I/O
+    or pays for serialization. Loguru records emitted elsewhere in the app go through
+    the same queue once the pipeline is started.
+
+    Callers check enabled()/sample() before building a record, high-volume routes
+    can be sampled, e.g. a rate of 0.01 logs every hundredth request.
+    When the queue is full new records are dropped and counted rather than blocking.
+    """
+
+    def __init__(
+        self,
+        level: str = "INFO",
+        sample_rates: Optional[dict[str, float]] = None,
+        default_sample_rate: float = 1.0,
+        stream: Optional[TextIO] = None,
+        asynchronous: bool = True,
+        batch_size: int = 512,
+        flush_interval: float = 0.05,
+        max_queue: int = 100_000,
+    ) -> None:
+        self.level = level.upper()
+        self.levelno = _LEVELS[self.level]
+        self._sample_every = {route: self._every(rate) for route, rate in (sample_rates or {}).items()}
+        self._default_every = self._every(default_sample_rate)
+        self._counters: dict[str, int] = {}
+        self._stream = stream
+        self._asynchronous = asynchronous
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_queue = max_queue
+
+        self._queue: deque[str | tuple[float, str, dict[str, Any]]] = deque()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._handler_id: Optional[int] = None
+        self._replaced_stderr = False
+
+        # counters
+        self.emitted = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "LogPipeline":
+        return cls(
+            level=settings.log_level,
+            sample_rates=parse_sample_rates(settings.log_sample_rates),
+            default_sample_rate=settings.log_default_sample_rate,
+            asynchronous=settings.log_pipeline == "async",
+        )
+
+    @staticmethod
+    def _every(rate: float) -> int:
+        """Sampling rate as "log one of every N records", 0 disables logging"""
+        return 0 if rate <= 0 else max(1, round(1 / rate))
+
+    def start(self) -> None:
+        """Route loguru through the pipeline and start the writer thread"""
+        stream = self._stream or sys.stderr
+        self._replaced_stderr = _remove_stderr_handler()
+        if not self._asynchronous:
+            self._handler_id = logger.add(stream, level=self.level, format=_LOGURU_FORMAT)
+            return
+
+        self._handler_id = logger.add(self._enqueue_message, level=self.level, format=_LOGURU_FORMAT)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, args=(stream, ), name="log-pipeline", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write out everything queued so far and stop the writer thread"""
+        if self._thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        if self._handler_id is not None:
+            logger.remove(self._handler_id)
+            self._handler_id = None
+        if self._replaced_stderr:
+            self._replaced_stderr = False
+            _restore_stderr_handler(self.level)
+
+    def enabled(self, levelno: int) -> bool:
+        return levelno >= self.levelno
+
+    def sample(self, route: str, levelno: int = INFO) -> bool:
+        """Decide whether a record of a route should be logged, check before building it"""
+        if levelno < self.levelno:
+            return False
+        every = self._sample_every.get(route, self._default_every)
+        if every == 1:
+            return True
+        if every == 0:
+            return False
+        count = self._counters.get(route, 0) + 1
+        self._counters[route] = count
+        return count % every == 0
+
+    def emit(self, level: str, fields: dict[str, Any]) -> None:
+        """Queue a structured record, formatting happens on the writer thread"""
+        if not self._asynchronous:
+            logger.log(level, fields)
+            return
+        if len(self._queue) >= self._max_queue:
+            self.dropped += 1
+            return
+        self._queue.append((time.time(), level, fields))
+        self.emitted += 1
+        if len(self._queue) >= self._batch_size:
+            self._wake.set()
+
+    def _enqueue_message(self, message: str) -> None:
+        # loguru sink, message is already formatted
+        if len(self._queue) >= self._max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(str(message))
+
+    @staticmethod
+    def _format(item: str | tuple[float, str, dict[str, Any]]) -> str:
+        if isinstance(item, str):
+            return item
+        created, level, fields = item
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+        return f"{stamp}.{int(created % 1 * 1000):03d} | {level: <8} | {json.dumps(fields, default=str)}\n"
+
+    def _run(self, stream: TextIO) -> None:
+        queue = self._queue
+        while True:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            while queue:
+                lines: list[str] = []
+                while queue and len(lines) < self._batch_size:
+                    lines.append(self._format(queue.popleft()))
+                try:
+                    stream.write("".join(lines))
+                    stream.flush()
+                except Exception:
+                    # nowhere left to report it
+                    self.dropped += len(lines)
+            if self._stopping:
+                return
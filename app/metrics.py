@@ -0,0 +1,265 @@
+from typing import Any, Iterator, Optional
+
+from .settings import Settings
+
+
+# Latencies are recorded in whole microseconds into log-linear buckets:
+# every power of two is split into 4 buckets, so a bucket is at most 25% wide.
+# A bucket holds the values above its lower bound up to and including its upper bound,
+# the way Prometheus le bounds count, so the exported bounds fall on bucket edges.
+_SUB_BITS = 2
+_SUB = 1 << _SUB_BITS
+# 2**36 us is about 19 hours, anything slower lands in the last bucket.
+_BUCKETS = (36 - _SUB_BITS + 1) * _SUB
+
+# Bounds of the exported Prometheus histogram, powers of two from 16 us to 33.5 s.
+_EXPORTED_BOUNDS = tuple(1 << exponent for exponent in range(4, 26))
+
+QUANTILES = (0.5, 0.99, 0.999)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _bucket(us: int) -> int:
+    """Index of the bucket holding a latency in microseconds"""
+    us -= 1
+    if us < _SUB:
+        return max(us, 0)
+    shift = us.bit_length() - _SUB_BITS - 1
+    return min(((shift + 1) << _SUB_BITS) + (us >> shift) - _SUB, _BUCKETS - 1)
+
+
+def _upper_bound(index: int) -> int:
+    """Inclusive upper bound of a bucket in microseconds"""
+    if index < _SUB:
+        return index + 1
+    shift = (index >> _SUB_BITS) - 1
+    return ((index & (_SUB - 1)) + _SUB + 1) << shift
+
+
+class Histogram:
+    """Latency histogram with log-linear buckets.
+
+    Recording a value is a bit_length() and a list increment, nothing is allocated.
+    Quantiles are reported as the upper bound of the bucket they fall into.
+    """
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self) -> None:
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0
+
+    def record(self, us: int) -> None:
+        self.counts[_bucket(us)] += 1
+        self.count += 1
+        self.total += us
+
+    def quantile(self, q: float) -> float:
+        """Latency in seconds below which a fraction q of the recorded values lie"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return _upper_bound(index) / 1e6
+        return _upper_bound(_BUCKETS - 1) / 1e6
+
+    def cumulative(self) -> Iterator[tuple[float, int]]:
+        """Cumulative counts at the exported bounds, in seconds"""
+        seen = 0
+        index = 0
+        for bound in _EXPORTED_BOUNDS:
+            end = _bucket(bound) + 1
+            seen += sum(self.counts[index:end])
+            index = end
+            yield bound / 1e6, seen
+
+
+class HotKeys:
+    """Top-k most requested keys estimated with a count-min sketch.
+
+    The sketch is four rows of width counters, a key increments one counter per row
+    and its count is estimated by the smallest of them, which never undercounts.
+    Candidates for the top-k are kept in a dict next to it, a key replaces the coldest
+    candidate once its estimate gets higher. All counters are halved every window
+    increments, so the estimates follow the recent traffic.
+
+    Only one of every sample_every requests is counted, estimates are scaled back up.
+    """
+
+    def __init__(self, k: int = 10, width: int = 2048, sample_every: int = 1, window: int = 1_000_000) -> None:
+        # every row takes its index from a separate 16 bit field of the 64 bit hash of a key
+        if width & (width - 1) or width > 1 << 16:
+            raise ValueError(f"width must be a power of two up to {1 << 16}, got {width}")
+        self.k = k
+        self.sample_every = max(1, sample_every)
+        self._mask = width - 1
+        self._rows = [[0] * width for _ in range(4)]
+        self._window = window
+        self._skipped = 0
+        self._increments = 0
+        self._top: dict[str, int] = {}
+        # lower bound of the smallest count among the candidates
+        self._floor = 0
+
+    def add(self, key: str) -> None:
+        if self.sample_every > 1:
+            self._skipped += 1
+            if self._skipped < self.sample_every:
+                return
+            self._skipped = 0
+
+        # NOTE: Indices come from the hash of the key, which str caches, there is no hashing per row.
+        h = hash(key)
+        mask = self._mask
+        first, second, third, fourth = self._rows
+        index = h & mask
+        estimate = first[index] = first[index] + 1
+        index = (h >> 16) & mask
+        count = second[index] = second[index] + 1
+        if count < estimate:
+            estimate = count
+        index = (h >> 32) & mask
+        count = third[index] = third[index] + 1
+        if count < estimate:
+            estimate = count
+        index = (h >> 48) & mask
+        count = fourth[index] = fourth[index] + 1
+        if count < estimate:
+            estimate = count
+
+        top = self._top
+        if key in top:
+            top[key] = estimate
+        elif len(top) < self.k:
+            top[key] = estimate
+            self._floor = min(top.values())
+        elif estimate > self._floor:
+            coldest = min(top, key=top.__getitem__)
+            if estimate > top[coldest]:
+                del top[coldest]
+                top[key] = estimate
+            self._floor = min(top.values())
+
+        self._increments += 1
+        if self._increments >= self._window:
+            self._decay()
+
+    def _decay(self) -> None:
+        self._increments = 0
+        for row in self._rows:
+            row[:] = [count >> 1 for count in row]
+        self._top = {key: count >> 1 for key, count in self._top.items() if count > 1}
+        self._floor = min(self._top.values(), default=0)
+
+    def top(self) -> list[tuple[str, int]]:
+        """Hottest keys with their estimated request counts, hottest first"""
+        return sorted(((key, count * self.sample_every) for key, count in self._top.items()), key=lambda item: item[1], reverse=True)
+
+
+class _RouteMetrics:
+    __slots__ = ("statuses", "latency")
+
+    def __init__(self) -> None:
+        self.statuses: dict[int, int] = {}
+        self.latency = Histogram()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Metrics:
+    """Request metrics of a worker, exported in the Prometheus text format.
+
+    Everything is recorded from the event loop thread, so no locks are taken.
+    With several workers every one of them keeps and reports its own metrics.
+    """
+
+    def __init__(self, hot_keys: int = 10, hot_key_sample_every: int = 1) -> None:
+        self._routes: dict[tuple[str, str], _RouteMetrics] = {}
+        self.hot_keys: Optional[HotKeys] = HotKeys(hot_keys, sample_every=hot_key_sample_every) if hot_keys > 0 else None
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "Metrics":
+        return cls(hot_keys=settings.metrics_hot_keys, hot_key_sample_every=settings.metrics_hot_key_sample_every)
+
+    def record(self, method: str, route: str, status: int, us: int) -> None:
+        metrics = self._routes.get((method, route))
+        if metrics is None:
+            metrics = self._routes[(method, route)] = _RouteMetrics()
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.latency.record(us)
+
+    def touch(self, key: str) -> None:
+        if self.hot_keys is not None:
+            self.hot_keys.add(key)
+
+    def render(self, storage: dict[str, Any], admission: Optional[dict[str, Any]] = None) -> str:
+        """Prometheus exposition of the request metrics and storage statistics, and admission control if it's enabled"""
+        lines: list[str] = []
+        routes = sorted(self._routes.items())
+
+        lines.append("# HELP http_requests_total Requests by route, method and status.")
+        lines.append("# TYPE http_requests_total counter")
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+        lines.append("# HELP http_request_duration_seconds Request latency by route and method.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for (method, route), metrics in routes:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            latency = metrics.latency
+            for bound, count in latency.cumulative():
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {latency.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {latency.total / 1e6:g}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {latency.count}")
+
+        lines.append("# HELP http_request_latency_seconds Request latency quantiles by route and method.")
+        lines.append("# TYPE http_request_latency_seconds summary")
+        for (method, route), metrics in routes:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            latency = metrics.latency
+            for q in QUANTILES:
+                lines.append(f'http_request_latency_seconds{{{labels},quantile="{q:g}"}} {latency.quantile(q):g}')
+            lines.append(f"http_request_latency_seconds_sum{{{labels}}} {latency.total / 1e6:g}")
+            lines.append(f"http_request_latency_seconds_count{{{labels}}} {latency.count}")
+
+        gauges = (
+            ("storage_keys", "gauge", "Keys in the storage.", storage["keys"]),
+            ("storage_bytes", "gauge", "Bytes used by the storage.", storage["bytes_used"]),
+            ("storage_max_bytes", "gauge", "Memory budget of the storage.", storage["max_bytes"]),
+            ("storage_expiring_keys", "gauge", "Keys with a TTL.", storage["expiring"]),
+            ("storage_evictions_total", "counter", "Keys evicted to stay within the memory budget.", storage["evictions"]),
+            ("storage_expired_total", "counter", "Keys removed once their TTL was over.", storage["expired"]),
+        )
+        for name, kind, description, value in gauges:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+
+        if admission is not None:
+            lines.append("# HELP http_requests_in_flight Requests being served by admission budget.")
+            lines.append("# TYPE http_requests_in_flight gauge")
+            for budget, budget_stats in admission.items():
+                lines.append(f'http_requests_in_flight{{budget="{budget}"}} {budget_stats["in_flight"]}')
+            lines.append("# HELP http_requests_rejected_total Requests rejected by admission control by budget and reason.")
+            lines.append("# TYPE http_requests_rejected_total counter")
+            for budget, budget_stats in admission.items():
+                for reason, count in budget_stats["rejected"].items():
+                    lines.append(f'http_requests_rejected_total{{budget="{budget}",reason="{reason}"}} {count}')
+
+        if self.hot_keys is not None:
+            lines.append("# HELP storage_hot_key_requests Estimated recent requests of the hottest keys.")
+            lines.append("# TYPE storage_hot_key_requests gauge")
+            for key, count in self.hot_keys.top():
+                lines.append(f'storage_hot_key_requests{{key="{_escape(key)}"}} {count}')
+
+        lines.append("")
+        return "\n".join(lines)
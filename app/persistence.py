@@ -0,0 +1,445 @@
+import asyncio
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from loguru import logger
+
+from .settings import Settings
+from .storage import StorageEngine, EntryTooLargeError, Value
+
+
+# Record layout: crc32 | op | key length | value length | key | value
+# crc32 covers everything following it, so a torn write at the tail of the log is detected on replay.
+_HEADER = struct.Struct("<IBII")
+_CRC = struct.Struct("<I")
+_FIELDS = struct.Struct("<BII")
+
+OP_PUT_BYTES = 1
+OP_PUT_STR = 2
+OP_DELETE = 3
+OP_CLEAR = 4
+# Puts of keys with a TTL, the value is preceded by the unix time at which the key expires.
+OP_PUT_BYTES_EXPIRING = 5
+OP_PUT_STR_EXPIRING = 6
+
+_EXPIRES = struct.Struct("<d")
+
+FSYNC_POLICIES = ("always", "batch", "never")
+
+# Size of the blocks read from disk during recovery.
+_READ_BLOCK = 1024 * 1024
+
+
+def encode_record(op: int, key: str = "", value: Value = b"") -> bytes:
+    """Encode a single log record"""
+    key_bytes = key.encode()
+    value_bytes = value.encode() if isinstance(value, str) else value
+    body = _FIELDS.pack(op, len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+    return _CRC.pack(zlib.crc32(body)) + body
+
+
+def encode_put(key: str, value: Value, expires_at: Optional[float] = None) -> bytes:
+    if expires_at is None:
+        return encode_record(OP_PUT_STR if isinstance(value, str) else OP_PUT_BYTES, key, value)
+    op = OP_PUT_STR_EXPIRING if isinstance(value, str) else OP_PUT_BYTES_EXPIRING
+    value_bytes = value.encode() if isinstance(value, str) else value
+    return encode_record(op, key, _EXPIRES.pack(expires_at) + value_bytes)
+
+
+def iter_records(path: Path) -> Iterator[tuple[int, int, str, Value]]:
+    """Yield (end offset, op, key, value) for every intact record of a file.
+
+    Iteration stops at the first incomplete or corrupted record.
+    """
+    with open(path, "rb") as f:
+        buffer = b""
+        base = 0  # file offset of buffer[0]
+        pos = 0
+        wanted = _READ_BLOCK
+        while True:
+            block = f.read(wanted)
+            if block:
+                buffer = buffer[pos:] + block
+                base += pos
+                pos = 0
+            wanted = _READ_BLOCK
+            while len(buffer) - pos >= _HEADER.size:
+                crc, op, key_len, value_len = _HEADER.unpack_from(buffer, pos)
+                end = pos + _HEADER.size + key_len + value_len
+                if end > len(buffer):
+                    # NOTE: Read the rest of a large record at once instead of block by block.
+                    wanted = max(_READ_BLOCK, end - len(buffer))
+                    break
+                if zlib.crc32(memoryview(buffer)[pos + _CRC.size:end]) != crc:
+                    return
+                key_start = pos + _HEADER.size
+                key = buffer[key_start:key_start + key_len].decode()
+                value: Value = buffer[key_start + key_len:end]
+                if op == OP_PUT_STR:
+                    value = value.decode()
+                pos = end
+                yield base + end, op, key, value
+            if not block:
+                return
+
+
+def decode_records(data: bytes | memoryview) -> Iterator[tuple[int, str, Value]]:
+    """Yield (op, key, value) for every record of a buffer holding complete records.
+
+    Raises ValueError if a record is incomplete or corrupted.
+    """
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        if len(view) - pos < _HEADER.size:
+            raise ValueError(f"incomplete log record at offset {pos}")
+        crc, op, key_len, value_len = _HEADER.unpack_from(view, pos)
+        end = pos + _HEADER.size + key_len + value_len
+        if end > len(view) or zlib.crc32(view[pos + _CRC.size:end]) != crc:
+            raise ValueError(f"corrupted log record at offset {pos}")
+        key_start = pos + _HEADER.size
+        key = str(view[key_start:key_start + key_len], "utf-8")
+        value: Value = bytes(view[key_start + key_len:end])
+        if op == OP_PUT_STR:
+            value = value.decode()
+        pos = end
+        yield op, key, value
+
+
+def apply_record(storage: StorageEngine, op: int, key: str, value: Value) -> None:
+    """Apply a replayed record to the storage"""
+    if op in (OP_PUT_BYTES, OP_PUT_STR):
+        try:
+            storage.put(key, value)
+        except EntryTooLargeError as ex:
+            logger.warning({"replay": "skipped", "key": key, "reason": str(ex)})
+    elif op in (OP_PUT_BYTES_EXPIRING, OP_PUT_STR_EXPIRING):
+        (expires_at, ) = _EXPIRES.unpack_from(value)
+        if expires_at <= time.time():
+            # NOTE: Expired while the server was down, it replaces any earlier value all the same.
+            try:
+                storage.pop(key)
+            except KeyError:
+                pass
+            return
+        value = value[_EXPIRES.size:]
+        try:
+            storage.put(key, value.decode() if op == OP_PUT_STR_EXPIRING else value, expires_at)
+        except EntryTooLargeError as ex:
+            logger.warning({"replay": "skipped", "key": key, "reason": str(ex)})
+    elif op == OP_DELETE:
+        try:
+            storage.pop(key)
+        except KeyError:
+            pass
+    elif op == OP_CLEAR:
+        storage.clear()
+    else:
+        raise ValueError(f"unknown log record op {op}")
+
+
+def _fsync_dir(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """Append-only log of storage mutations with group commit.
+
+    Appended records are buffered in memory and written out by a background task.
+    Depending on the fsync policy:
+        always - records are written and fsynced as soon as possible, append() waits for it.
+            Appends arriving while an fsync is in progress are committed together with the next one.
+        batch  - records are collected for up to batch_interval seconds or batch_bytes bytes,
+            then written with a single fsync, append() waits for it.
+        never  - records are written on the same window without fsync, append() returns immediately.
+    """
+
+    def __init__(self, directory: Path, segment_id: int, fsync_policy: str = "batch", batch_interval: float = 0.005, batch_bytes: int = 1024 * 1024) -> None:
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy {fsync_policy}, expected one of {FSYNC_POLICIES}")
+
+        self._directory = directory
+        self._fsync_policy = fsync_policy
+        self._batch_interval = batch_interval
+        self._batch_bytes = batch_bytes
+
+        self.segment_id = segment_id
+        self._file: BinaryIO = open(self.segment_path(directory, segment_id), "ab")
+        self.segment_bytes = self._file.tell()
+
+        self._buffer = bytearray()
+        self._waiters: list[asyncio.Future[None]] = []
+        self._pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._io_lock = asyncio.Lock()
+        self._closing = False
+        self._task: Optional[asyncio.Task[None]] = None
+
+        # counters
+        self.records = 0
+        self.commits = 0
+
+    @staticmethod
+    def segment_path(directory: Path, segment_id: int) -> Path:
+        return directory / f"wal-{segment_id:08d}.log"
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def append(self, record: bytes) -> None:
+        """Append record to the log, waits until it's durable unless the policy is never"""
+        if self._closing:
+            raise RuntimeError("write-ahead log is closed")
+
+        self._buffer += record
+        self.records += 1
+        self._pending.set()
+        if len(self._buffer) >= self._batch_bytes:
+            self._full.set()
+
+        if self._fsync_policy == "never":
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+    async def _run(self) -> None:
+        while True:
+            await self._pending.wait()
+            if self._fsync_policy != "always" and not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self._batch_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._pending.clear()
+            self._full.clear()
+            await self.flush()
+            if self._closing:
+                return
+
+    def _write(self, data: bytes, fsync: bool) -> None:
+        self._file.write(data)
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+
+    async def flush(self) -> None:
+        """Write buffered records to the current segment"""
+        async with self._io_lock:
+            if not self._buffer:
+                return
+
+            data, waiters = bytes(self._buffer), self._waiters
+            self._buffer, self._waiters = bytearray(), []
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, data, self._fsync_policy != "never")
+            except Exception as ex:
+                logger.error({"wal": "write failed", "segment": self.segment_id, "error": str(ex)})
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(ex)
+                return
+
+            self.segment_bytes += len(data)
+            self.commits += 1
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def rotate(self) -> int:
+        """Flush and switch to a new segment, returns id of the new segment"""
+        await self.flush()
+        async with self._io_lock:
+            self._file.close()
+            self.segment_id += 1
+            self._file = open(self.segment_path(self._directory, self.segment_id), "ab")
+            self.segment_bytes = 0
+            await asyncio.get_running_loop().run_in_executor(None, _fsync_dir, self._directory)
+        return self.segment_id
+
+    async def close(self) -> None:
+        self._closing = True
+        self._pending.set()
+        self._full.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+        self._file.close()
+
+
+class Persistence:
+    """Durability for the storage: write-ahead log plus periodic compact snapshots.
+
+    Data directory layout:
+        wal-<id>.log       - log segments
+        snapshot-<id>.snap - state of the storage, to be followed by segments starting at <id>
+
+    Snapshots are taken while requests are served, so they are fuzzy:
+    the log is rotated first and every record of the new segment is replayed on top of the snapshot.
+    Records are idempotent, so replaying a mutation already captured in the snapshot is harmless.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        fsync_policy: str = "batch",
+        batch_interval: float = 0.005,
+        batch_bytes: int = 1024 * 1024,
+        snapshot_interval: float = 60.0,
+        snapshot_min_wal_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        self._directory = Path(directory)
+        self._fsync_policy = fsync_policy
+        self._batch_interval = batch_interval
+        self._batch_bytes = batch_bytes
+        self._snapshot_interval = snapshot_interval
+        self._snapshot_min_wal_bytes = snapshot_min_wal_bytes
+
+        self._storage: Optional[StorageEngine] = None
+        self._wal: Optional[WriteAheadLog] = None
+        self._snapshot_task: Optional[asyncio.Task[None]] = None
+        self._snapshot_lock = asyncio.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["Persistence"]:
+        """Create persistence if a data directory is configured"""
+        if not settings.persistence_dir:
+            return None
+        return cls(
+            settings.persistence_dir,
+            fsync_policy=settings.wal_fsync_policy,
+            batch_interval=settings.wal_batch_ms / 1000,
+            batch_bytes=settings.wal_batch_bytes,
+            snapshot_interval=settings.snapshot_interval,
+            snapshot_min_wal_bytes=settings.snapshot_min_wal_bytes,
+        )
+
+    def _segments(self) -> list[int]:
+        return sorted(int(p.stem.split("-")[1]) for p in self._directory.glob("wal-*.log"))
+
+    def _snapshots(self) -> list[int]:
+        return sorted(int(p.stem.split("-")[1]) for p in self._directory.glob("snapshot-*.snap"))
+
+    def _snapshot_path(self, snapshot_id: int) -> Path:
+        return self._directory / f"snapshot-{snapshot_id:08d}.snap"
+
+    def recover(self, storage: StorageEngine) -> int:
+        """Load the latest snapshot and replay the log tail, returns id of the segment to continue with"""
+        snapshots = self._snapshots()
+        first_segment = 0
+        if snapshots:
+            first_segment = snapshots[-1]
+            for _, op, key, value in iter_records(self._snapshot_path(first_segment)):
+                apply_record(storage, op, key, value)
+
+        segments = [s for s in self._segments() if s >= first_segment]
+        for segment_id in segments:
+            path = WriteAheadLog.segment_path(self._directory, segment_id)
+            valid_end = 0
+            for valid_end, op, key, value in iter_records(path):
+                apply_record(storage, op, key, value)
+            if valid_end != path.stat().st_size:
+                # NOTE: Only the tail of the last segment can be torn by a crash,
+                # cut it off so new records aren't appended after garbage.
+                logger.warning({"wal": "truncating torn tail", "segment": segment_id, "offset": valid_end})
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+
+        return segments[-1] if segments else max(first_segment, 1)
+
+    async def open(self, storage: StorageEngine) -> None:
+        """Recover the storage from disk and start logging mutations"""
+        self._directory.mkdir(parents=True, exist_ok=True)
+        for tmp in self._directory.glob("*.tmp"):
+            tmp.unlink()
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        segment_id = await loop.run_in_executor(None, self.recover, storage)
+        logger.info({"recovered_keys": len(storage), "seconds": round(loop.time() - started, 3)})
+
+        self._storage = storage
+        self._wal = WriteAheadLog(self._directory, segment_id, self._fsync_policy, self._batch_interval, self._batch_bytes)
+        self._wal.start()
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def close(self) -> None:
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+        if self._wal is not None:
+            await self._wal.close()
+
+    async def log_put(self, key: str, value: Value, expires_at: Optional[float] = None) -> None:
+        await self._wal.append(encode_put(key, value, expires_at))
+
+    async def log_put_many(self, items: list[tuple[str, Value]], expires_at: Optional[float] = None) -> None:
+        """Log several puts, committed together"""
+        if items:
+            await self._wal.append(b"".join(encode_put(key, value, expires_at) for key, value in items))
+
+    async def log_delete(self, key: str) -> None:
+        await self._wal.append(encode_record(OP_DELETE, key))
+
+    async def log_delete_many(self, keys: list[str]) -> None:
+        """Log several deletes, committed together"""
+        if keys:
+            await self._wal.append(b"".join(encode_record(OP_DELETE, key) for key in keys))
+
+    async def log_clear(self) -> None:
+        await self._wal.append(encode_record(OP_CLEAR))
+
+    async def log_records(self, data: bytes) -> None:
+        """Log records encoded elsewhere, e.g. received from a replication leader"""
+        if data:
+            await self._wal.append(data)
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._snapshot_interval)
+            if self._wal.segment_bytes >= self._snapshot_min_wal_bytes:
+                try:
+                    await self.snapshot()
+                except Exception as ex:
+                    logger.error({"snapshot": "failed", "error": str(ex)})
+
+    async def snapshot(self, chunk_keys: int = 1000) -> None:
+        """Write a compact snapshot of the storage and drop log segments it covers"""
+        async with self._snapshot_lock:
+            loop = asyncio.get_running_loop()
+            snapshot_id = await self._wal.rotate()
+            path = self._snapshot_path(snapshot_id)
+            tmp_path = path.with_suffix(".tmp")
+
+            with open(tmp_path, "wb") as f:
+                cursor: Optional[int] = 0
+                while cursor is not None:
+                    # NOTE: Entries are collected on the event loop, only disk I/O is offloaded,
+                    # requests keep being served between chunks.
+                    cursor, items = self._storage.scan(cursor, chunk_keys)
+                    data = b"".join(encode_put(key, value, self._storage.expires_at(key)) for key, value in items)
+                    await loop.run_in_executor(None, f.write, data)
+                await loop.run_in_executor(None, os.fsync, f.fileno())
+
+            os.replace(tmp_path, path)
+            await loop.run_in_executor(None, _fsync_dir, self._directory)
+
+            for old in self._snapshots():
+                if old < snapshot_id:
+                    self._snapshot_path(old).unlink()
+            for old in self._segments():
+                if old < snapshot_id:
+                    WriteAheadLog.segment_path(self._directory, old).unlink()
+            logger.info({"snapshot": snapshot_id, "keys": len(self._storage)})
@@ -0,0 +1,93 @@
+import os
+from typing import Optional
+
+
+# Range requests of stored values, only the bytes unit is supported. Ranges are (start, stop) pairs
+# with stop exclusive, the way values are sliced, and converted to the inclusive form of the headers.
+
+# Requests listing more ranges than this are answered with the whole value, a client asking for
+# many tiny parts would otherwise make the response much larger than the value itself.
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlaps the value"""
+
+
+def _digits(text: str) -> bool:
+    return text.isascii() and text.isdigit()
+
+
+def parse(header: str, length: int) -> Optional[list[tuple[int, int]]]:
+    """Ranges of a Range header within a value of length bytes, sorted with overlapping ones merged.
+
+    None if the header is malformed or uses another unit, it's ignored then and the whole value is sent.
+    Raises RangeNotSatisfiable if no range overlaps the value.
+    """
+    unit, sep, specs = header.partition("=")
+    if not sep or unit.strip().lower() != "bytes":
+        return None
+    items = [item.strip() for item in specs.split(",") if item.strip()]
+    if not items or len(items) > MAX_RANGES:
+        return None
+
+    selected: list[tuple[int, int]] = []
+    for item in items:
+        first, dash, last = item.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash:
+            return None
+        if not first:
+            # suffix range, the last bytes of the value
+            if not _digits(last):
+                return None
+            if int(last):
+                selected.append((max(0, length - int(last)), length))
+            continue
+        if not _digits(first) or (last and not _digits(last)):
+            return None
+        start = int(first)
+        stop = int(last) + 1 if last else length
+        if last and stop <= start:
+            return None
+        if start < length:
+            selected.append((start, min(stop, length)))
+
+    if not selected:
+        raise RangeNotSatisfiable(f"no range of {header} is within {length} bytes")
+    selected.sort()
+    merged = [selected[0]]
+    for start, stop in selected[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def if_range(header: str, current: str) -> bool:
+    """Check whether the ranges of a request still apply given the ETag of the value.
+
+    Only strong tags match, values have no modification time so an If-Range date never does.
+    """
+    return header.strip() == current and current.startswith('"')
+
+
+def content_range(start: int, stop: int, length: int) -> str:
+    """Value of the Content-Range header of a part"""
+    return f"bytes {start}-{stop - 1}/{length}"
+
+
+def multipart(value: bytes | memoryview, ranges: list[tuple[int, int]], content_type: Optional[bytes] = None) -> tuple[bytes, list[bytes | memoryview]]:
+    """Content-type and parts of a multipart/byteranges body, the ranges aren't copied out of value"""
+    boundary = os.urandom(12).hex()
+    view = memoryview(value)
+    length = len(view)
+    part_type = b"content-type: " + content_type + b"\r\n" if content_type is not None else b""
+    parts: list[bytes | memoryview] = []
+    for start, stop in ranges:
+        head = f"\r\n--{boundary}\r\n".encode() + part_type + f"content-range: {content_range(start, stop, length)}\r\n\r\n".encode()
+        parts.append(head)
+        parts.append(view[start:stop])
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return f"multipart/byteranges; boundary={boundary}".encode(), parts
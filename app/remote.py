@@ -0,0 +1,506 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import struct
+import tempfile
+from typing import TYPE_CHECKING, Any, Optional
+
+from loguru import logger
+
+from .settings import Settings
+from .storage import StorageEngine, EntryTooLargeError, Value
+from .persistence import Persistence
+from .compression import Compressor, LZ4_ENCODING
+from .store import LocalStore, Lookup, PreconditionFailed
+from . import batch, etag, watch
+
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+    from .body import SpooledBody
+    from .watch import WatchHub
+
+
+# Protocol between workers and the storage owner, spoken over a Unix socket.
+# Every frame is a fixed header followed by a payload, requests are pipelined
+# and responses may come back out of order, they are matched by request id.
+#   request:  request id | op     | payload length
+#   response: request id | status | payload length
+# Payloads of batch operations use the batch module framing, single key operations
+# start with an If-Match/If-None-Match condition, empty if there is none.
+# A worker sending OP_WATCH gets every change as an unsolicited frame with STATUS_EVENT:
+#   event: kind | flags | entity tag | key and value in batch framing
+_FRAME = struct.Struct(">IBI")
+_SCAN = struct.Struct(">QI")
+# count and flags of a range scan, followed by start, end and after keys in batch framing
+_RANGE = struct.Struct(">IB")
+# length of the key a range scan continues after, -1 once the range is exhausted
+_AFTER = struct.Struct(">i")
+_CURSOR = struct.Struct(">q")
+_CONDITION = struct.Struct(">H")
+_ETAG = struct.Struct(">Q")
+# time to live in seconds, 0 for values that don't expire
+_TTL = struct.Struct(">d")
+_EVENT = struct.Struct(">BBQ")
+# largest value a worker wants with events
+_WATCH = struct.Struct(">Q")
+
+OP_GET = 1
+OP_MGET = 2
+OP_MSET = 3
+OP_MSET_STR = 4
+OP_MDEL = 5
+OP_CLEAR = 6
+OP_SCAN = 7
+OP_STATS = 8
+OP_PUT = 9
+OP_PUT_STR = 10
+OP_DELETE = 11
+OP_WATCH = 12
+OP_RANGE = 13
+
+_READ_OPS = frozenset((OP_GET, OP_MGET, OP_SCAN, OP_RANGE, OP_STATS))
+
+STATUS_OK = 0
+STATUS_TOO_LARGE = 1
+STATUS_ERROR = 2
+STATUS_PRECONDITION_FAILED = 3
+STATUS_EVENT = 4
+
+# Flags leading a GET response payload, followed by the entity tag and the value.
+_FLAG_FOUND = 1
+_FLAG_STR = 2
+_FLAG_LZ4 = 4
+_FLAG_NOT_MODIFIED = 8
+# bounds given with a range scan
+_FLAG_END = 1
+_FLAG_AFTER = 2
+
+_EVENT_KINDS = (watch.PUT, watch.DELETE, watch.EXPIRE, watch.CLEAR)
+_EVENT_TAG = 1
+_EVENT_VALUE = 2
+_EVENT_STR = 4
+
+# Worker side write buffer above which requests wait for the socket to drain.
+_HIGH_WATER = 4 * 1024 * 1024
+# Owner side write buffer of a worker above which events for it are dropped.
+_EVENT_HIGH_WATER = 64 * 1024 * 1024
+# Seconds a worker waits before reconnecting to the storage owner, doubled after every failure.
+_RECONNECT_DELAY = 0.05
+_RECONNECT_MAX_DELAY = 5.0
+
+
+class RemoteStoreError(Exception):
+    """Raised when the storage owner fails to execute a request"""
+
+
+class StorageUnavailable(RemoteStoreError):
+    """Raised when the worker isn't connected to the storage owner"""
+
+
+def _encode(value: Value) -> bytes | memoryview:
+    return value.encode() if isinstance(value, str) else value
+
+
+def _pack_condition(condition: Optional[frozenset[str]]) -> bytes:
+    data = ", ".join(sorted(condition)).encode() if condition is not None else b""
+    return _CONDITION.pack(len(data)) + data
+
+
+def _pack_event(kind: str, key: str, tag: Optional[int], value: Optional[Value]) -> bytes:
+    flags = (_EVENT_TAG if tag is not None else 0) | (_EVENT_VALUE if value is not None else 0) | (_EVENT_STR if isinstance(value, str) else 0)
+    body = _EVENT.pack(_EVENT_KINDS.index(kind), flags, tag or 0) + batch.encode_items([(key, _encode(value) if value is not None else b"")])
+    return _FRAME.pack(0, STATUS_EVENT, len(body)) + body
+
+
+def _unpack_event(payload: bytes) -> tuple[str, str, Optional[int], Optional[Value]]:
+    kind, flags, tag = _EVENT.unpack_from(payload)
+    [(key, value)] = batch.decode_items(memoryview(payload)[_EVENT.size:])
+    if not flags & _EVENT_VALUE:
+        decoded: Optional[Value] = None
+    else:
+        decoded = str(value, "utf-8") if flags & _EVENT_STR else bytes(value)
+    return _EVENT_KINDS[kind], key, (tag if flags & _EVENT_TAG else None), decoded
+
+
+def _unpack_condition(payload: bytes) -> tuple[Optional[frozenset[str]], memoryview]:
+    """Split a payload into its condition and the rest"""
+    (length, ) = _CONDITION.unpack_from(payload)
+    end = _CONDITION.size + length
+    condition = etag.parse(str(payload[_CONDITION.size:end], "utf-8")) if length else None
+    return condition, memoryview(payload)[end:]
+
+
+class StorageOwner:
+    """Process owning the storage shared by several workers.
+
+    Each worker keeps a single connection and pipelines requests over it.
+    Frames are parsed in bulk as they arrive and responses to reads are written
+    with a single call per received chunk, so the cost of a syscall is shared by
+    all requests in flight. Mutations waiting for the write-ahead log run as tasks,
+    they don't hold up requests queued behind them.
+
+    Changes are forwarded to the workers watching them, every worker fans them out
+    to its own WebSocket subscribers.
+    """
+
+    def __init__(self, store: LocalStore, path: str) -> None:
+        self._store = store
+        self._path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: set[asyncio.Task[None]] = set()
+        # connections of watching workers with the largest value they want with events
+        self._watchers: dict[asyncio.StreamWriter, int] = {}
+        self.dropped_events = 0
+        store.changes = self
+
+    def publish(self, kind: str, key: str = "", tag: Optional[int] = None, value: Optional[Value] = None) -> None:
+        """Forward a change to the watching workers, without waiting for them"""
+        if not self._watchers:
+            return
+        frames: dict[bool, bytes] = {}
+        for writer, max_value_bytes in list(self._watchers.items()):
+            if writer.is_closing():
+                del self._watchers[writer]
+                continue
+            if writer.transport.get_write_buffer_size() > _EVENT_HIGH_WATER:
+                self.dropped_events += 1
+                continue
+            with_value = value is not None and len(value) <= max_value_bytes
+            if (frame := frames.get(with_value)) is None:
+                frame = frames[with_value] = _pack_event(kind, key, tag, value if with_value else None)
+            writer.write(frame)
+
+    async def start(self) -> None:
+        await self._store.open()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._server = await asyncio.start_unix_server(self._serve, self._path)
+        logger.info({"storage_owner": "listening", "path": self._path})
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._store.close()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        buffer = bytearray()
+        try:
+            while data := await reader.read(256 * 1024):
+                buffer += data
+                responses: list[bytes] = []
+                pos = 0
+                while len(buffer) - pos >= _FRAME.size:
+                    request_id, op, length = _FRAME.unpack_from(buffer, pos)
+                    end = pos + _FRAME.size + length
+                    if end > len(buffer):
+                        break
+                    payload = bytes(memoryview(buffer)[pos + _FRAME.size:end])
+                    pos = end
+                    if op == OP_WATCH:
+                        (self._watchers[writer], ) = _WATCH.unpack(payload)
+                        responses.append(_FRAME.pack(request_id, STATUS_OK, 0))
+                    elif op in _READ_OPS or not self._store.durable:
+                        # NOTE: Nothing to wait for, executed right away in arrival order.
+                        responses.append(await self._execute(request_id, op, payload))
+                    else:
+                        task = asyncio.create_task(self._execute_later(request_id, op, payload, writer))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+                del buffer[:pos]
+                if responses:
+                    writer.write(b"".join(responses))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._watchers.pop(writer, None)
+            writer.close()
+
+    async def _execute_later(self, request_id: int, op: int, payload: bytes, writer: asyncio.StreamWriter) -> None:
+        response = await self._execute(request_id, op, payload)
+        if not writer.is_closing():
+            writer.write(response)
+
+    async def _execute(self, request_id: int, op: int, payload: bytes) -> bytes:
+        try:
+            status, body = STATUS_OK, await self._dispatch(op, payload)
+        except EntryTooLargeError as ex:
+            status, body = STATUS_TOO_LARGE, str(ex).encode()
+        except PreconditionFailed as ex:
+            status, body = STATUS_PRECONDITION_FAILED, str(ex).encode()
+        except Exception as ex:
+            logger.exception({"storage_owner": "request failed", "op": op})
+            status, body = STATUS_ERROR, str(ex).encode()
+        return _FRAME.pack(request_id, status, len(body)) + body
+
+    async def _dispatch(self, op: int, payload: bytes) -> bytes | memoryview:
+        store = self._store
+        if op == OP_GET:
+            condition, key = _unpack_condition(payload)
+            lookup = await store.get(str(key, "utf-8"), if_none_match=condition)
+            if lookup.etag is None:
+                return b"\x00"
+            if not lookup.modified:
+                return bytes((_FLAG_NOT_MODIFIED, )) + _ETAG.pack(lookup.etag)
+            value = lookup.value
+            flags = _FLAG_FOUND | (_FLAG_STR if isinstance(value, str) else 0) | (_FLAG_LZ4 if lookup.encoding == LZ4_ENCODING else 0)
+            return bytes((flags, )) + _ETAG.pack(lookup.etag) + _encode(value)
+        if op in (OP_PUT, OP_PUT_STR):
+            condition, rest = _unpack_condition(payload)
+            (ttl, ) = _TTL.unpack_from(rest)
+            [(key, value)] = batch.decode_items(rest[_TTL.size:])
+            tag = await store.put(key, str(value, "utf-8") if op == OP_PUT_STR else value, condition, ttl or None)
+            return _ETAG.pack(tag)
+        if op == OP_DELETE:
+            condition, key = _unpack_condition(payload)
+            return bytes((await store.delete(str(key, "utf-8"), condition), ))
+        if op == OP_MGET:
+            values = await store.get_many(batch.decode_keys(payload))
+            return batch.encode_values([None if v is None else _encode(v) for v in values])
+        if op == OP_MSET:
+            (ttl, ) = _TTL.unpack_from(payload)
+            await store.put_many(batch.decode_items(memoryview(payload)[_TTL.size:]), ttl or None)
+            return b""
+        if op == OP_MSET_STR:
+            (ttl, ) = _TTL.unpack_from(payload)
+            await store.put_many([(key, str(value, "utf-8")) for key, value in batch.decode_items(memoryview(payload)[_TTL.size:])], ttl or None)
+            return b""
+        if op == OP_MDEL:
+            return bytes(await store.delete_many(batch.decode_keys(payload)))
+        if op == OP_CLEAR:
+            await store.clear()
+            return b""
+        if op == OP_SCAN:
+            cursor, count = _SCAN.unpack(payload)
+            next_cursor, items = await store.scan(cursor, count)
+            return _CURSOR.pack(-1 if next_cursor is None else next_cursor) + batch.encode_items([(k, _encode(v)) for k, v in items])
+        if op == OP_RANGE:
+            count, flags = _RANGE.unpack_from(payload)
+            start, end, after = batch.decode_keys(payload[_RANGE.size:])
+            next_key, items = await store.range_scan(start, end if flags & _FLAG_END else None, after if flags & _FLAG_AFTER else None, count)
+            encoded_next = next_key.encode() if next_key is not None else b""
+            return _AFTER.pack(-1 if next_key is None else len(encoded_next)) + encoded_next + batch.encode_items([(k, _encode(v)) for k, v in items])
+        if op == OP_STATS:
+            return json.dumps(await store.stats()).encode()
+        raise RemoteStoreError(f"unknown op {op}")
+
+
+class RemoteStore:
+    """Store of a worker, requests are forwarded to the storage owner process.
+
+    Implements the same interface as store.LocalStore. Values are copied over the socket,
+    so the pathsend shortcut for cold values isn't available to workers, and compressed
+    values are decompressed by the worker rather than the owner.
+
+    With changes set, changes made by any worker are published to it.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self.changes: Optional["WatchHub"] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task[None]] = None
+        self._pending: dict[int, asyncio.Future[tuple[int, bytes]]] = {}
+        self._next_id = 0
+        self._closed = False
+        self._reconnect_lock = asyncio.Lock()
+        self._reconnect_at = 0.0
+        self._reconnect_delay = _RECONNECT_DELAY
+        # NOTE: Created by the first compressed value, workers of an owner without compression never load lz4.
+        self._compressor: Optional[Compressor] = None
+
+    async def open(self) -> None:
+        self._closed = False
+        self._reader, self._writer = await asyncio.open_unix_connection(self._path)
+        self._reader_task = asyncio.create_task(self._read_responses())
+        if self.changes is not None:
+            await self._call(OP_WATCH, _WATCH.pack(self.changes.max_value_bytes))
+
+    async def _reconnect(self) -> None:
+        # NOTE: Requests fail right away while the owner is away, one of them tries to reconnect
+        # once the delay is over and the delay grows with every failed attempt.
+        async with self._reconnect_lock:
+            if self._writer is not None:
+                return
+            loop = asyncio.get_running_loop()
+            if self._closed or loop.time() < self._reconnect_at:
+                raise StorageUnavailable("not connected to the storage owner")
+            try:
+                await self.open()
+            except (OSError, RemoteStoreError) as ex:
+                self._reconnect_at = loop.time() + self._reconnect_delay
+                self._reconnect_delay = min(self._reconnect_delay * 2, _RECONNECT_MAX_DELAY)
+                logger.warning({"storage_owner": "reconnect failed", "path": self._path, "error": str(ex)})
+                raise StorageUnavailable(f"not connected to the storage owner: {ex}") from ex
+            self._reconnect_delay = _RECONNECT_DELAY
+            logger.info({"storage_owner": "reconnected", "path": self._path})
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
+    async def _read_responses(self) -> None:
+        reader = self._reader
+        error: Exception = ConnectionError("storage owner closed the connection")
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME.size)
+                request_id, status, length = _FRAME.unpack(header)
+                payload = await reader.readexactly(length) if length else b""
+                if status == STATUS_EVENT:
+                    if self.changes is not None:
+                        self.changes.publish(*_unpack_event(payload))
+                    continue
+                if (future := self._pending.pop(request_id, None)) is not None and not future.done():
+                    future.set_result((status, payload))
+        except asyncio.IncompleteReadError:
+            pass
+        except ConnectionError as ex:
+            error = ex
+        finally:
+            # NOTE: The connection is dropped, so later requests reconnect instead of waiting for
+            # responses which will never come.
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if not self._closed:
+                logger.error({"storage_owner": "connection lost", "path": self._path, "error": str(error)})
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(StorageUnavailable(str(error)))
+            self._pending.clear()
+
+    async def _call(self, op: int, payload: bytes | memoryview = b"") -> bytes:
+        if self._writer is None:
+            await self._reconnect()
+
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(_FRAME.pack(request_id, op, len(payload)))
+        self._writer.write(payload)
+        if self._writer.transport.get_write_buffer_size() > _HIGH_WATER:
+            await self._writer.drain()
+
+        status, body = await future
+        if status == STATUS_TOO_LARGE:
+            raise EntryTooLargeError(body.decode())
+        if status == STATUS_PRECONDITION_FAILED:
+            raise PreconditionFailed(body.decode())
+        if status != STATUS_OK:
+            raise RemoteStoreError(body.decode())
+        return body
+
+    async def get(self, key: str, with_path: bool = False, if_none_match: Optional[frozenset[str]] = None) -> Lookup:
+        body = await self._call(OP_GET, _pack_condition(if_none_match) + key.encode())
+        flags = body[0]
+        if flags & _FLAG_NOT_MODIFIED:
+            return Lookup(None, etag=_ETAG.unpack_from(body, 1)[0], modified=False)
+        if not flags & _FLAG_FOUND:
+            return Lookup(None)
+        (tag, ) = _ETAG.unpack_from(body, 1)
+        start = 1 + _ETAG.size
+        value: Value = body[start:].decode() if flags & _FLAG_STR else body[start:]
+        return Lookup(value, LZ4_ENCODING if flags & _FLAG_LZ4 else None, etag=tag)
+
+    def decode(self, value: Value, encoding: Optional[str]) -> Value:
+        if encoding is None:
+            return value
+        if self._compressor is None:
+            self._compressor = Compressor()
+        return self._compressor.decompress(value)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[Value]]:
+        return batch.decode_values(await self._call(OP_MGET, batch.encode_keys(keys)))
+
+    async def put(self, key: str, value: Value, if_match: Optional[frozenset[str]] = None, ttl: Optional[float] = None) -> int:
+        op = OP_PUT_STR if isinstance(value, str) else OP_PUT
+        body = await self._call(op, _pack_condition(if_match) + _TTL.pack(ttl or 0) + batch.encode_items([(key, _encode(value))]))
+        return _ETAG.unpack(body)[0]
+
+    async def put_file(self, key: str, body: "SpooledBody", if_match: Optional[frozenset[str]] = None, ttl: Optional[float] = None) -> int:
+        return await self.put(key, body.read(), if_match, ttl)
+
+    async def put_many(self, items: list[tuple[str, Value]], ttl: Optional[float] = None) -> None:
+        # NOTE: Values keep their type, str values put from a query string are sent as a separate batch.
+        strings = [(key, value.encode()) for key, value in items if isinstance(value, str)]
+        binary = [(key, value) for key, value in items if not isinstance(value, str)]
+        if binary:
+            await self._call(OP_MSET, _TTL.pack(ttl or 0) + batch.encode_items(binary))
+        if strings:
+            await self._call(OP_MSET_STR, _TTL.pack(ttl or 0) + batch.encode_items(strings))
+
+    async def delete(self, key: str, if_match: Optional[frozenset[str]] = None) -> bool:
+        return bool((await self._call(OP_DELETE, _pack_condition(if_match) + key.encode()))[0])
+
+    async def delete_many(self, keys: list[str]) -> list[bool]:
+        return [bool(flag) for flag in await self._call(OP_MDEL, batch.encode_keys(keys))]
+
+    async def clear(self) -> None:
+        await self._call(OP_CLEAR)
+
+    async def scan(self, cursor: int, count: int) -> tuple[Optional[int], list[tuple[str, Value]]]:
+        body = await self._call(OP_SCAN, _SCAN.pack(cursor, count))
+        (next_cursor, ) = _CURSOR.unpack_from(body)
+        items = [(key, bytes(value)) for key, value in batch.decode_items(body[_CURSOR.size:])]
+        return (None if next_cursor < 0 else next_cursor), items
+
+    async def range_scan(self, start: str = "", end: Optional[str] = None, after: Optional[str] = None, count: int = 1000) -> tuple[Optional[str], list[tuple[str, Value]]]:
+        flags = (_FLAG_END if end is not None else 0) | (_FLAG_AFTER if after is not None else 0)
+        body = await self._call(OP_RANGE, _RANGE.pack(count, flags) + batch.encode_keys([start, end or "", after or ""]))
+        (length, ) = _AFTER.unpack_from(body)
+        pos = _AFTER.size + max(length, 0)
+        next_key = body[_AFTER.size:pos].decode() if length >= 0 else None
+        items = [(key, bytes(value)) for key, value in batch.decode_items(body[pos:])]
+        return next_key, items
+
+    async def stats(self) -> dict[str, Any]:
+        return json.loads(await self._call(OP_STATS))
+
+
+def _run_owner(settings: Settings, path: str, ready: Any) -> None:
+    """Entry point of the storage owner process"""
+    async def run() -> None:
+        owner = StorageOwner(LocalStore(StorageEngine.from_settings(settings), Persistence.from_settings(settings)), path)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await owner.start()
+        ready.set()
+        await stop.wait()
+        await owner.close()
+
+    asyncio.run(run())
+
+
+def start_owner(settings: Settings, path: Optional[str] = None) -> tuple["BaseProcess", str]:
+    """Start the storage owner in a child process, returns once it accepts connections"""
+    path = path or os.path.join(tempfile.mkdtemp(prefix="kv-"), "storage.sock")
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    process = context.Process(target=_run_owner, args=(settings, path, ready), name="storage-owner", daemon=True)
+    process.start()
+    while not ready.wait(0.1):
+        if not process.is_alive():
+            raise RuntimeError(f"storage owner exited with code {process.exitcode}")
+    return process, path
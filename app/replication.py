@@ -0,0 +1,273 @@
+import asyncio
+import os
+import struct
+import time
+from collections import deque
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, Protocol
+
+from loguru import logger
+
+from .settings import Settings
+from .storage import StorageEngine, Value
+from .persistence import OP_DELETE, OP_CLEAR, encode_put, encode_record
+
+
+if TYPE_CHECKING:
+    from .store import LocalStore
+
+
+# Leader-follower replication. The leader keeps recent mutations in memory as write-ahead log
+# records, every batch under a sequence number, and streams them to followers over a long-lived
+# HTTP response. Followers apply them in order and remember the last sequence number applied,
+# on reconnect they continue from there. A follower which is new, fell behind the records the
+# leader still holds, or follows a restarted leader (another epoch) gets a snapshot first.
+#
+# Stream frames: kind | sequence number | leader unix time | payload length | payload
+#   RECORDS         log records of one or more batches, seq of the last of them
+#   SNAPSHOT        the follower drops its data, a snapshot as of seq follows
+#   SNAPSHOT_DATA   put records of the snapshot
+#   SNAPSHOT_END    the snapshot is complete, records after seq follow
+#   HEARTBEAT       nothing changed, seq is the latest sequence number of the leader
+_FRAME = struct.Struct(">BQdI")
+
+RECORDS = 1
+SNAPSHOT = 2
+SNAPSHOT_DATA = 3
+SNAPSHOT_END = 4
+HEARTBEAT = 5
+
+LEADER = "leader"
+FOLLOWER = "follower"
+
+EPOCH_HEADER = "x-replication-epoch"
+CONTENT_TYPE = "application/x-kv-replication"
+
+# Upper bound of records sent in a single frame.
+_FRAME_BYTES = 1024 * 1024
+
+
+class ReplicationError(Exception):
+    """Raised when the stream of a leader can't be followed"""
+
+
+def encode_frame(kind: int, seq: int, at: float = 0.0, payload: bytes = b"") -> bytes:
+    return _FRAME.pack(kind, seq, at, len(payload)) + payload
+
+
+class FrameReader(Protocol):
+    async def readexactly(self, n: int) -> bytes:
+        ...
+
+
+class ReplicationLog:
+    """Mutations of the leader in order, the most recent ones up to max_bytes are kept for followers.
+
+    Its methods mirror the logging methods of Persistence, the store calls both the same way.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        # NOTE: Sequence numbers start over with every leader process, followers tell them apart by the epoch.
+        self.epoch = os.urandom(8).hex()
+        self.seq = 0
+        self.max_bytes = max_bytes
+        # (sequence number, unix time, records)
+        self._entries: deque[tuple[int, float, bytes]] = deque()
+        self._bytes = 0
+        self._appended = asyncio.Event()
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ReplicationLog":
+        return cls(max_bytes=settings.replication_log_bytes)
+
+    def _append(self, records: bytes) -> None:
+        self.seq += 1
+        self._entries.append((self.seq, time.time(), records))
+        self._bytes += len(records)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._bytes -= len(self._entries.popleft()[2])
+        # NOTE: Waiters hold on to the event they wait for, every append wakes them with a fresh one for the next.
+        self._appended.set()
+        self._appended = asyncio.Event()
+
+    def log_put(self, key: str, value: Value, expires_at: Optional[float] = None) -> None:
+        self._append(encode_put(key, value, expires_at))
+
+    def log_put_many(self, items: list[tuple[str, Value]], expires_at: Optional[float] = None) -> None:
+        if items:
+            self._append(b"".join(encode_put(key, value, expires_at) for key, value in items))
+
+    def log_delete_many(self, keys: list[str]) -> None:
+        if keys:
+            self._append(b"".join(encode_record(OP_DELETE, key) for key in keys))
+
+    def log_clear(self) -> None:
+        self._append(encode_record(OP_CLEAR))
+
+    def since(self, seq: int) -> Optional[list[tuple[int, float, bytes]]]:
+        """Entries after seq, None if some of them aren't kept any more or seq is unknown"""
+        if seq > self.seq:
+            return None
+        first = self._entries[0][0] if self._entries else self.seq + 1
+        if seq < first - 1:
+            return None
+        # NOTE: Followers ask for the tail of the log, it's walked from the end.
+        entries = list(islice(reversed(self._entries), self.seq - seq))
+        entries.reverse()
+        return entries
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        """Wait until there are entries after seq, False on timeout"""
+        if self.seq > seq:
+            return True
+        try:
+            await asyncio.wait_for(self._appended.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {"role": LEADER, "epoch": self.epoch, "seq": self.seq, "log_entries": len(self._entries), "log_bytes": self._bytes}
+
+
+async def stream(
+    log: ReplicationLog,
+    storage: StorageEngine,
+    since: int,
+    epoch: Optional[str],
+    send: Callable[[bytes], Awaitable[None]],
+    heartbeat: float = 1.0,
+    chunk_keys: int = 1000,
+) -> None:
+    """Send the log to a follower which applied everything up to since, returns if it falls too far behind"""
+    entries = log.since(since) if epoch == log.epoch else None
+    if entries is None:
+        # NOTE: The snapshot is fuzzy, entries logged while it's sent are sent after it
+        # and records are idempotent, see Persistence.
+        since = log.seq
+        logger.info({"replication": "sending snapshot", "seq": since, "keys": len(storage)})
+        await send(encode_frame(SNAPSHOT, since, time.time()))
+        cursor: Optional[int] = 0
+        while cursor is not None:
+            cursor, items = storage.scan(cursor, chunk_keys)
+            if items:
+                await send(encode_frame(SNAPSHOT_DATA, since, time.time(), b"".join(encode_put(key, value, storage.expires_at(key)) for key, value in items)))
+        await send(encode_frame(SNAPSHOT_END, since, time.time()))
+        entries = log.since(since)
+
+    while entries is not None:
+        if entries:
+            batch: list[bytes] = []
+            size = 0
+            for seq, at, records in entries:
+                batch.append(records)
+                size += len(records)
+                if size >= _FRAME_BYTES or seq == entries[-1][0]:
+                    await send(encode_frame(RECORDS, seq, at, b"".join(batch)))
+                    batch, size = [], 0
+            since = entries[-1][0]
+        elif not await log.wait(since, heartbeat):
+            await send(encode_frame(HEARTBEAT, log.seq, time.time()))
+        entries = log.since(since)
+    logger.warning({"replication": "follower fell behind the log", "seq": since, "leader_seq": log.seq})
+
+
+class Follower:
+    """Applies the mutation stream of a leader to the local store, reconnecting when it's interrupted"""
+
+    def __init__(self, leader_url: str, store: "LocalStore", retry_interval: float = 1.0, read_timeout: float = 10.0) -> None:
+        self._url = leader_url.rstrip("/") + "/api/v1/replication"
+        self._store = store
+        self._retry_interval = retry_interval
+        self._read_timeout = read_timeout
+        self._task: Optional[asyncio.Task[None]] = None
+        self.epoch = ""
+        # last sequence number applied, 0 until a snapshot was applied completely
+        self.applied = 0
+        self.leader_seq = 0
+        # seconds between a batch being logged by the leader and applied here, clocks are assumed in sync
+        self.lag_seconds = 0.0
+        self.connected = False
+        self.snapshots = 0
+        self.reconnects = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings, store: "LocalStore") -> "Follower":
+        return cls(settings.replication_leader, store)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # NOTE: aiohttp is only needed by followers, it isn't imported with the app.
+        import aiohttp
+
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self._read_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                try:
+                    async with session.get(self._url, params={"since": str(self.applied), "epoch": self.epoch}) as response:
+                        if response.status != 200:
+                            raise ReplicationError(f"leader answered with {response.status}")
+                        self.epoch = response.headers.get(EPOCH_HEADER, "")
+                        self.connected = True
+                        await self.consume(response.content)
+                except (aiohttp.ClientError, asyncio.TimeoutError, EOFError, ReplicationError, ValueError) as ex:
+                    logger.warning({"replication": "stream interrupted", "leader": self._url, "error": repr(ex)})
+                self.connected = False
+                self.reconnects += 1
+                await asyncio.sleep(self._retry_interval)
+
+    async def consume(self, reader: FrameReader) -> None:
+        """Apply frames read from a stream until it ends"""
+        while True:
+            kind, seq, at, length = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+            payload = await reader.readexactly(length) if length else b""
+            await self._apply(kind, seq, at, payload)
+
+    async def _apply(self, kind: int, seq: int, at: float, payload: bytes) -> None:
+        if kind == RECORDS:
+            await self._store.apply_records(payload)
+            self.applied = seq
+            self.leader_seq = max(self.leader_seq, seq)
+            self.lag_seconds = max(0.0, time.time() - at)
+        elif kind == HEARTBEAT:
+            self.leader_seq = seq
+            if self.applied >= seq:
+                self.lag_seconds = 0.0
+        elif kind == SNAPSHOT:
+            # NOTE: Until the snapshot is complete the follower has nothing to continue from.
+            self.applied = 0
+            self.snapshots += 1
+            await self._store.clear()
+        elif kind == SNAPSHOT_DATA:
+            await self._store.apply_records(payload)
+        elif kind == SNAPSHOT_END:
+            self.applied = seq
+            self.leader_seq = max(self.leader_seq, seq)
+        else:
+            raise ReplicationError(f"unknown frame kind {kind}")
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            "role": FOLLOWER,
+            "leader": self._url,
+            "connected": self.connected,
+            "applied": self.applied,
+            "leader_seq": self.leader_seq,
+            "lag_entries": max(0, self.leader_seq - self.applied),
+            "lag_seconds": self.lag_seconds,
+            "snapshots": self.snapshots,
+            "reconnects": self.reconnects,
+        }
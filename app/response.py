@@ -0,0 +1,123 @@
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from asgiref.typing import ASGISendCallable
+
+
+# Header names and values of the common responses are encoded once, at import or on first use.
+TEXT = b"text/plain"
+JSON = b"application/json"
+
+_CONTENT_TYPES = {TEXT: (b"content-type", TEXT), JSON: (b"content-type", JSON)}
+_CONTENT_LENGTH = b"content-length"
+
+# Responses to these never have content, no content-length is sent with them.
+_NO_CONTENT = frozenset((HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED))
+
+# Content-length headers of bodies up to this size are kept once built, they aren't built
+# at import to keep the startup of workers short.
+_CACHED_LENGTHS = 4096
+_lengths: dict[int, tuple[bytes, bytes]] = {}
+
+# NOTE: Messages which don't depend on the response are shared between responses,
+# servers only read the messages they are sent.
+_EMPTY_BODY = {"type": "http.response.body", "body": b"", "more_body": False}
+_empty_starts: dict[int, dict[str, Any]] = {}
+
+# Bodies larger than this go out in several messages of at most this size, slices of the body
+# rather than copies, so the server can start writing before it holds the whole of it.
+CHUNK_BYTES = 256 * 1024
+
+# Encoded names of the extra headers, they are set by handlers so their number is bounded.
+_names: dict[str, bytes] = {}
+
+
+def _length(length: int) -> tuple[bytes, bytes]:
+    header = _lengths.get(length)
+    if header is None:
+        header = (_CONTENT_LENGTH, str(length).encode())
+        if length < _CACHED_LENGTHS:
+            _lengths[length] = header
+    return header
+
+
+def encode_headers(headers: dict[str, str]) -> list[tuple[bytes, bytes]]:
+    """Headers in the form of an ASGI message"""
+    names = _names
+    encoded: list[tuple[bytes, bytes]] = []
+    for name, value in headers.items():
+        key = names.get(name)
+        if key is None:
+            key = names[name] = name.lower().encode()
+        encoded.append((key, value.encode("latin-1")))
+    return encoded
+
+
+def _empty_start(status: int) -> dict[str, Any]:
+    """Start message of a response without a body or extra headers"""
+    message = _empty_starts.get(status)
+    if message is None:
+        headers = [] if status in _NO_CONTENT else [_length(0)]
+        message = _empty_starts[status] = {"type": "http.response.start", "status": status, "headers": headers}
+    return message
+
+
+async def _send_chunked(send: "ASGISendCallable", body: bytes | memoryview, more_body: bool = False) -> None:
+    """Send a body as messages of at most CHUNK_BYTES"""
+    view = memoryview(body)
+    length = len(view)
+    for offset in range(0, length, CHUNK_BYTES):
+        await send({"type": "http.response.body", "body": view[offset:offset + CHUNK_BYTES], "more_body": more_body or offset + CHUNK_BYTES < length})
+
+
+async def send_response(
+    send: "ASGISendCallable",
+    status: int,
+    body: bytes | memoryview = b"",
+    content_type: Optional[bytes] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> None:
+    """Send a complete response with its content-length.
+
+    The body goes out as given, memoryviews aren't copied into bytes, large ones in chunks.
+    """
+    length = len(body)
+    if not length and content_type is None and not headers:
+        await send(_empty_start(status))
+        await send(_EMPTY_BODY)
+        return
+
+    encoded: list[tuple[bytes, bytes]] = []
+    if content_type is not None:
+        encoded.append(_CONTENT_TYPES.get(content_type) or (b"content-type", content_type))
+    if status not in _NO_CONTENT:
+        encoded.append(_length(length))
+    if headers:
+        encoded += encode_headers(headers)
+    await send({"type": "http.response.start", "status": status, "headers": encoded})
+    if length > CHUNK_BYTES:
+        await _send_chunked(send, body)
+        return
+    await send({"type": "http.response.body", "body": body, "more_body": False} if length else _EMPTY_BODY)
+
+
+async def send_parts(
+    send: "ASGISendCallable",
+    status: int,
+    parts: list[bytes | memoryview],
+    content_type: Optional[bytes] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> None:
+    """Send a response whose body is the concatenation of parts, they are never joined"""
+    encoded: list[tuple[bytes, bytes]] = []
+    if content_type is not None:
+        encoded.append(_CONTENT_TYPES.get(content_type) or (b"content-type", content_type))
+    encoded.append(_length(sum(len(part) for part in parts)))
+    if headers:
+        encoded += encode_headers(headers)
+    await send({"type": "http.response.start", "status": status, "headers": encoded})
+    for i, part in enumerate(parts):
+        await _send_chunked(send, part, more_body=i < len(parts) - 1)
+    if not parts:
+        await send(_EMPTY_BODY)
@@ -0,0 +1,103 @@
+from typing import Awaitable, Callable, Optional
+
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class RouteNotFound(LookupError):
+    """Raised when no route matches the request path"""
+
+
+class MethodNotAllowed(LookupError):
+    """Raised when a route matches the path, but not the request method"""
+
+    def __init__(self, allowed: tuple[str, ...]) -> None:
+        super().__init__(f"method not allowed, expected one of {allowed}")
+        self.allowed = allowed
+
+
+class _Node:
+    """Single path segment of the route trie"""
+
+    __slots__ = ("children", "param", "methods")
+
+    def __init__(self) -> None:
+        self.children: dict[str, "_Node"] = {}
+        self.param: Optional["_Node"] = None
+        self.methods: dict[str, Handler] = {}
+
+
+class Router:
+    """Route table compiled into a segment trie.
+
+    Routes are registered once at startup, e.g. "/api/v1/storage/{key}".
+    Segments in braces match any non-empty segment, matched values are handed
+    over to the handler as positional arguments following (scope, receive, send).
+    Routes without parameters, and routes whose only parameter is the last segment,
+    are additionally kept in flat dicts, so resolving them costs a single lookup.
+    """
+
+    def __init__(self) -> None:
+        self._root = _Node()
+        self._static: dict[str, dict[str, Handler]] = {}
+        self._tail_param: dict[str, dict[str, Handler]] = {}
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return path.rstrip("/") or "/"
+
+    def add_route(self, method: str, path: str, handler: Handler) -> None:
+        """Register handler for method and path pattern"""
+        path = self._normalize(path)
+        node = self._root
+        segments = path.split("/")[1:]
+        params = 0
+        for segment in segments:
+            if segment.startswith("{") and segment.endswith("}"):
+                params += 1
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                node = node.children.setdefault(segment, _Node())
+
+        if method in node.methods:
+            raise ValueError(f"route {method} {path} is already registered")
+        node.methods[method] = handler
+        if params == 0:
+            self._static[path] = node.methods
+        elif params == 1 and segments[-1].startswith("{"):
+            self._tail_param[path.rpartition("/")[0]] = node.methods
+
+    def _walk(self, path: str) -> tuple[dict[str, Handler], tuple[str, ...]]:
+        node = self._root
+        params: list[str] = []
+        for segment in path.split("/")[1:]:
+            if (child := node.children.get(segment)) is not None:
+                node = child
+            elif segment and node.param is not None:
+                params.append(segment)
+                node = node.param
+            else:
+                raise RouteNotFound(path)
+        return node.methods, tuple(params)
+
+    def resolve(self, method: str, path: str) -> tuple[Handler, tuple[str, ...]]:
+        """Find handler and path parameters for a request"""
+        if len(path) > 1 and path[-1] == "/":
+            path = self._normalize(path)
+
+        params: tuple[str, ...] = ()
+        if (methods := self._static.get(path)) is None:
+            prefix, _, last = path.rpartition("/")
+            if last and (methods := self._tail_param.get(prefix)) is not None:
+                params = (last, )
+            else:
+                methods, params = self._walk(path)
+
+        if not methods:
+            raise RouteNotFound(path)
+        try:
+            return methods[method], params
+        except KeyError:
+            raise MethodNotAllowed(tuple(methods)) from None
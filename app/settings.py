@@ -0,0 +1,151 @@
+import os
+from dataclasses import dataclass
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read integer setting from the environment"""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read float setting from the environment"""
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_str(name: str, default: str) -> str:
+    """Read string setting from the environment"""
+    return os.environ.get(name) or default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Application settings, populated from environment variables"""
+
+    # Port the server listens on
+    port: int = 5051
+    # Number of server worker processes, with more than one the storage is owned by a separate process
+    workers: int = 1
+    # Unix socket of the storage owner, set for workers by the entry point
+    storage_socket: str = ""
+
+    # Storage engine
+    storage_shards: int = 16
+    storage_max_bytes: int = 256 * 1024 * 1024
+    storage_eviction_policy: str = "lru"
+
+    # Request bodies
+    max_body_bytes: int = 64 * 1024 * 1024
+    body_spill_bytes: int = 1024 * 1024
+    body_spill_dir: str = ""
+
+    # Value compression, "lz4" or empty to disable
+    compression: str = ""
+    compression_threshold: int = 1024
+    compression_max_ratio: float = 0.9
+
+    # Cold tier for large values, disabled unless a directory is set
+    cold_dir: str = ""
+    cold_threshold: int = 64 * 1024
+    cold_segment_bytes: int = 64 * 1024 * 1024
+    cold_max_bytes: int = 8 * 1024 * 1024 * 1024
+
+    # Persistence, disabled unless a data directory is set
+    persistence_dir: str = ""
+    wal_fsync_policy: str = "batch"
+    wal_batch_ms: float = 5.0
+    wal_batch_bytes: int = 1024 * 1024
+    snapshot_interval: float = 60.0
+    snapshot_min_wal_bytes: int = 64 * 1024 * 1024
+
+    # Logging, "async" queues records for a background writer, "sync" writes them from the request
+    log_pipeline: str = "async"
+    log_level: str = "INFO"
+    # Comma separated "METHOD /route/pattern=rate" pairs, e.g. "GET /api/v1/storage/{key}=0.01"
+    log_sample_rates: str = ""
+    log_default_sample_rate: float = 1.0
+
+    # Metrics, number of hottest keys reported by /metrics, 0 disables hot key tracking
+    metrics_hot_keys: int = 10
+    # Count the key of one of every N requests for hot key tracking
+    metrics_hot_key_sample_every: int = 8
+
+    # Watching keys over WebSocket, events queued per subscriber at most and what happens
+    # to subscribers falling behind, "drop" events or "disconnect" them
+    watch_queue_size: int = 1000
+    watch_slow_consumer: str = "drop"
+    # Values above this size aren't sent with events, only their version
+    watch_max_value_bytes: int = 64 * 1024
+
+    # Admission control, 0 disables a limit. Requests over the in-flight limits are rejected with 503
+    # and Retry-After of overload_retry_after seconds, clients over their rate with 429. Clients are
+    # told apart by rate_limit_key_header, by their address if they don't send it. Expensive routes,
+    # dumping and clearing the whole storage, have limits of their own.
+    max_in_flight: int = 0
+    max_in_flight_expensive: int = 0
+    # Requests per second of every client, bursts of up to rate_limit_burst, the rate if 0
+    rate_limit: float = 0.0
+    rate_limit_burst: float = 0.0
+    rate_limit_expensive: float = 0.0
+    rate_limit_burst_expensive: float = 0.0
+    rate_limit_key_header: str = "x-api-key"
+    rate_limit_max_clients: int = 100_000
+    overload_retry_after: int = 1
+
+    # Replication, "leader" or "follower", empty to disable. Followers stream the mutations of the
+    # leader at replication_leader, e.g. "http://10.0.0.1:5051", a leader keeps the most recent
+    # replication_log_bytes of them for followers catching up and needs a single worker.
+    replication_role: str = ""
+    replication_leader: str = ""
+    replication_log_bytes: int = 64 * 1024 * 1024
+    replication_heartbeat: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            port=_env_int("PORT", cls.port),
+            workers=_env_int("WORKERS", cls.workers),
+            storage_socket=_env_str("STORAGE_SOCKET", cls.storage_socket),
+            storage_shards=_env_int("STORAGE_SHARDS", cls.storage_shards),
+            storage_max_bytes=_env_int("STORAGE_MAX_BYTES", cls.storage_max_bytes),
+            storage_eviction_policy=_env_str("STORAGE_EVICTION_POLICY", cls.storage_eviction_policy),
+            max_body_bytes=_env_int("MAX_BODY_BYTES", cls.max_body_bytes),
+            body_spill_bytes=_env_int("BODY_SPILL_BYTES", cls.body_spill_bytes),
+            body_spill_dir=_env_str("BODY_SPILL_DIR", cls.body_spill_dir),
+            compression=_env_str("COMPRESSION", cls.compression),
+            compression_threshold=_env_int("COMPRESSION_THRESHOLD", cls.compression_threshold),
+            compression_max_ratio=_env_float("COMPRESSION_MAX_RATIO", cls.compression_max_ratio),
+            cold_dir=_env_str("COLD_DIR", cls.cold_dir),
+            cold_threshold=_env_int("COLD_THRESHOLD", cls.cold_threshold),
+            cold_segment_bytes=_env_int("COLD_SEGMENT_BYTES", cls.cold_segment_bytes),
+            cold_max_bytes=_env_int("COLD_MAX_BYTES", cls.cold_max_bytes),
+            persistence_dir=_env_str("PERSISTENCE_DIR", cls.persistence_dir),
+            wal_fsync_policy=_env_str("WAL_FSYNC_POLICY", cls.wal_fsync_policy),
+            wal_batch_ms=_env_float("WAL_BATCH_MS", cls.wal_batch_ms),
+            wal_batch_bytes=_env_int("WAL_BATCH_BYTES", cls.wal_batch_bytes),
+            snapshot_interval=_env_float("SNAPSHOT_INTERVAL", cls.snapshot_interval),
+            snapshot_min_wal_bytes=_env_int("SNAPSHOT_MIN_WAL_BYTES", cls.snapshot_min_wal_bytes),
+            log_pipeline=_env_str("LOG_PIPELINE", cls.log_pipeline),
+            log_level=_env_str("LOG_LEVEL", cls.log_level),
+            log_sample_rates=_env_str("LOG_SAMPLE_RATES", cls.log_sample_rates),
+            log_default_sample_rate=_env_float("LOG_DEFAULT_SAMPLE_RATE", cls.log_default_sample_rate),
+            metrics_hot_keys=_env_int("METRICS_HOT_KEYS", cls.metrics_hot_keys),
+            metrics_hot_key_sample_every=_env_int("METRICS_HOT_KEY_SAMPLE_EVERY", cls.metrics_hot_key_sample_every),
+            watch_queue_size=_env_int("WATCH_QUEUE_SIZE", cls.watch_queue_size),
+            watch_slow_consumer=_env_str("WATCH_SLOW_CONSUMER", cls.watch_slow_consumer),
+            watch_max_value_bytes=_env_int("WATCH_MAX_VALUE_BYTES", cls.watch_max_value_bytes),
+            max_in_flight=_env_int("MAX_IN_FLIGHT", cls.max_in_flight),
+            max_in_flight_expensive=_env_int("MAX_IN_FLIGHT_EXPENSIVE", cls.max_in_flight_expensive),
+            rate_limit=_env_float("RATE_LIMIT", cls.rate_limit),
+            rate_limit_burst=_env_float("RATE_LIMIT_BURST", cls.rate_limit_burst),
+            rate_limit_expensive=_env_float("RATE_LIMIT_EXPENSIVE", cls.rate_limit_expensive),
+            rate_limit_burst_expensive=_env_float("RATE_LIMIT_BURST_EXPENSIVE", cls.rate_limit_burst_expensive),
+            rate_limit_key_header=_env_str("RATE_LIMIT_KEY_HEADER", cls.rate_limit_key_header),
+            rate_limit_max_clients=_env_int("RATE_LIMIT_MAX_CLIENTS", cls.rate_limit_max_clients),
+            overload_retry_after=_env_int("OVERLOAD_RETRY_AFTER", cls.overload_retry_after),
+            replication_role=_env_str("REPLICATION_ROLE", cls.replication_role),
+            replication_leader=_env_str("REPLICATION_LEADER", cls.replication_leader),
+            replication_log_bytes=_env_int("REPLICATION_LOG_BYTES", cls.replication_log_bytes),
+            replication_heartbeat=_env_float("REPLICATION_HEARTBEAT", cls.replication_heartbeat),
+        )
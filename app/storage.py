@@ -0,0 +1,605 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional
+
+from .settings import Settings
+from .coldtier import ColdTier, ColdRef, ColdTierFullError
+from .compression import Compressor, Compressed, LZ4_ENCODING
+from .expiry import TimerWheel
+from .keyindex import KeyIndex
+from . import etag
+
+
+if TYPE_CHECKING:
+    from .body import SpooledBody
+
+
+# Values accepted and returned by the storage, values moved to the cold tier are returned as memoryview.
+Value = bytes | str | memoryview
+# Values as kept by the shards.
+Stored = bytes | str | Compressed | ColdRef
+
+# Rough bookkeeping cost of a single entry (dict slot, key and value object headers).
+# Without it millions of tiny values would fit into the budget while the process keeps growing.
+ENTRY_OVERHEAD = 64
+# Heap cost of a value kept in the cold tier.
+COLD_REF_OVERHEAD = 72
+# Every entry carries an entity tag, an integer kept in a dict of its own.
+ETAG_OVERHEAD = 48
+
+
+def entry_size(key: str, value: Stored) -> int:
+    """Approximate amount of memory occupied by an entry"""
+    if isinstance(value, ColdRef):
+        return len(key) + COLD_REF_OVERHEAD + ENTRY_OVERHEAD + ETAG_OVERHEAD
+    return len(key) + len(value) + ENTRY_OVERHEAD + ETAG_OVERHEAD
+
+
+class EntryTooLargeError(ValueError):
+    """Raised when a single entry doesn't fit into a shard's memory budget"""
+
+
+@dataclass
+class StorageStats:
+    keys: int = 0
+    bytes_used: int = 0
+    max_bytes: int = 0
+    evictions: int = 0
+    evicted_bytes: int = 0
+    cold_values: int = 0
+    cold_bytes: int = 0
+    expiring: int = 0
+    expired: int = 0
+
+
+class _Shard:
+    """Base class for a storage shard with a memory budget.
+
+    Besides the entries themselves every shard keeps keys in a ring of slots.
+    A key stays in its slot for as long as it lives in the shard, which gives
+    scan() a stable iteration order regardless of reads, updates and evictions.
+    Keys taking and releasing a slot are added to and removed from the ordered
+    index shared by the shards, except on clear(), which the engine handles.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._entries: dict[str, Stored] = {}
+        self._etags: dict[str, int] = {}
+        self._slots: dict[str, int] = {}
+        self._ring: list[Optional[str]] = []
+        self._free_slots: list[int] = []
+        # Called with every value dropped by the shard itself (overwritten, evicted or cleared).
+        self.on_discard: Optional[Callable[[Stored], Any]] = None
+        # Called with every key the shard evicts to stay within its budget.
+        self.on_evict: Optional[Callable[[str], Any]] = None
+        self.index: Optional[KeyIndex] = None
+
+    def _check_size(self, key: str, value: Stored) -> int:
+        size = entry_size(key, value)
+        if size > self.max_bytes:
+            raise EntryTooLargeError(f"entry {key} of {size} bytes exceeds shard budget of {self.max_bytes} bytes")
+        return size
+
+    def _record_eviction(self, key: str, value: Stored) -> None:
+        del self._etags[key]
+        size = entry_size(key, value)
+        self.bytes_used -= size
+        self.evictions += 1
+        self.evicted_bytes += size
+        if self.on_discard is not None:
+            self.on_discard(value)
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def _discard_all(self) -> None:
+        if self.on_discard is not None:
+            for value in self._entries.values():
+                self.on_discard(value)
+
+    def _take_slot(self, key: str) -> int:
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._ring[slot] = key
+        else:
+            slot = len(self._ring)
+            self._ring.append(key)
+        self._slots[key] = slot
+        if self.index is not None:
+            self.index.add(key)
+        return slot
+
+    def _release_slot(self, key: str) -> None:
+        slot = self._slots.pop(key)
+        self._ring[slot] = None
+        self._free_slots.append(slot)
+        if self.index is not None:
+            self.index.discard(key)
+
+    def _clear_slots(self) -> None:
+        self._slots.clear()
+        self._ring.clear()
+        self._free_slots.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, key: str) -> Optional[Stored]:
+        """Get value without affecting eviction order"""
+        return self._entries.get(key)
+
+    def etag(self, key: str) -> Optional[int]:
+        return self._etags.get(key)
+
+    def scan(self, slot: int, count: int) -> tuple[Optional[int], list[tuple[str, Stored]]]:
+        """Collect up to count entries starting at slot.
+
+        Returns the slot to continue from, or None once the end of the ring is reached.
+        Doesn't affect eviction order.
+        """
+        items: list[tuple[str, Stored]] = []
+        ring = self._ring
+        while slot < len(ring) and len(items) < count:
+            if (key := ring[slot]) is not None:
+                items.append((key, self._entries[key]))
+            slot += 1
+        return (slot if slot < len(ring) else None), items
+
+    def get(self, key: str) -> Optional[Stored]:
+        raise NotImplementedError
+
+    def put(self, key: str, value: Stored, tag: int) -> None:
+        raise NotImplementedError
+
+    def pop(self, key: str) -> Stored:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def items(self) -> Iterator[tuple[str, Stored]]:
+        return iter(list(self._entries.items()))
+
+
+class LRUShard(_Shard):
+    """Shard evicting the least recently used entries first"""
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(max_bytes)
+        self._entries: OrderedDict[str, Stored] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Stored]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Stored, tag: int) -> None:
+        size = self._check_size(key, value)
+        if (old := self._entries.pop(key, None)) is not None:
+            self.bytes_used -= entry_size(key, old)
+            if self.on_discard is not None:
+                self.on_discard(old)
+        else:
+            self._take_slot(key)
+
+        self._entries[key] = value
+        self._etags[key] = tag
+        self.bytes_used += size
+
+        while self.bytes_used > self.max_bytes:
+            evicted_key, evicted_value = self._entries.popitem(last=False)
+            self._release_slot(evicted_key)
+            self._record_eviction(evicted_key, evicted_value)
+
+    def pop(self, key: str) -> Stored:
+        value = self._entries.pop(key)
+        del self._etags[key]
+        self._release_slot(key)
+        self.bytes_used -= entry_size(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._discard_all()
+        self._entries.clear()
+        self._etags.clear()
+        self._clear_slots()
+        self.bytes_used = 0
+
+
+class ClockShard(_Shard):
+    """Shard approximating LRU with the CLOCK (second chance) algorithm.
+
+    Reads only flip a reference bit instead of reordering a linked list,
+    which makes them cheaper than in LRUShard.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(max_bytes)
+        self._referenced: list[bool] = []
+        self._hand = 0
+
+    def get(self, key: str) -> Optional[Stored]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._referenced[self._slots[key]] = True
+        return value
+
+    def put(self, key: str, value: Stored, tag: int) -> None:
+        size = self._check_size(key, value)
+        if (old := self._entries.get(key)) is not None:
+            self.bytes_used -= entry_size(key, old)
+            self._referenced[self._slots[key]] = True
+            if self.on_discard is not None:
+                self.on_discard(old)
+        else:
+            self._take_slot(key)
+
+        self._entries[key] = value
+        self._etags[key] = tag
+        self.bytes_used += size
+
+        while self.bytes_used > self.max_bytes:
+            self._evict_one(protected=key)
+
+    def pop(self, key: str) -> Stored:
+        value = self._entries.pop(key)
+        del self._etags[key]
+        self._release_slot(key)
+        self.bytes_used -= entry_size(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._discard_all()
+        self._entries.clear()
+        self._etags.clear()
+        self._clear_slots()
+        self._referenced.clear()
+        self._hand = 0
+        self.bytes_used = 0
+
+    def _take_slot(self, key: str) -> int:
+        slot = super()._take_slot(key)
+        if slot < len(self._referenced):
+            self._referenced[slot] = False
+        else:
+            self._referenced.append(False)
+        return slot
+
+    def _evict_one(self, protected: str) -> None:
+        # NOTE: Every full turn of the hand clears all reference bits,
+        # so the loop terminates after at most two turns.
+        # The entry being inserted is never chosen as a victim.
+        while True:
+            if self._hand >= len(self._ring):
+                self._hand = 0
+            slot = self._hand
+            self._hand += 1
+            key = self._ring[slot]
+            if key is None or key == protected:
+                continue
+            if self._referenced[slot]:
+                self._referenced[slot] = False
+                continue
+            value = self._entries.pop(key)
+            self._release_slot(key)
+            self._record_eviction(key, value)
+            return
+
+
+_SHARD_TYPES: dict[str, type[_Shard]] = {
+    "lru": LRUShard,
+    "clock": ClockShard,
+}
+
+
+class StorageEngine:
+    """Key-value storage split across shards, bounded by a memory budget.
+
+    Each shard owns an equal share of the budget and evicts its own entries,
+    so an eviction never has to look at more than one shard.
+    """
+
+    def __init__(self, shards: int = 16, max_bytes: int = 256 * 1024 * 1024, eviction_policy: str = "lru", cold: Optional[ColdTier] = None, compressor: Optional[Compressor] = None) -> None:
+        if shards < 1:
+            raise ValueError("storage needs at least one shard")
+        try:
+            shard_type = _SHARD_TYPES[eviction_policy]
+        except KeyError:
+            raise ValueError(f"unknown eviction policy {eviction_policy}") from None
+
+        self._max_bytes = max_bytes
+        self._shards: list[_Shard] = [shard_type(max_bytes // shards) for _ in range(shards)]
+
+        # NOTE: With the cold tier enabled large values live in memory-mapped files,
+        # the shards only keep refs to them, which are cheap in terms of the memory budget.
+        self.cold = cold
+        self.compressor = compressor
+        if cold is not None:
+            for shard in self._shards:
+                shard.on_discard = self._free_cold
+
+        # NOTE: Keys of all shards in sorted order, maintained by the shards as keys come and go,
+        # evictions included, for range_scan().
+        self._index = KeyIndex()
+        for shard in self._shards:
+            shard.index = self._index
+
+        # NOTE: Keys put with a TTL are expired by expire_due(), called periodically,
+        # and on access if that didn't happen yet.
+        self._ttl = TimerWheel(time.time())
+        self._expired = 0
+        for shard in self._shards:
+            shard.on_evict = self._cancel_deadline
+        # called with every key removed because its TTL is over
+        self.on_expire: Optional[Callable[[str], None]] = None
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "StorageEngine":
+        cold = None
+        if settings.cold_dir:
+            cold = ColdTier(
+                settings.cold_dir,
+                threshold=settings.cold_threshold,
+                segment_size=settings.cold_segment_bytes,
+                max_bytes=settings.cold_max_bytes,
+            )
+        compressor = None
+        if settings.compression == LZ4_ENCODING:
+            compressor = Compressor(threshold=settings.compression_threshold, max_ratio=settings.compression_max_ratio)
+        elif settings.compression:
+            raise ValueError(f"unsupported compression {settings.compression}")
+        return cls(
+            shards=settings.storage_shards,
+            max_bytes=settings.storage_max_bytes,
+            eviction_policy=settings.storage_eviction_policy,
+            cold=cold,
+            compressor=compressor,
+        )
+
+    def _free_cold(self, value: Stored) -> None:
+        if isinstance(value, ColdRef):
+            self.cold.free(value)
+
+    def _resolve_encoded(self, value: Stored) -> tuple[Value, Optional[str]]:
+        if isinstance(value, ColdRef):
+            return self.cold.read(value), (LZ4_ENCODING if value.compressed else None)
+        if isinstance(value, Compressed):
+            return value.data, LZ4_ENCODING
+        return value, None
+
+    def _resolve(self, value: Stored) -> Value:
+        value, encoding = self._resolve_encoded(value)
+        return self.decode(value, encoding)
+
+    def decode(self, value: Value, encoding: Optional[str]) -> Value:
+        """Turn value returned by get_encoded() into its original form"""
+        if encoding is None:
+            return value
+        return self.compressor.decompress(value)
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _expire(self, key: str) -> None:
+        try:
+            self._free_cold(self._shard(key).pop(key))
+        except KeyError:
+            # removed in the meantime
+            return
+        self._expired += 1
+        if self.on_expire is not None:
+            self.on_expire(key)
+
+    def _is_expired(self, key: str) -> bool:
+        """Check the deadline of key, an expired key is removed right away"""
+        deadlines = self._ttl.deadlines
+        if not deadlines or (deadline := deadlines.get(key)) is None or deadline > time.time():
+            return False
+        self._ttl.cancel(key)
+        self._expire(key)
+        return True
+
+    def expires_at(self, key: str) -> Optional[float]:
+        """Unix time at which key expires, None if it doesn't"""
+        return self._ttl.deadline(key)
+
+    def expire_due(self, now: float, limit: int = 10_000) -> int:
+        """Remove up to limit keys whose TTL is over, returns the number of removed keys"""
+        due = self._ttl.advance(now, limit)
+        for key in due:
+            self._expire(key)
+        return len(due)
+
+    def _cancel_deadline(self, key: str) -> None:
+        if self._ttl.deadlines:
+            self._ttl.cancel(key)
+
+    def _set_deadline(self, key: str, expires_at: Optional[float]) -> None:
+        if expires_at is not None:
+            self._ttl.schedule(key, expires_at)
+        elif self._ttl.deadlines:
+            self._ttl.cancel(key)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def __contains__(self, key: str) -> bool:
+        return not self._is_expired(key) and self._shard(key).get(key) is not None
+
+    def get(self, key: str, default: Optional[Value] = None) -> Optional[Value]:
+        """Get value by key, marking it as recently used"""
+        if self._is_expired(key):
+            return default
+        value = self._shard(key).get(key)
+        if value is None:
+            return default
+        return self._resolve(value)
+
+    def get_encoded(self, key: str) -> tuple[Optional[Value], Optional[str]]:
+        """Get value by key as stored, along with its content encoding (None if not compressed)"""
+        if self._is_expired(key):
+            return None, None
+        value = self._shard(key).get(key)
+        if value is None:
+            return None, None
+        return self._resolve_encoded(value)
+
+    def etag(self, key: str) -> Optional[int]:
+        """Entity tag of the value of key, computed when it was written"""
+        if self._is_expired(key):
+            return None
+        return self._shard(key).etag(key)
+
+    def cold_path(self, key: str) -> Optional[str]:
+        """Path of a cold tier file holding exactly the value of key, if there is one"""
+        if self.cold is not None and isinstance(value := self._shard(key).peek(key), ColdRef):
+            return self.cold.path(value)
+        return None
+
+    def put(self, key: str, value: Value, expires_at: Optional[float] = None) -> None:
+        """Put value into the storage, evicting old entries if over budget.
+
+        With expires_at (unix time) set the key is removed once it's reached.
+        """
+        tag = etag.compute(value)
+        stored: Stored = value
+        if self.compressor is not None and not isinstance(value, str) and len(value) >= self.compressor.threshold:
+            stored = self.compressor.compress(value) or value
+
+        if self.cold is not None and not isinstance(stored, str) and len(stored) >= self.cold.threshold:
+            compressed = isinstance(stored, Compressed)
+            try:
+                ref = self.cold.write(stored.data if compressed else stored)
+                ref.compressed = compressed
+                stored = ref
+            except ColdTierFullError:
+                # keep the value on the heap, it's still bounded by the memory budget
+                pass
+
+        if isinstance(stored, (memoryview, bytearray)):
+            stored = bytes(stored)
+
+        try:
+            self._shard(key).put(key, stored, tag)
+        except EntryTooLargeError:
+            self._free_cold(stored)
+            raise
+        self._set_deadline(key, expires_at)
+
+    def put_file(self, key: str, body: "SpooledBody", expires_at: Optional[float] = None) -> None:
+        """Put value held in a temporary file, it goes straight to the cold tier if enabled"""
+        if self.cold is None or len(body) < self.cold.threshold:
+            self.put(key, body.read(), expires_at)
+            return
+
+        # NOTE: Values this large skip compression, it would require loading them into memory.
+        try:
+            stored: Stored = self.cold.write_file(body.fileno(), len(body))
+        except ColdTierFullError:
+            self.put(key, body.read(), expires_at)
+            return
+        try:
+            self._shard(key).put(key, stored, body.etag)
+        except EntryTooLargeError:
+            self._free_cold(stored)
+            raise
+        self._set_deadline(key, expires_at)
+
+    def __setitem__(self, key: str, value: Value) -> None:
+        self.put(key, value)
+
+    def pop(self, key: str) -> Value:
+        """Remove value from the storage, raises KeyError if missing"""
+        if self._is_expired(key):
+            raise KeyError(key)
+        stored = self._shard(key).pop(key)
+        if self._ttl.deadlines:
+            self._ttl.cancel(key)
+        value = self._resolve(stored)
+        # NOTE: The returned view keeps the segment mapped until it's released.
+        self._free_cold(stored)
+        return value
+
+    def clear(self) -> None:
+        for shard in self._shards:
+            shard.clear()
+        self._index.clear()
+        self._ttl.clear()
+
+    def _live(self, items: list[tuple[str, Stored]], now: float) -> list[tuple[str, Stored]]:
+        """Leave out entries whose TTL is over but which weren't removed yet"""
+        deadlines = self._ttl.deadlines
+        if not deadlines:
+            return items
+        return [(key, value) for key, value in items if (deadline := deadlines.get(key)) is None or deadline > now]
+
+    def items(self) -> Iterator[tuple[str, Value]]:
+        now = time.time()
+        for shard in self._shards:
+            for key, value in self._live(list(shard.items()), now):
+                yield key, self._resolve(value)
+
+    def copy(self) -> dict[str, Value]:
+        return dict(self.items())
+
+    def scan(self, cursor: int = 0, count: int = 1000) -> tuple[Optional[int], list[tuple[str, Value]]]:
+        """Return a page of up to count entries and the cursor of the next page.
+
+        Start with cursor 0, a returned cursor of None means the scan is complete.
+        Keys present for the whole duration of a scan are returned exactly once,
+        keys added or removed in the meantime may or may not be returned.
+        """
+        nshards = len(self._shards)
+        shard_index, slot = cursor % nshards, cursor // nshards
+        items: list[tuple[str, Value]] = []
+        now = time.time()
+
+        while shard_index < nshards and len(items) < count:
+            next_slot, page = self._shards[shard_index].scan(slot, count - len(items))
+            items.extend((key, self._resolve(value)) for key, value in self._live(page, now))
+            if next_slot is None:
+                shard_index, slot = shard_index + 1, 0
+            else:
+                slot = next_slot
+
+        if shard_index >= nshards:
+            return None, items
+        return slot * nshards + shard_index, items
+
+    def range_scan(self, start: str = "", end: Optional[str] = None, after: Optional[str] = None, count: int = 1000) -> tuple[Optional[str], list[tuple[str, Value]]]:
+        """Return up to count entries with start <= key < end in key order, and the key to continue after.
+
+        Pass the returned key as after to get the next page, None means the range is exhausted.
+        Unlike scan() pages don't depend on where keys are stored, keys added or removed
+        between pages are returned if they sort after the last returned key.
+        """
+        keys = self._index.keys(start, end, after, count + 1)
+        more = len(keys) > count
+        if more:
+            del keys[count:]
+        page: list[tuple[str, Stored]] = []
+        for key in keys:
+            page.append((key, self._shard(key).peek(key)))
+        items = [(key, self._resolve(value)) for key, value in self._live(page, time.time())]
+        return (keys[-1] if more else None), items
+
+    @property
+    def stats(self) -> StorageStats:
+        stats = StorageStats(max_bytes=self._max_bytes)
+        for shard in self._shards:
+            stats.keys += len(shard)
+            stats.bytes_used += shard.bytes_used
+            stats.evictions += shard.evictions
+            stats.evicted_bytes += shard.evicted_bytes
+        if self.cold is not None:
+            cold_stats = self.cold.stats
+            stats.cold_values = cold_stats.values
+            stats.cold_bytes = cold_stats.live_bytes
+        stats.expiring = len(self._ttl)
+        stats.expired = self._expired
+        return stats
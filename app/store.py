@@ -0,0 +1,224 @@
+import asyncio
+import dataclasses
+import time
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
+
+from .storage import StorageEngine, Value
+from .persistence import Persistence
+from .expiry import TICK
+from . import etag, persistence, watch
+
+
+# Upper bound of keys expired at once, the event loop gets control back in between.
+_EXPIRE_BATCH = 1000
+
+
+def _deadline(ttl: Optional[float]) -> Optional[float]:
+    return time.time() + ttl if ttl is not None else None
+
+
+if TYPE_CHECKING:
+    from .body import SpooledBody
+    from .watch import ChangeListener
+    from .replication import ReplicationLog
+
+
+class PreconditionFailed(Exception):
+    """Raised when the current value of a key doesn't satisfy If-Match"""
+
+
+class Lookup(NamedTuple):
+    """Value found by Store.get()"""
+
+    # Value as stored, None if the key doesn't exist or the value wasn't modified
+    value: Optional[Value]
+    # Content encoding of value, None if it's not compressed
+    encoding: Optional[str] = None
+    # File holding exactly this value, it can be sent with pathsend
+    path: Optional[str] = None
+    # Entity tag of the value
+    etag: Optional[int] = None
+    # False if the value matches If-None-Match, it's left out then
+    modified: bool = True
+
+
+class LocalStore:
+    """Storage owned by this process, mutations are logged before they are acknowledged if persistence is enabled.
+
+    Request handlers only talk to a store, so they work the same with storage
+    shared by several workers (see remote.RemoteStore).
+
+    Changes are published to changes once they are logged, evictions aren't published.
+    On a replication leader mutations are appended to its replication log along with the write-ahead log.
+    """
+
+    def __init__(self, storage: StorageEngine, persistence: Optional[Persistence] = None) -> None:
+        self.storage = storage
+        self.persistence = persistence
+        self.changes: Optional["ChangeListener"] = None
+        self.replication: Optional["ReplicationLog"] = None
+        self._expiry_task: Optional[asyncio.Task[None]] = None
+        storage.on_expire = self._on_expire
+
+    def _on_expire(self, key: str) -> None:
+        if self.changes is not None:
+            self.changes.publish(watch.EXPIRE, key)
+
+    @property
+    def durable(self) -> bool:
+        """Whether mutations wait for the write-ahead log"""
+        return self.persistence is not None
+
+    async def open(self) -> None:
+        if self.persistence:
+            # NOTE: Load the latest snapshot and replay the log tail before serving any request.
+            await self.persistence.open(self.storage)
+        self._expiry_task = asyncio.create_task(self._expire_loop())
+
+    async def close(self) -> None:
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            try:
+                await self._expiry_task
+            except asyncio.CancelledError:
+                pass
+            self._expiry_task = None
+        if self.persistence:
+            await self.persistence.close()
+
+    async def _expire_loop(self) -> None:
+        """Remove keys whose TTL is over, once per tick of the timer wheel"""
+        while True:
+            await asyncio.sleep(TICK)
+            # NOTE: Expired keys aren't logged, replay drops them by the deadline stored in their put record.
+            while self.storage.expire_due(time.time(), _EXPIRE_BATCH) == _EXPIRE_BATCH:
+                await asyncio.sleep(0)
+
+    def _check(self, key: str, if_match: Optional[frozenset[str]]) -> None:
+        if if_match is not None and not etag.matches(self.storage.etag(key), if_match):
+            raise PreconditionFailed(f"key {key} doesn't match {', '.join(sorted(if_match))}")
+
+    async def get(self, key: str, with_path: bool = False, if_none_match: Optional[frozenset[str]] = None) -> Lookup:
+        tag = self.storage.etag(key)
+        if tag is None:
+            return Lookup(None)
+        if if_none_match is not None and etag.matches(tag, if_none_match, weak=True):
+            return Lookup(None, etag=tag, modified=False)
+        value, encoding = self.storage.get_encoded(key)
+        path = self.storage.cold_path(key) if with_path and isinstance(value, memoryview) else None
+        return Lookup(value, encoding, path, tag)
+
+    def decode(self, value: Value, encoding: Optional[str]) -> Value:
+        return self.storage.decode(value, encoding)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[Value]]:
+        return [self.storage.get(key) for key in keys]
+
+    async def put(self, key: str, value: Value, if_match: Optional[frozenset[str]] = None, ttl: Optional[float] = None) -> int:
+        """Put value, expiring after ttl seconds if set, returns its entity tag"""
+        # NOTE: Nothing is awaited between the check and the write, so they are atomic.
+        self._check(key, if_match)
+        expires_at = _deadline(ttl)
+        self.storage.put(key, value, expires_at)
+        tag = self.storage.etag(key)
+        if self.replication is not None:
+            self.replication.log_put(key, value, expires_at)
+        if self.persistence:
+            await self.persistence.log_put(key, value, expires_at)
+        if self.changes is not None:
+            self.changes.publish(watch.PUT, key, tag, value)
+        return tag
+
+    async def put_file(self, key: str, body: "SpooledBody", if_match: Optional[frozenset[str]] = None, ttl: Optional[float] = None) -> int:
+        self._check(key, if_match)
+        expires_at = _deadline(ttl)
+        self.storage.put_file(key, body, expires_at)
+        if self.replication is not None or self.persistence:
+            value = self.storage.get(key, b"")
+            if self.replication is not None:
+                self.replication.log_put(key, value, expires_at)
+            if self.persistence:
+                await self.persistence.log_put(key, value, expires_at)
+        if self.changes is not None:
+            # NOTE: Spilled bodies are large, subscribers only get the version.
+            self.changes.publish(watch.PUT, key, body.etag)
+        return body.etag
+
+    async def put_many(self, items: list[tuple[str, Value]], ttl: Optional[float] = None) -> None:
+        """Put several values, on EntryTooLargeError the values before the failed one stay stored"""
+        expires_at = _deadline(ttl)
+        stored: list[tuple[str, Value]] = []
+        tags: list[Optional[int]] = []
+        try:
+            for key, value in items:
+                self.storage.put(key, value, expires_at)
+                stored.append((key, value))
+                if self.changes is not None:
+                    tags.append(self.storage.etag(key))
+        finally:
+            if self.replication is not None:
+                self.replication.log_put_many(stored, expires_at)
+            if self.persistence:
+                await self.persistence.log_put_many(stored, expires_at)
+            if self.changes is not None:
+                for (key, value), tag in zip(stored, tags):
+                    self.changes.publish(watch.PUT, key, tag, value)
+
+    async def delete(self, key: str, if_match: Optional[frozenset[str]] = None) -> bool:
+        """Remove key, returns False if it doesn't exist"""
+        self._check(key, if_match)
+        return (await self.delete_many([key]))[0]
+
+    async def delete_many(self, keys: list[str]) -> list[bool]:
+        deleted: list[bool] = []
+        for key in keys:
+            try:
+                self.storage.pop(key)
+            except KeyError:
+                deleted.append(False)
+            else:
+                deleted.append(True)
+        if self.replication is not None:
+            self.replication.log_delete_many([key for key, ok in zip(keys, deleted) if ok])
+        if self.persistence:
+            await self.persistence.log_delete_many([key for key, ok in zip(keys, deleted) if ok])
+        if self.changes is not None:
+            for key, ok in zip(keys, deleted):
+                if ok:
+                    self.changes.publish(watch.DELETE, key)
+        return deleted
+
+    async def clear(self) -> None:
+        self.storage.clear()
+        if self.replication is not None:
+            self.replication.log_clear()
+        if self.persistence:
+            await self.persistence.log_clear()
+        if self.changes is not None:
+            self.changes.publish(watch.CLEAR)
+
+    async def apply_records(self, data: bytes) -> None:
+        """Apply write-ahead log records of another store, as streamed by a replication leader"""
+        for op, key, value in persistence.decode_records(data):
+            persistence.apply_record(self.storage, op, key, value)
+            if self.changes is not None:
+                if op == persistence.OP_DELETE:
+                    self.changes.publish(watch.DELETE, key)
+                elif op == persistence.OP_CLEAR:
+                    self.changes.publish(watch.CLEAR)
+                elif (tag := self.storage.etag(key)) is not None:
+                    self.changes.publish(watch.PUT, key, tag)
+        if self.persistence:
+            await self.persistence.log_records(data)
+
+    async def scan(self, cursor: int, count: int) -> tuple[Optional[int], list[tuple[str, Value]]]:
+        return self.storage.scan(cursor, count)
+
+    async def range_scan(self, start: str = "", end: Optional[str] = None, after: Optional[str] = None, count: int = 1000) -> tuple[Optional[str], list[tuple[str, Value]]]:
+        return self.storage.range_scan(start, end, after, count)
+
+    async def stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {"storage": dataclasses.asdict(self.storage.stats)}
+        if compressor := self.storage.compressor:
+            stats["compression"] = dataclasses.asdict(compressor.stats) | {"ratio": compressor.stats.ratio}
+        return stats
@@ -0,0 +1,37 @@
+"""Helpers shared by the test modules, calling the app with synthetic ASGI messages"""
+import asyncio
+from typing import Any
+
+from app.app import ASGIApp
+
+
+def _call(app: ASGIApp, method: str, path: str, body: bytes | list[bytes] = b"", query_string: bytes = b"", headers: list[tuple[bytes, bytes]] | None = None, extensions: dict[str, Any] | None = None) -> list[dict[str, Any]]:
+    """Invoke the app with a synthetic http scope, return messages sent back"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": headers or [],
+        "extensions": extensions or {},
+    }
+    chunks = body if isinstance(body, list) else [body]
+    request = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+    sent: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        return request.pop(0) if request else {"type": "http.disconnect"}
+
+    async def send(msg: dict[str, Any]) -> None:
+        sent.append(msg)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def _body(messages: list[dict[str, Any]]) -> bytes:
+    return b"".join(msg["body"] for msg in messages if msg["type"] == "http.response.body")
+
+
+def _headers(messages: list[dict[str, Any]]) -> dict[bytes, bytes]:
+    return dict(messages[0]["headers"])
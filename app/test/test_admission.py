@@ -0,0 +1,98 @@
+import asyncio
+import json
+from typing import Any
+from unittest import TestCase
+
+from app.admission import AdmissionControl, RateLimiter
+from app.app import ASGIApp
+from app.settings import Settings
+from app.storage import StorageEngine
+from app.test.helpers import _call, _body, _headers
+
+
+class RateLimiterTestSuite(TestCase):
+    def test_token_bucket(self):
+        """Test bursts, the wait until the next token and refilling over time"""
+        limiter = RateLimiter(rate=2.0, burst=3)
+        self.assertEqual([limiter.acquire("a", 0.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(limiter.acquire("a", 0.0), 0.5)
+        self.assertEqual(limiter.acquire("b", 0.0), 0.0)
+        self.assertEqual(limiter.acquire("a", 0.5), 0.0)
+        self.assertEqual(limiter.acquire("a", 0.5), 0.5)
+        # tokens never pile up above the burst
+        self.assertEqual([limiter.acquire("a", 100.0) for _ in range(4)], [0.0, 0.0, 0.0, 0.5])
+
+    def test_bounded_clients(self):
+        """Test that idle clients are forgotten first once too many are tracked"""
+        limiter = RateLimiter(rate=1.0, burst=1, max_clients=10)
+        for i in range(10):
+            limiter.acquire(f"idle-{i}", 0.0)
+        limiter.acquire("busy", 5.0)
+        self.assertEqual(len(limiter), 1)
+        for i in range(20):
+            limiter.acquire(f"busy-{i}", 5.0)
+        self.assertLessEqual(len(limiter), 10)
+
+
+class AdmissionTestSuite(TestCase):
+    def test_in_flight_budgets(self):
+        """Test that expensive requests are limited on their own and count against the default budget"""
+        admission = AdmissionControl(max_in_flight=2, max_in_flight_expensive=1, retry_after=3)
+        scope: Any = {"headers": [], "client": ("10.0.0.1", 1234)}
+        self.assertIsNone(admission.admit(scope, expensive=True))
+        rejection = admission.admit(scope, expensive=True)
+        self.assertEqual((rejection["status"], dict(rejection["headers"])[b"retry-after"]), (503, b"3"))
+        self.assertIsNone(admission.admit(scope))
+        self.assertEqual(admission.admit(scope)["status"], 503)
+        admission.release(expensive=True)
+        admission.release()
+        self.assertEqual(admission.stats["default"]["in_flight"], 0)
+        self.assertEqual(admission.stats["default"]["rejected"], {"in_flight": 1, "rate": 0})
+        self.assertEqual(admission.stats["expensive"]["rejected"], {"in_flight": 1, "rate": 0})
+        self.assertIsNone(AdmissionControl.from_settings(Settings()))
+
+    def test_endpoints(self):
+        """Test 429 per client, 503 while the server is busy, and the counters of both"""
+        settings = Settings(max_in_flight=1, rate_limit=0.5, rate_limit_burst=2)
+        app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), settings=settings)
+        self.assertEqual([_call(app, "GET", "/api/v1/storage/key")[0]["status"] for _ in range(2)], [404, 404])
+        messages = _call(app, "GET", "/api/v1/storage/key")
+        self.assertEqual((messages[0]["status"], _headers(messages)[b"retry-after"]), (429, b"2"))
+        # another API key has a bucket of its own, monitoring isn't limited
+        self.assertEqual(_call(app, "GET", "/api/v1/storage/key", headers=[(b"x-api-key", b"other")])[0]["status"], 404)
+        self.assertEqual(_call(app, "GET", "/metrics")[0]["status"], 200)
+
+        async def busy() -> list[int]:
+            received = asyncio.Event()
+            release = asyncio.Event()
+
+            async def slow_receive() -> dict[str, Any]:
+                received.set()
+                await release.wait()
+                return {"type": "http.request", "body": b"value", "more_body": False}
+
+            async def receive() -> dict[str, Any]:
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            statuses: list[int] = []
+
+            async def send(message: dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    statuses.append(message["status"])
+
+            def scope(method: str, api_key: bytes) -> dict[str, Any]:
+                return {"type": "http", "method": method, "path": "/api/v1/storage/key", "query_string": b"", "headers": [(b"x-api-key", api_key)]}
+
+            put = asyncio.create_task(app(scope("PUT", b"writer"), slow_receive, send))
+            await received.wait()
+            await app(scope("GET", b"reader"), receive, send)
+            release.set()
+            await put
+            await app(scope("GET", b"reader"), receive, send)
+            return statuses
+
+        self.assertEqual(asyncio.run(busy()), [503, 202, 200])
+        stats = json.loads(_body(_call(app, "GET", "/api/v1/stats")))["admission"]
+        self.assertEqual(stats["default"]["rejected"], {"in_flight": 1, "rate": 1})
+        self.assertEqual(stats["default"]["in_flight"], 0)
+        self.assertIn('http_requests_rejected_total{budget="default",reason="rate"} 1', _body(_call(app, "GET", "/metrics")).decode())
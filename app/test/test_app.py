@@ -0,0 +1,93 @@
+import json
+from unittest import TestCase
+
+from loguru import logger
+
+from app.app import ASGIApp
+from app.storage import StorageEngine
+from app.test.helpers import _call, _body, _headers
+
+
+class StorageDumpTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.app = ASGIApp(storage=StorageEngine(shards=4, max_bytes=16 * 1024 * 1024))
+        for i in range(2500):
+            self.app._storage.put(f"key-{i}", f"value-{i}".encode())
+        self.app._storage.put("binary", b"\xff\xfe")
+
+    def test_streamed_dump(self):
+        """Test that the full dump is sent in several chunks of ndjson"""
+        messages = _call(self.app, "GET", "/api/v1/storage")
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(_headers(messages)[b"content-type"], b"application/x-ndjson")
+
+        chunks = [msg for msg in messages if msg["type"] == "http.response.body"]
+        self.assertGreater(len(chunks), 2)
+        self.assertFalse(chunks[-1]["more_body"])
+
+        records = [json.loads(line) for line in _body(messages).splitlines()]
+        self.assertEqual(len(records), 2501)
+        binary = next(r for r in records if r["key"] == "binary")
+        self.assertEqual(binary["encoding"], "base64")
+
+    def test_paginated_dump(self):
+        """Test that following cursors visits every key exactly once"""
+        keys: list[str] = []
+        cursor = b"0"
+        while cursor is not None:
+            messages = _call(self.app, "GET", "/api/v1/storage/", query_string=b"limit=700&cursor=" + cursor)
+            self.assertEqual(messages[0]["status"], 200)
+            keys.extend(json.loads(line)["key"] for line in _body(messages).splitlines())
+            cursor = _headers(messages).get(b"x-next-cursor")
+
+        self.assertEqual(len(keys), 2501)
+        self.assertEqual(len(set(keys)), 2501)
+
+    def test_invalid_cursor(self):
+        """Test that malformed pagination parameters are rejected"""
+        messages = _call(self.app, "GET", "/api/v1/storage", query_string=b"cursor=abc")
+        self.assertEqual(messages[0]["status"], 400)
+
+
+class RoutingTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.app = ASGIApp(storage=StorageEngine(shards=4, max_bytes=1024 * 1024))
+
+    def test_put_get_delete(self):
+        """Test key routes end to end"""
+        self.assertEqual(_call(self.app, "PUT", "/api/v1/storage/key", body=b"value")[0]["status"], 202)
+        messages = _call(self.app, "GET", "/api/v1/storage/key")
+        self.assertEqual((messages[0]["status"], _body(messages)), (200, b"value"))
+        self.assertEqual(_call(self.app, "DELETE", "/api/v1/storage/key")[0]["status"], 200)
+        self.assertEqual(_call(self.app, "GET", "/api/v1/storage/key")[0]["status"], 404)
+
+    def test_put_query(self):
+        """Test that key-value pairs are taken from the query string"""
+        messages = _call(self.app, "PUT", "/api/v1/storage", query_string=b"a=1&b=2")
+        self.assertEqual(messages[0]["status"], 202)
+        self.assertEqual(self.app._storage.get("b"), "2")
+
+    def test_method_not_allowed(self):
+        """Test that unsupported methods get 405 with the allow header"""
+        messages = _call(self.app, "POST", "/api/v1/storage/key", body=b"value")
+        self.assertEqual(messages[0]["status"], 405)
+        self.assertEqual(set(_headers(messages)[b"allow"].decode().split(", ")), {"GET", "PUT", "DELETE"})
+
+    def test_unknown_path(self):
+        """Test that paths outside of the api get 404"""
+        self.assertEqual(_call(self.app, "GET", "/unknown/key")[0]["status"], 404)
+
+    def test_handler_error(self):
+        """Test that a failing handler is answered with 500 and its traceback is logged"""
+        async def failing_get(*args: object, **kwargs: object) -> None:
+            raise RuntimeError("storage is broken")
+
+        self.app._store.get = failing_get
+        records: list[str] = []
+        handler_id = logger.add(records.append, level="ERROR")
+        try:
+            messages = _call(self.app, "GET", "/api/v1/storage/key")
+        finally:
+            logger.remove(handler_id)
+        self.assertEqual(messages[0]["status"], 500)
+        self.assertIn("RuntimeError: storage is broken", "".join(records))
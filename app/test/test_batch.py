@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from app import batch
+from app.app import ASGIApp
+from app.storage import StorageEngine
+
+from app.test.helpers import _call, _body
+
+
+class BatchTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.app = ASGIApp(storage=StorageEngine(shards=4, max_bytes=1024 * 1024))
+
+    def test_framing(self):
+        """Test that binary values survive encoding and decoding"""
+        items = [("a", b"\x00\xff\n"), ("ключ", b""), ("c", bytes(range(256)))]
+        self.assertEqual([(k, bytes(v)) for k, v in batch.decode_items(batch.encode_items(items))], items)
+        self.assertEqual(batch.decode_keys(batch.encode_keys(["a", "b"])), ["a", "b"])
+        self.assertEqual(batch.decode_values(batch.encode_values([b"x", None, b""])), [b"x", None, b""])
+
+        with self.assertRaises(batch.BatchFormatError):
+            batch.decode_items(batch.encode_items(items)[:-1])
+
+    def test_mset_mget_mdel(self):
+        """Test batch endpoints end to end"""
+        items = [(f"key-{i}", bytes([i]) * i) for i in range(1, 50)]
+        messages = _call(self.app, "POST", "/api/v1/storage:mset", body=batch.encode_items(items))
+        self.assertEqual(messages[0]["status"], 202)
+
+        keys = ["key-1", "missing", "key-49"]
+        messages = _call(self.app, "POST", "/api/v1/storage:mget", body=batch.encode_keys(keys))
+        self.assertEqual(batch.decode_values(_body(messages)), [b"\x01", None, bytes([49]) * 49])
+
+        messages = _call(self.app, "POST", "/api/v1/storage:mdel", body=batch.encode_keys(keys))
+        self.assertEqual(_body(messages), b"\x01\x00\x01")
+        self.assertIsNone(self.app._storage.get("key-1"))
+
+    def test_malformed(self):
+        """Test that malformed batches are rejected"""
+        messages = _call(self.app, "POST", "/api/v1/storage:mget", body=b"\x00\x00\x00\x05ab")
+        self.assertEqual(messages[0]["status"], 400)
@@ -0,0 +1,31 @@
+import os
+from unittest import TestCase, skipUnless
+
+from bench import bench_asgi
+
+
+class BenchmarkRegressionTestSuite(TestCase):
+    # NOTE: Timings depend on the load of the machine, the gate runs when it's asked for.
+    @skipUnless(os.environ.get("RUN_BENCH"), "timing test, set RUN_BENCH to run it")
+    def test_hot_paths_within_baseline(self):
+        """Test that no hot path got slower than its baseline allows, see bench/bench_asgi.py"""
+        baseline = bench_asgi.load_baseline()
+        if baseline is None:
+            self.skipTest("no baseline recorded, run python -m bench.bench_asgi --save")
+        threshold = bench_asgi.threshold()
+
+        # NOTE: Short rounds keep the suite fast, whatever looks slower is measured again at full length
+        # so a busy machine doesn't fail the suite.
+        calibration = bench_asgi.calibrate()
+        slower = bench_asgi.regressions(bench_asgi.run(rounds=3, scale=0.2), calibration, baseline, threshold)
+        if slower:
+            calibration = bench_asgi.calibrate()
+            slower = bench_asgi.regressions(bench_asgi.run(list(slower)), calibration, baseline, threshold)
+        self.assertEqual({name: round(slowdown, 2) for name, slowdown in slower.items()}, {}, f"slower than {threshold}x the baseline")
+
+    def test_regressions(self):
+        """Test that results are compared relative to the calibration loop"""
+        baseline = {"relative": {"fast": 10.0, "slow": 10.0}}
+        # a machine twice as slow overall doesn't regress anything
+        self.assertEqual(bench_asgi.regressions({"fast": 2000.0, "slow": 2000.0, "new": 1.0}, 200.0, baseline, 1.5), {})
+        self.assertEqual(bench_asgi.regressions({"fast": 1000.0, "slow": 1600.0}, 100.0, baseline, 1.5), {"slow": 1.6})
@@ -0,0 +1,76 @@
+import asyncio
+import tempfile
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.coldtier import ColdTier
+from app.settings import Settings
+from app.storage import StorageEngine
+
+from app.test.helpers import _call
+
+
+class RequestBodyTestSuite(TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.settings = Settings(max_body_bytes=64 * 1024, body_spill_bytes=4 * 1024, body_spill_dir=self._tmp.name)
+        self.storage = StorageEngine(shards=2, max_bytes=1024 * 1024)
+        self.app = ASGIApp(storage=self.storage, settings=self.settings)
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _put(self, chunks: list[bytes], length: int | None = None) -> int:
+        headers = [] if length is None else [(b"content-length", str(length).encode())]
+        return _call(self.app, "PUT", "/api/v1/storage/key", body=chunks, headers=headers)[0]["status"]
+
+    def test_chunked_bodies(self):
+        """Test bodies with and without content-length, below and above the spill threshold"""
+        for size in (100, 10 * 1024):
+            chunks = [bytes([i]) * (size // 10) for i in range(10)]
+            for length in (None, size):
+                with self.subTest(size=size, length=length):
+                    self.assertEqual(self._put(chunks, length), 202)
+                    self.assertEqual(self.storage.get("key"), b"".join(chunks))
+
+    def test_spill_into_cold_tier(self):
+        """Test that spilled bodies are moved to the cold tier without loading them into memory"""
+        storage = StorageEngine(shards=2, max_bytes=1024 * 1024, cold=ColdTier(self._tmp.name + "/cold", threshold=1024))
+        self.app = ASGIApp(storage=storage, settings=self.settings)
+        chunks = [b"x" * 1000] * 20
+
+        self.assertEqual(self._put(chunks), 202)
+        self.assertIsInstance(storage.get("key"), memoryview)
+        self.assertEqual(storage.get("key"), b"x" * 20000)
+
+    def test_too_large(self):
+        """Test that oversized bodies are rejected, early when content-length is known"""
+        self.assertEqual(self._put([b"x"], length=1024 * 1024), 413)
+        self.assertEqual(self._put([b"x" * 1024] * 100), 413)
+        self.assertIsNone(self.storage.get("key"))
+
+    def test_length_mismatch(self):
+        """Test that bodies not matching content-length are rejected"""
+        self.assertEqual(self._put([b"x" * 10, b"x" * 10], length=15), 400)
+        self.assertEqual(self._put([b"x" * 10, b"x" * 10], length=25), 400)
+        # a body in a single message is checked as well
+        self.assertEqual(self._put([b"x" * 10], length=15), 400)
+        self.assertEqual(self._put([b"x" * 10], length=5), 400)
+        self.assertIsNone(self.storage.get("key"))
+
+    def test_disconnect(self):
+        """Test that a client disconnecting mid-upload gets no response and stores nothing"""
+        chunks = [b"x" * 10, b"x" * 10]
+        request = [{"type": "http.request", "body": chunks[0], "more_body": True}, {"type": "http.disconnect"}]
+        sent: list[dict] = []
+
+        async def receive() -> dict:
+            return request.pop(0)
+
+        async def send(msg: dict) -> None:
+            sent.append(msg)
+
+        scope = {"type": "http", "method": "PUT", "path": "/api/v1/storage/key", "query_string": b"", "headers": []}
+        asyncio.run(self.app(scope, receive, send))
+        self.assertEqual(sent, [])
+        self.assertIsNone(self.storage.get("key"))
@@ -0,0 +1,89 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.coldtier import ColdTier, ColdTierFullError
+from app.storage import StorageEngine
+
+from app.test.helpers import _call, _body
+
+
+class ColdTierTestSuite(TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self._tmp.name)
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_write_read(self):
+        """Test that values are read back as views into the segment"""
+        tier = ColdTier(self.directory, threshold=16, segment_size=1024)
+        refs = [tier.write(bytes([i]) * 100) for i in range(20)]
+        for i, ref in enumerate(refs):
+            view = tier.read(ref)
+            self.assertIsInstance(view, memoryview)
+            self.assertEqual(view, bytes([i]) * 100)
+        self.assertEqual(tier.stats.values, 20)
+
+    def test_no_io_until_first_write(self):
+        """Test that the directory is created and stale segments removed with the first segment only"""
+        directory = self.directory / "cold"
+        tier = ColdTier(directory, threshold=16, segment_size=1024)
+        self.assertFalse(directory.exists())
+        tier.write(b"x" * 100)
+        self.assertEqual(len(list(directory.glob("cold-*.seg"))), 1)
+
+        (directory / "cold-99999999.seg").write_bytes(b"stale")
+        tier = ColdTier(directory, threshold=16, segment_size=1024)
+        self.assertEqual(len(list(directory.glob("cold-*.seg"))), 2)
+        tier.write(b"x" * 100)
+        self.assertEqual(len(list(directory.glob("cold-*.seg"))), 1)
+
+    def test_compaction(self):
+        """Test that mostly dead segments are compacted and live values survive"""
+        tier = ColdTier(self.directory, threshold=16, segment_size=1000)
+        refs = [tier.write(bytes([i]) * 100) for i in range(30)]
+        for ref in refs[:25]:
+            tier.free(ref)
+
+        self.assertGreater(tier.stats.compactions, 0)
+        for i, ref in enumerate(refs[25:], start=25):
+            self.assertEqual(tier.read(ref), bytes([i]) * 100)
+        self.assertEqual(tier.stats.live_bytes, 500)
+
+    def test_budget(self):
+        """Test that the tier refuses to grow past its disk budget"""
+        tier = ColdTier(self.directory, threshold=16, segment_size=1000, max_bytes=1500)
+        tier.write(b"x" * 800)
+        with self.assertRaises(ColdTierFullError):
+            tier.write(b"x" * 800)
+
+    def test_storage_tiering(self):
+        """Test that only values above the threshold go to the cold tier"""
+        storage = StorageEngine(shards=2, max_bytes=64 * 1024, cold=ColdTier(self.directory, threshold=1024, segment_size=64 * 1024))
+        storage.put("small", b"s" * 100)
+        storage.put("large", b"l" * 32 * 1024)
+
+        self.assertIsInstance(storage.get("small"), bytes)
+        self.assertIsInstance(storage.get("large"), memoryview)
+        self.assertEqual(storage.stats.cold_values, 1)
+        # the large value doesn't count against the memory budget
+        self.assertLess(storage.stats.bytes_used, 1024)
+
+        storage.put("large", b"x")
+        self.assertEqual(storage.stats.cold_values, 0)
+
+    def test_pathsend(self):
+        """Test that values with a dedicated file are sent with pathsend when the server supports it"""
+        storage = StorageEngine(shards=2, max_bytes=64 * 1024, cold=ColdTier(self.directory, threshold=1024, segment_size=4096))
+        app = ASGIApp(storage=storage)
+        storage.put("blob", b"b" * 8192)
+
+        messages = _call(app, "GET", "/api/v1/storage/blob", extensions={"http.response.pathsend": {}})
+        self.assertEqual(messages[-1]["type"], "http.response.pathsend")
+        self.assertEqual(Path(messages[-1]["path"]).read_bytes(), b"b" * 8192)
+
+        messages = _call(app, "GET", "/api/v1/storage/blob")
+        self.assertEqual(_body(messages), b"b" * 8192)
@@ -0,0 +1,46 @@
+import os
+from unittest import TestCase
+
+import lz4.frame
+
+from app.app import ASGIApp
+from app.compression import Compressor
+from app.storage import StorageEngine
+
+from app.test.helpers import _call, _body, _headers
+
+
+class CompressionTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.storage = StorageEngine(shards=2, max_bytes=1024 * 1024, compressor=Compressor(threshold=256))
+        self.app = ASGIApp(storage=self.storage)
+        self.text = b"the quick brown fox jumps over the lazy dog " * 100
+
+    def test_transparent(self):
+        """Test that compressed values read back unchanged and take less memory"""
+        self.storage.put("text", self.text)
+        self.assertEqual(self.storage.get("text"), self.text)
+        self.assertEqual(self.storage.get_encoded("text")[1], "lz4")
+        self.assertLess(self.storage.stats.bytes_used, len(self.text))
+        self.assertLess(self.storage.compressor.stats.ratio, 0.5)
+
+    def test_skip_incompressible(self):
+        """Test that random data and small values are stored as is"""
+        self.storage.put("random", os.urandom(4096))
+        self.storage.put("small", b"x" * 100)
+        self.assertIsNone(self.storage.get_encoded("random")[1])
+        self.assertIsNone(self.storage.get_encoded("small")[1])
+        self.assertEqual(self.storage.compressor.stats.skipped, 1)
+
+    def test_accept_encoding(self):
+        """Test that compressed bytes are sent as is only to clients accepting lz4"""
+        _call(self.app, "PUT", "/api/v1/storage/text", body=self.text)
+
+        messages = _call(self.app, "GET", "/api/v1/storage/text", headers=[(b"accept-encoding", b"gzip, lz4")])
+        self.assertEqual(_headers(messages)[b"content-encoding"], b"lz4")
+        self.assertEqual(lz4.frame.decompress(_body(messages)), self.text)
+
+        for accept in (b"gzip", b"lz4;q=0"):
+            messages = _call(self.app, "GET", "/api/v1/storage/text", headers=[(b"accept-encoding", accept)])
+            self.assertNotIn(b"content-encoding", _headers(messages))
+            self.assertEqual(_body(messages), self.text)
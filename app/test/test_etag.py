@@ -0,0 +1,72 @@
+import tempfile
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.coldtier import ColdTier
+from app.compression import Compressor
+from app.settings import Settings
+from app.storage import StorageEngine
+from app import etag
+
+from app.test.helpers import _call, _body, _headers
+
+
+class ETagTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024))
+
+    def _put(self, key: str, value: bytes, if_match: bytes | None = None) -> tuple[int, bytes | None]:
+        headers = [(b"if-match", if_match)] if if_match is not None else []
+        messages = _call(self.app, "PUT", f"/api/v1/storage/{key}", body=value, headers=headers)
+        return messages[0]["status"], _headers(messages).get(b"etag")
+
+    def test_conditional_get(self):
+        """Test that GET returns the tag computed on write and 304 for a matching If-None-Match"""
+        _, tag = self._put("key", b"value")
+        self.assertEqual(tag, etag.format_etag(etag.compute(b"value")).encode())
+
+        messages = _call(self.app, "GET", "/api/v1/storage/key")
+        self.assertEqual(_headers(messages)[b"etag"], tag)
+        self.assertEqual(_body(messages), b"value")
+
+        for condition in (tag, b'"other", ' + tag, b"W/" + tag, b"*"):
+            with self.subTest(condition=condition):
+                messages = _call(self.app, "GET", "/api/v1/storage/key", headers=[(b"if-none-match", condition)])
+                self.assertEqual(messages[0]["status"], 304)
+                self.assertEqual(_headers(messages)[b"etag"], tag)
+                self.assertEqual(_body(messages), b"")
+
+        self.assertEqual(_call(self.app, "GET", "/api/v1/storage/key", headers=[(b"if-none-match", b'"other"')])[0]["status"], 200)
+        self.assertEqual(_call(self.app, "GET", "/api/v1/storage/missing", headers=[(b"if-none-match", b"*")])[0]["status"], 404)
+
+    def test_empty_value(self):
+        """Test that a key with an empty value exists for GET as it does for If-Match"""
+        _, tag = self._put("key", b"")
+        messages = _call(self.app, "GET", "/api/v1/storage/key")
+        self.assertEqual((messages[0]["status"], _headers(messages)[b"etag"], _body(messages)), (200, tag, b""))
+        self.assertEqual(self._put("key", b"value", if_match=tag)[0], 202)
+
+    def test_optimistic_concurrency(self):
+        """Test that PUT and DELETE with If-Match only succeed against the current version"""
+        _, first = self._put("key", b"v1")
+        self.assertEqual(self._put("key", b"v2", if_match=first)[0], 202)
+        self.assertEqual(self._put("key", b"v3", if_match=first), (412, None))
+        self.assertEqual(self.app._storage.get("key"), b"v2")
+        self.assertEqual(self._put("missing", b"v1", if_match=b"*")[0], 412)
+
+        delete = lambda condition: _call(self.app, "DELETE", "/api/v1/storage/key", headers=[(b"if-match", condition)])[0]["status"]
+        self.assertEqual(delete(first), 412)
+        self.assertEqual(delete(etag.format_etag(etag.compute(b"v2")).encode()), 200)
+        self.assertIsNone(self.app._storage.get("key"))
+
+    def test_tag_independent_of_storage(self):
+        """Test that compressed, cold and spilled values get the same tag as plain ones"""
+        value = b"abcd" * 50_000
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = StorageEngine(shards=2, max_bytes=16 * 1024 * 1024, cold=ColdTier(tmp, threshold=1024), compressor=Compressor())
+            self.app = ASGIApp(storage=storage, settings=Settings(body_spill_bytes=4096, body_spill_dir=tmp))
+            _, compressed = self._put("compressed", value)
+            spilled = _headers(_call(self.app, "PUT", "/api/v1/storage/spilled", body=[value[:100_000], value[100_000:]]))[b"etag"]
+
+        self.assertEqual(compressed, spilled)
+        self.assertEqual(compressed, etag.format_etag(etag.compute(value)).encode())
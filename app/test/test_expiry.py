@@ -0,0 +1,145 @@
+import asyncio
+import random
+import tempfile
+import time
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.expiry import TimerWheel, TICK
+from app.persistence import Persistence
+from app.store import LocalStore
+from app.storage import StorageEngine
+
+from app.test.helpers import _call
+
+
+class TimerWheelTestSuite(TestCase):
+    def test_keys_expire_on_time(self):
+        """Test that every key comes due after its deadline and no later than a tick past it"""
+        now = 1_000_000.0
+        wheel = TimerWheel(now)
+        rng = random.Random(7)
+        # spread deadlines over all levels of the wheel
+        deadlines = {f"key-{i}": now + rng.choice((0.05, 3.0, 30.0, 3000.0, 300_000.0)) * rng.random() for i in range(5000)}
+        for key, deadline in deadlines.items():
+            wheel.schedule(key, deadline)
+        wheel.schedule("cancelled", now + 1)
+        wheel.cancel("cancelled")
+        wheel.schedule("moved", now + 1)
+        wheel.schedule("moved", now + 5000)
+        deadlines["moved"] = now + 5000
+
+        expired: dict[str, float] = {}
+        clock = now
+        while clock < now + 400_000:
+            clock += rng.uniform(0, 50)
+            for key in wheel.advance(clock):
+                expired[key] = clock
+        self.assertEqual(expired.keys(), deadlines.keys())
+        self.assertEqual(len(wheel), 0)
+        for key, at in expired.items():
+            self.assertGreaterEqual(at, deadlines[key])
+
+        wheel = TimerWheel(now)
+        wheel.schedule("key", now + 1)
+        self.assertEqual(wheel.advance(now + 1 - TICK), [])
+        self.assertEqual(wheel.advance(now + 1 + TICK), ["key"])
+
+    def test_advance_limit(self):
+        """Test that keys over the limit are returned by the following calls"""
+        wheel = TimerWheel(0.0)
+        for i in range(25):
+            wheel.schedule(f"key-{i}", 1.0)
+        self.assertEqual([len(wheel.advance(2.0, limit=10)) for _ in range(4)], [10, 10, 5, 0])
+
+
+class ExpiryTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.storage = StorageEngine(shards=2, max_bytes=1024 * 1024)
+        self.app = ASGIApp(storage=self.storage)
+
+    def test_lazy_expiry(self):
+        """Test that a key past its deadline is gone on read before the wheel gets to it"""
+        self.storage.put("expired", b"value", time.time() - 1)
+        self.storage.put("live", b"value", time.time() + 60)
+        self.storage.put("forever", b"value")
+        self.assertEqual(sorted(key for key, _ in self.storage.items()), ["forever", "live"])
+        self.assertIsNone(self.storage.get("expired"))
+        self.assertIsNone(self.storage.expires_at("forever"))
+
+        # a put without TTL makes the key persistent again
+        self.storage.put("live", b"other")
+        self.assertIsNone(self.storage.expires_at("live"))
+        stats = self.storage.stats
+        self.assertEqual((stats.expiring, stats.expired), (0, 1))
+
+    def test_evicted_keys_stop_expiring(self):
+        """Test that keys evicted to stay within the budget take their deadline with them"""
+        for policy in ("lru", "clock"):
+            with self.subTest(policy=policy):
+                storage = StorageEngine(shards=2, max_bytes=64 * 1024, eviction_policy=policy)
+                for i in range(200):
+                    storage.put(f"key-{i}", b"x" * 1024, time.time() + 60)
+                stats = storage.stats
+                self.assertGreater(stats.evictions, 0)
+                self.assertEqual(stats.expiring, len(storage))
+                self.assertEqual(storage.expires_at("key-0"), None)
+
+    def test_ttl_parameters(self):
+        """Test the X-TTL header and the ttl query parameter of the put endpoints"""
+        before = time.time()
+        self.assertEqual(_call(self.app, "PUT", "/api/v1/storage/header", body=b"v", headers=[(b"x-ttl", b"30")])[0]["status"], 202)
+        self.assertEqual(_call(self.app, "PUT", "/api/v1/storage/query", body=b"v", query_string=b"ttl=0.5")[0]["status"], 202)
+        self.assertEqual(_call(self.app, "PUT", "/api/v1/storage", query_string=b"text=hello", headers=[(b"x-ttl", b"10")])[0]["status"], 202)
+        self.assertAlmostEqual(self.storage.expires_at("header") - before, 30, delta=1)
+        self.assertAlmostEqual(self.storage.expires_at("query") - before, 0.5, delta=1)
+        self.assertAlmostEqual(self.storage.expires_at("text") - before, 10, delta=1)
+        # both endpoints take the ttl parameter, it isn't stored as a key
+        self.assertEqual(_call(self.app, "PUT", "/api/v1/storage", query_string=b"a=1&ttl=20")[0]["status"], 202)
+        self.assertAlmostEqual(self.storage.expires_at("a") - before, 20, delta=1)
+        self.assertNotIn("ttl", self.storage)
+        self.assertEqual(_call(self.app, "PUT", "/api/v1/storage", query_string=b"ttl=20")[0]["status"], 400)
+
+        for value in (b"0", b"-1", b"inf", b"nan", b"soon"):
+            with self.subTest(ttl=value):
+                messages = _call(self.app, "PUT", "/api/v1/storage/bad", body=b"v", headers=[(b"x-ttl", value)])
+                self.assertEqual(messages[0]["status"], 400)
+        self.assertNotIn("bad", self.storage)
+
+    def test_expire_loop(self):
+        """Test that the store removes keys in the background once their TTL is over"""
+        async def run() -> None:
+            store = LocalStore(self.storage)
+            await store.open()
+            await store.put("key", b"value", ttl=TICK)
+            await store.put_many([("other", b"value")], ttl=60)
+            await asyncio.sleep(4 * TICK)
+            await store.close()
+
+        asyncio.run(run())
+        self.assertEqual(self.storage.copy(), {"other": b"value"})
+        self.assertEqual(self.storage.stats.expired, 1)
+
+    def test_ttl_survives_restart(self):
+        """Test that deadlines are replayed from the log and keys expired meanwhile are dropped"""
+        with tempfile.TemporaryDirectory() as tmp:
+            async def run(scenario) -> StorageEngine:
+                storage = StorageEngine(shards=2, max_bytes=1024 * 1024)
+                store = LocalStore(storage, Persistence(tmp, fsync_policy="never", snapshot_interval=3600))
+                await store.open()
+                await scenario(store)
+                await store.close()
+                return storage
+
+            async def write(store: LocalStore) -> None:
+                await store.put("short", b"value", ttl=0.2)
+                await store.put("long", "value", ttl=60)
+                await store.put_many([("batch", b"value")], ttl=60)
+                await store.put("forever", b"value")
+
+            deadline = asyncio.run(run(write)).expires_at("long")
+            time.sleep(0.3)
+            storage = asyncio.run(run(lambda store: asyncio.sleep(0)))
+            self.assertEqual(storage.copy(), {"long": "value", "batch": b"value", "forever": b"value"})
+            self.assertEqual(storage.expires_at("long"), deadline)
+            self.assertIsNone(storage.expires_at("forever"))
@@ -0,0 +1,93 @@
+import json
+import random
+import time
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.keyindex import KeyIndex, prefix_end
+from app.storage import StorageEngine
+
+from app.test.helpers import _call, _body, _headers
+
+
+class KeyIndexTestSuite(TestCase):
+    def test_matches_sorted_set(self):
+        """Test inserts, deletes and range queries against a sorted set, with chunks splitting and merging"""
+        rng = random.Random(7)
+        index = KeyIndex(load=8)
+        expected: set[str] = set()
+        for _ in range(5000):
+            key = f"k{rng.randrange(600):03d}"
+            if rng.random() < 0.6:
+                index.add(key)
+                expected.add(key)
+            else:
+                index.discard(key)
+                expected.discard(key)
+        ordered = sorted(expected)
+        self.assertEqual(len(index), len(expected))
+        self.assertEqual(index.keys(count=10_000), ordered)
+        self.assertTrue(all(len(chunk) <= 16 for chunk in index._chunks))
+        self.assertEqual(index._maxes, [chunk[-1] for chunk in index._chunks])
+
+        for start, end, after in (("k100", "k200", None), ("k100", "k200", "k150"), ("", "k050", "k010"), ("k599", None, None), ("k2", "k1", None)):
+            with self.subTest(start=start, end=end, after=after):
+                matching = [key for key in ordered if key >= start and (end is None or key < end) and (after is None or key > after)]
+                self.assertEqual(index.keys(start, end, after, count=10_000), matching)
+                self.assertEqual(index.keys(start, end, after, count=5), matching[:5])
+
+    def test_prefix_end(self):
+        """Test the upper bound of keys starting with a prefix"""
+        self.assertEqual(prefix_end("user:"), "user;")
+        self.assertEqual(prefix_end("a\U0010ffff"), "b")
+        self.assertIsNone(prefix_end(""))
+
+
+class RangeScanTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.app = ASGIApp(storage=StorageEngine(shards=4, max_bytes=16 * 1024 * 1024))
+        for i in range(300):
+            self.app._storage.put(f"user:{i:03d}", f"value-{i}".encode())
+            self.app._storage.put(f"order:{i:03d}", b"o")
+        self.app._storage.put("user:a/b c", b"special")
+
+    def _keys(self, messages: list) -> list[str]:
+        return [json.loads(line)["key"] for line in _body(messages).splitlines()]
+
+    def test_storage_range_scan(self):
+        """Test that removed, evicted and expired keys leave the index"""
+        storage = StorageEngine(shards=1, max_bytes=4000)
+        for i in range(100):
+            storage.put(f"key-{i:02d}", b"v" * 10)
+        storage.pop(storage.range_scan(count=1)[1][0][0])
+        storage.put("key-ttl", b"v", time.time() - 1)
+        next_key, items = storage.range_scan(count=1000)
+        self.assertIsNone(next_key)
+        self.assertEqual([key for key, _ in items], sorted(storage.copy()))
+        self.assertEqual(len(storage._index), len(storage))
+        storage.clear()
+        self.assertEqual(storage.range_scan(), (None, []))
+
+    def test_prefix(self):
+        """Test that a prefix scan streams only the keys with the prefix, in order"""
+        messages = _call(self.app, "GET", "/api/v1/storage", query_string=b"prefix=user:")
+        self.assertEqual(self._keys(messages), sorted(key for key in self.app._storage.copy() if key.startswith("user:")))
+
+    def test_pages(self):
+        """Test that following the cursors of a range visits its keys once, in order"""
+        keys: list[str] = []
+        query = b"start=order:250&end=user:010&limit=7"
+        while True:
+            messages = _call(self.app, "GET", "/api/v1/storage", query_string=query)
+            self.assertEqual(messages[0]["status"], 200)
+            keys += self._keys(messages)
+            cursor = _headers(messages).get(b"x-next-cursor")
+            if cursor is None:
+                break
+            query = b"start=order:250&end=user:010&limit=7&cursor=" + cursor
+        self.assertEqual(keys, [f"order:{i:03d}" for i in range(250, 300)] + [f"user:{i:03d}" for i in range(10)])
+
+        messages = _call(self.app, "GET", "/api/v1/storage", query_string=b"prefix=user:a&limit=1")
+        self.assertEqual((self._keys(messages), _headers(messages).get(b"x-next-cursor")), (["user:a/b c"], None))
+        messages = _call(self.app, "GET", "/api/v1/storage", query_string=b"prefix=user:2&limit=1&cursor=user%3A299")
+        self.assertEqual(self._keys(messages), [])
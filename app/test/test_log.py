@@ -0,0 +1,61 @@
+import io
+import json
+from unittest import TestCase
+
+from loguru import logger
+
+from app.app import ASGIApp
+from app.log import LogPipeline, DEBUG, INFO, parse_sample_rates
+from app.storage import StorageEngine
+
+from app.test.helpers import _call
+
+
+class LogPipelineTestSuite(TestCase):
+    def test_sampling(self):
+        """Test that sampled routes log every n-th request and levels are checked first"""
+        log = LogPipeline(level="INFO", sample_rates=parse_sample_rates("GET /a=0.1, GET /b=0"))
+        self.assertEqual(sum(log.sample("GET /a") for _ in range(100)), 10)
+        self.assertEqual(sum(log.sample("GET /b") for _ in range(100)), 0)
+        self.assertEqual(sum(log.sample("GET /c") for _ in range(100)), 100)
+        self.assertFalse(log.sample("GET /c", DEBUG))
+        self.assertFalse(log.enabled(DEBUG))
+        self.assertTrue(log.enabled(INFO))
+
+    def test_batched_writes(self):
+        """Test that queued records and loguru messages are written out by the background thread"""
+        stream = io.StringIO()
+        # a handler added by somebody else keeps getting messages
+        other: list[str] = []
+        other_id = logger.add(other.append, level="WARNING")
+        log = LogPipeline(stream=stream, flush_interval=0.01)
+        log.start()
+        try:
+            for i in range(1000):
+                log.emit("INFO", {"request": i})
+            logger.warning("from loguru")
+        finally:
+            log.stop()
+            logger.remove(other_id)
+        self.assertEqual(len(other), 1)
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 1001)
+        self.assertEqual(json.loads(lines[999].split(" | ", 2)[2]), {"request": 999})
+        self.assertIn("from loguru", lines[-1])
+
+    def test_full_queue_drops(self):
+        """Test that records are dropped rather than queued without bound when the writer falls behind"""
+        log = LogPipeline(max_queue=10)
+        for i in range(15):
+            log.emit("INFO", {"request": i})
+        self.assertEqual((log.emitted, log.dropped), (10, 5))
+
+    def test_request_log(self):
+        """Test that the app samples request records per route"""
+        log = LogPipeline(sample_rates={"GET /api/v1/storage/{key}": 0.25})
+        app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), log=log)
+        for _ in range(8):
+            _call(app, "GET", "/api/v1/storage/key")
+            _call(app, "PUT", "/api/v1/storage/key", body=b"value")
+        self.assertEqual(log.emitted, 8 + 2)
@@ -0,0 +1,86 @@
+import random
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.metrics import Histogram, HotKeys, Metrics
+from app.storage import StorageEngine
+
+from app.test.helpers import _call, _body, _headers
+
+
+def _samples(text: str) -> dict[str, float]:
+    """Metric samples of a Prometheus exposition by name and labels"""
+    samples: dict[str, float] = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            samples[name] = float(value)
+    return samples
+
+
+class MetricsTestSuite(TestCase):
+    def test_histogram_quantiles(self):
+        """Test that quantiles are within a bucket width of the exact ones"""
+        rng = random.Random(3)
+        values = sorted(int(rng.lognormvariate(6, 1.5)) for _ in range(100_000))
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+
+        for q in (0.5, 0.99, 0.999):
+            with self.subTest(q=q):
+                exact = values[int(q * len(values)) - 1] / 1e6
+                self.assertGreaterEqual(histogram.quantile(q), exact)
+                self.assertLessEqual(histogram.quantile(q), exact * 1.25 + 1e-6)
+        self.assertEqual(list(histogram.cumulative())[-1][1], sum(1 for value in values if value <= 1 << 25))
+
+    def test_histogram_bounds(self):
+        """Test that values on an exported bound are counted in its bucket, as le means less or equal"""
+        histogram = Histogram()
+        for value in (0, 16, 17, 32, 33):
+            histogram.record(value)
+        cumulative = dict(histogram.cumulative())
+        self.assertEqual((cumulative[16e-6], cumulative[32e-6], cumulative[64e-6]), (2, 4, 5))
+
+    def test_hot_keys(self):
+        """Test that the sketch finds the most requested keys among many cold ones"""
+        hot_keys = HotKeys(k=5, width=512)
+        rng = random.Random(5)
+        requests = [f"hot-{i}" for i in range(5) for _ in range(1000 * (i + 1))]
+        requests += [f"cold-{rng.randrange(50_000)}" for _ in range(50_000)]
+        rng.shuffle(requests)
+        for key in requests:
+            hot_keys.add(key)
+
+        top = hot_keys.top()
+        self.assertEqual([key for key, _ in top], [f"hot-{i}" for i in reversed(range(5))])
+        for key, count in top:
+            # estimates never undercount and collisions of a narrow sketch only add a little
+            self.assertGreaterEqual(count, 1000 * (int(key[-1]) + 1))
+            self.assertLess(count, 1000 * (int(key[-1]) + 1) + 500)
+
+    def test_endpoint(self):
+        """Test that /metrics reports requests by route and status, storage size and hot keys"""
+        app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), metrics=Metrics(hot_keys=2))
+        _call(app, "PUT", "/api/v1/storage/key", body=b"value")
+        for _ in range(3):
+            _call(app, "GET", "/api/v1/storage/key")
+        _call(app, "GET", "/api/v1/storage/missing")
+        _call(app, "GET", "/unknown/path")
+
+        messages = _call(app, "GET", "/metrics")
+        self.assertTrue(_headers(messages)[b"content-type"].startswith(b"text/plain; version=0.0.4"))
+        samples = _samples(_body(messages).decode())
+
+        key_route = 'method="GET",route="/api/v1/storage/{key}"'
+        self.assertEqual(samples[f'http_requests_total{{{key_route},status="200"}}'], 3)
+        self.assertEqual(samples[f'http_requests_total{{{key_route},status="404"}}'], 1)
+        self.assertEqual(samples['http_requests_total{method="PUT",route="/api/v1/storage/{key}",status="202"}'], 1)
+        self.assertEqual(samples['http_requests_total{method="*",route="unmatched",status="404"}'], 1)
+        self.assertEqual(samples[f'http_request_duration_seconds_count{{{key_route}}}'], 4)
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{key_route},le="+Inf"}}'], 4)
+        self.assertIn(f'http_request_latency_seconds{{{key_route},quantile="0.99"}}', samples)
+        self.assertEqual(samples["storage_keys"], 1)
+        self.assertGreater(samples["storage_bytes"], 0)
+        self.assertEqual(samples['storage_hot_key_requests{key="key"}'], 4)
+        self.assertEqual(samples['storage_hot_key_requests{key="missing"}'], 1)
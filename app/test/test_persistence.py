@@ -0,0 +1,121 @@
+import asyncio
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from app.persistence import Persistence
+from app.storage import StorageEngine
+
+
+def _storage() -> StorageEngine:
+    return StorageEngine(shards=4, max_bytes=16 * 1024 * 1024)
+
+
+class PersistenceTestSuite(TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self._tmp.name)
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _write(self, fsync_policy: str, snapshot: bool = False) -> StorageEngine:
+        async def run() -> StorageEngine:
+            storage = _storage()
+            persistence = Persistence(self.directory, fsync_policy=fsync_policy, snapshot_interval=3600)
+            await persistence.open(storage)
+
+            async def put(i: int) -> None:
+                storage.put(f"key-{i}", f"value-{i}".encode())
+                await persistence.log_put(f"key-{i}", f"value-{i}".encode())
+
+            await asyncio.gather(*(put(i) for i in range(100)))
+            if snapshot:
+                await persistence.snapshot()
+            storage.pop("key-0")
+            await persistence.log_delete("key-0")
+            storage.put("text", "hello")
+            await persistence.log_put("text", "hello")
+            await persistence.close()
+            return storage
+
+        return asyncio.run(run())
+
+    def _recover(self) -> StorageEngine:
+        async def run() -> StorageEngine:
+            storage = _storage()
+            persistence = Persistence(self.directory, snapshot_interval=3600)
+            await persistence.open(storage)
+            await persistence.close()
+            return storage
+
+        return asyncio.run(run())
+
+    def test_replay_log(self):
+        """Test that every fsync policy recovers the same state"""
+        for policy in ("always", "batch", "never"):
+            with self.subTest(policy=policy):
+                for path in self.directory.iterdir():
+                    path.unlink()
+                expected = self._write(policy)
+                recovered = self._recover()
+                self.assertEqual(recovered.copy(), expected.copy())
+                self.assertIsNone(recovered.get("key-0"))
+                self.assertEqual(recovered.get("text"), "hello")
+
+    def test_snapshot_compacts_log(self):
+        """Test that a snapshot drops covered segments and recovery combines it with the log tail"""
+        expected = self._write("batch", snapshot=True)
+        self.assertEqual(len(list(self.directory.glob("snapshot-*.snap"))), 1)
+        self.assertEqual(len(list(self.directory.glob("wal-*.log"))), 1)
+        self.assertEqual(self._recover().copy(), expected.copy())
+
+    def test_torn_tail(self):
+        """Test that a partially written last record is ignored and cut off"""
+        expected = self._write("batch")
+        segment = sorted(self.directory.glob("wal-*.log"))[-1]
+        size = segment.stat().st_size
+        with open(segment, "ab") as f:
+            f.write(b"\x01\x02\x03\x04\x01")
+
+        self.assertEqual(self._recover().copy(), expected.copy())
+        self.assertEqual(segment.stat().st_size, size)
+
+    def test_lifespan_recovery(self):
+        """Test that the app replays persisted mutations on lifespan startup"""
+        from app.app import ASGIApp
+
+        async def run_app(requests: list[tuple[str, str, bytes]]) -> ASGIApp:
+            app = ASGIApp(storage=_storage(), persistence=Persistence(self.directory, snapshot_interval=3600))
+            events: asyncio.Queue = asyncio.Queue()
+            sent: list[dict] = []
+
+            async def lifespan_send(msg: dict) -> None:
+                sent.append(msg)
+
+            lifespan = asyncio.create_task(app({"type": "lifespan"}, events.get, lifespan_send))
+            await events.put({"type": "lifespan.startup"})
+            while not sent:
+                await asyncio.sleep(0)
+            self.assertEqual(sent[0]["type"], "lifespan.startup.complete")
+
+            for method, path, body in requests:
+                async def receive() -> dict:
+                    return {"type": "http.request", "body": body, "more_body": False}
+
+                async def send(msg: dict) -> None:
+                    pass
+
+                await app({"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}, receive, send)
+
+            await events.put({"type": "lifespan.shutdown"})
+            await lifespan
+            return app
+
+        asyncio.run(run_app([
+            ("PUT", "/api/v1/storage/a", b"1"),
+            ("PUT", "/api/v1/storage/b", b"2"),
+            ("DELETE", "/api/v1/storage/a", b""),
+        ]))
+        app = asyncio.run(run_app([]))
+        self.assertEqual(app._storage.copy(), {"b": b"2"})
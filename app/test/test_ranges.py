@@ -0,0 +1,85 @@
+import re
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.storage import StorageEngine
+from app import etag, ranges, response
+
+from app.test.helpers import _call, _body, _headers
+
+
+class RangeParseTestSuite(TestCase):
+    def test_parse(self):
+        """Test single, open, suffix and overlapping ranges of a Range header"""
+        self.assertEqual(ranges.parse("bytes=0-9", 100), [(0, 10)])
+        self.assertEqual(ranges.parse("bytes=90-", 100), [(90, 100)])
+        self.assertEqual(ranges.parse("bytes=-10", 100), [(90, 100)])
+        self.assertEqual(ranges.parse("bytes=-500", 100), [(0, 100)])
+        self.assertEqual(ranges.parse("bytes=95-200", 100), [(95, 100)])
+        self.assertEqual(ranges.parse("bytes=50-59, 0-9, 5-19, 200-", 100), [(0, 20), (50, 60)])
+
+    def test_ignored_and_unsatisfiable(self):
+        """Test that malformed headers are ignored and ranges outside the value are rejected"""
+        for header in ("bytes=5-3", "bytes=a-b", "bytes=1", "items=0-1", "bytes=", "bytes=+1-2", ",".join(["bytes=0-0"] + ["1-1"] * ranges.MAX_RANGES)):
+            with self.subTest(header=header):
+                self.assertIsNone(ranges.parse(header, 100))
+        for header in ("bytes=100-", "bytes=-0", "bytes=200-300"):
+            with self.subTest(header=header):
+                with self.assertRaises(ranges.RangeNotSatisfiable):
+                    ranges.parse(header, 100)
+
+
+class RangeRequestTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=16 * 1024 * 1024))
+        self.value = bytes(range(256)) * 4
+        self.app._storage.put("blob", self.value)
+        self.tag = etag.format_etag(etag.compute(self.value))
+
+    def _get(self, *headers: tuple[bytes, bytes]) -> list:
+        return _call(self.app, "GET", "/api/v1/storage/blob", headers=list(headers))
+
+    def test_single_range(self):
+        """Test a 206 response with the requested bytes and their content-range"""
+        messages = self._get((b"range", b"bytes=10-19"))
+        self.assertEqual(messages[0]["status"], 206)
+        self.assertEqual(_headers(messages)[b"content-range"], b"bytes 10-19/1024")
+        self.assertEqual(_headers(messages)[b"content-length"], b"10")
+        self.assertEqual(_body(messages), self.value[10:20])
+
+        self.assertEqual(_headers(self._get())[b"accept-ranges"], b"bytes")
+        messages = self._get((b"range", b"bytes=2000-"))
+        self.assertEqual(messages[0]["status"], 416)
+        self.assertEqual(_headers(messages)[b"content-range"], b"bytes */1024")
+
+    def test_multiple_ranges(self):
+        """Test a multipart/byteranges response with one part per range"""
+        messages = self._get((b"range", b"bytes=0-3, -4"))
+        self.assertEqual(messages[0]["status"], 206)
+        content_type = _headers(messages)[b"content-type"].decode()
+        boundary = re.fullmatch(r"multipart/byteranges; boundary=(\w+)", content_type).group(1)
+        body = _body(messages)
+        self.assertEqual(int(_headers(messages)[b"content-length"]), len(body))
+        parts = body.split(f"--{boundary}".encode())
+        self.assertEqual(parts[-1], b"--\r\n")
+        self.assertEqual(parts[1], b"\r\ncontent-range: bytes 0-3/1024\r\n\r\n" + self.value[:4] + b"\r\n")
+        self.assertEqual(parts[2], b"\r\ncontent-range: bytes 1020-1023/1024\r\n\r\n" + self.value[-4:] + b"\r\n")
+
+    def test_if_range(self):
+        """Test that ranges only apply while If-Range matches the current version"""
+        messages = self._get((b"range", b"bytes=0-0"), (b"if-range", self.tag.encode()))
+        self.assertEqual((messages[0]["status"], _body(messages)), (206, self.value[:1]))
+        for if_range in (b'"stale"', b"W/" + self.tag.encode(), b"Wed, 21 Oct 2015 07:28:00 GMT"):
+            with self.subTest(if_range=if_range):
+                messages = self._get((b"range", b"bytes=0-0"), (b"if-range", if_range))
+                self.assertEqual((messages[0]["status"], _body(messages)), (200, self.value))
+
+    def test_large_value_chunked(self):
+        """Test that a large value goes out in several body messages"""
+        value = b"x" * (response.CHUNK_BYTES * 2 + 1)
+        self.app._storage.put("large", value)
+        messages = _call(self.app, "GET", "/api/v1/storage/large")
+        chunks = [msg for msg in messages if msg["type"] == "http.response.body"]
+        self.assertEqual([len(msg["body"]) for msg in chunks], [response.CHUNK_BYTES, response.CHUNK_BYTES, 1])
+        self.assertEqual([msg["more_body"] for msg in chunks], [True, True, False])
+        self.assertEqual(_body(messages), value)
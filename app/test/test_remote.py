@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import tempfile
+from typing import Any
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.persistence import Persistence
+from app.remote import StorageOwner, RemoteStore, StorageUnavailable, start_owner
+from app.settings import Settings
+from app.store import LocalStore
+from app import batch, etag, watch
+from app.storage import StorageEngine
+
+
+async def _request(app: ASGIApp, method: str, path: str, body: bytes = b"", query_string: bytes = b"", headers: list[tuple[bytes, bytes]] | None = None) -> tuple[int, bytes]:
+    """Invoke the app from a running event loop, return status and body"""
+    sent: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(msg: dict[str, Any]) -> None:
+        sent.append(msg)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query_string, "headers": headers or []}
+    await app(scope, receive, send)
+    return sent[0]["status"], b"".join(msg["body"] for msg in sent[1:])
+
+
+class SharedStorageTestSuite(TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self._tmp.name, "storage.sock")
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _run(self, scenario, persistence: bool = False) -> StorageEngine:
+        storage = StorageEngine(shards=4, max_bytes=1024 * 1024)
+
+        async def run() -> None:
+            owner = StorageOwner(LocalStore(storage, Persistence(self._tmp.name, fsync_policy="never") if persistence else None), self.socket)
+            await owner.start()
+            workers = [ASGIApp(store=RemoteStore(self.socket)) for _ in range(2)]
+            for worker in workers:
+                await worker._store.open()
+            try:
+                await scenario(*workers)
+            finally:
+                for worker in workers:
+                    await worker._store.close()
+                await owner.close()
+
+        asyncio.run(run())
+        return storage
+
+    def test_workers_share_storage(self):
+        """Test that a value put through one worker is visible to the other one"""
+        async def scenario(first: ASGIApp, second: ASGIApp) -> None:
+            self.assertEqual((await _request(first, "PUT", "/api/v1/storage/key", b"value"))[0], 202)
+            self.assertEqual(await _request(second, "GET", "/api/v1/storage/key"), (200, b"value"))
+            self.assertEqual((await _request(second, "PUT", "/api/v1/storage", query_string=b"text=hello"))[0], 202)
+            self.assertEqual(await _request(first, "GET", "/api/v1/storage/text"), (200, b"hello"))
+            self.assertEqual((await _request(first, "DELETE", "/api/v1/storage/key"))[0], 200)
+            self.assertEqual((await _request(second, "GET", "/api/v1/storage/key"))[0], 404)
+            self.assertEqual((await _request(second, "PUT", "/api/v1/storage/big", b"x" * 2 * 1024 * 1024))[0], 413)
+
+            tag = etag.format_etag(etag.compute(b"hello")).encode()
+            self.assertEqual(await _request(first, "GET", "/api/v1/storage/text", headers=[(b"if-none-match", tag)]), (304, b""))
+            self.assertEqual((await _request(second, "PUT", "/api/v1/storage/text", b"new", headers=[(b"if-match", b'"stale"')]))[0], 412)
+            self.assertEqual((await _request(second, "DELETE", "/api/v1/storage/text", headers=[(b"if-match", b'"stale"')]))[0], 412)
+
+            self.assertEqual((await _request(first, "PUT", "/api/v1/storage/session", b"token", headers=[(b"x-ttl", b"60")]))[0], 202)
+            self.assertEqual((await _request(second, "POST", "/api/v1/storage:mset", batch.encode_items([("batch", b"v")]), headers=[(b"x-ttl", b"60")]))[0], 202)
+
+            status, body = await _request(second, "GET", "/api/v1/storage", query_string=b"start=b&end=t&limit=1")
+            self.assertEqual(([json.loads(line)["key"] for line in body.splitlines()], status), (["batch"], 200))
+            self.assertEqual(await second._store.range_scan("b", "t", "batch"), (None, [("session", b"token")]))
+
+            status, body = await _request(first, "GET", "/api/v1/stats")
+            self.assertEqual(json.loads(body)["storage"]["keys"], 3)
+            # nothing was compressed, so the workers never loaded lz4
+            self.assertIsNone(first._store._compressor)
+
+        storage = self._run(scenario)
+        self.assertEqual(storage.copy(), {"text": "hello", "session": b"token", "batch": b"v"})
+        self.assertIsNone(storage.expires_at("text"))
+        self.assertIsNotNone(storage.expires_at("session"))
+        self.assertIsNotNone(storage.expires_at("batch"))
+
+    def test_changes_reach_every_worker(self):
+        """Test that watchers of one worker are notified of changes made through the other one"""
+        async def scenario(first: ASGIApp, second: ASGIApp) -> None:
+            subscriber = second._watch.subscriber(with_values=True)
+            second._watch.subscribe(subscriber, prefixes=["user:"])
+            self.assertEqual((await _request(first, "PUT", "/api/v1/storage/user:1", b"alice"))[0], 202)
+            self.assertEqual((await _request(first, "PUT", "/api/v1/storage/other", b"x"))[0], 202)
+            self.assertEqual((await _request(first, "DELETE", "/api/v1/storage/user:1"))[0], 200)
+            events: list[dict[str, Any]] = []
+            while len(events) < 2:
+                events += [json.loads(message) for message in await asyncio.wait_for(subscriber.next_messages(), 1)]
+            self.assertEqual([(event["event"], event["key"], event.get("value")) for event in events],
+                             [(watch.PUT, "user:1", "alice"), (watch.DELETE, "user:1", None)])
+
+        self._run(scenario)
+
+    def test_concurrent_batches(self):
+        """Test pipelined batch requests of several workers against a durable owner"""
+        async def scenario(first: ASGIApp, second: ASGIApp) -> None:
+            async def mset(app: ASGIApp, start: int) -> int:
+                items = [(f"key-{i}", f"value-{i}".encode()) for i in range(start, start + 100)]
+                return (await _request(app, "POST", "/api/v1/storage:mset", batch.encode_items(items)))[0]
+
+            statuses = await asyncio.gather(*(mset(app, i * 100) for i, app in enumerate([first, second] * 5)))
+            self.assertEqual(statuses, [202] * 10)
+
+            keys = ["key-0", "missing", "key-999"]
+            status, body = await _request(second, "POST", "/api/v1/storage:mget", batch.encode_keys(keys))
+            self.assertEqual(batch.decode_values(body), [b"value-0", None, b"value-999"])
+
+            status, body = await _request(first, "POST", "/api/v1/storage:mdel", batch.encode_keys(keys))
+            self.assertEqual(body, b"\x01\x00\x01")
+
+            status, body = await _request(second, "GET", "/api/v1/storage")
+            self.assertEqual(len(body.splitlines()), 998)
+
+        self._run(scenario, persistence=True)
+        self.assertEqual(len(self._run(lambda *workers: asyncio.sleep(0), persistence=True)), 998)
+
+    def test_owner_lost(self):
+        """Test that requests fail right away once the owner is gone and the worker reconnects to a new one"""
+        process, path = start_owner(Settings(), self.socket)
+
+        async def run() -> None:
+            app = ASGIApp(store=RemoteStore(path))
+            await app._store.open()
+            try:
+                self.assertEqual((await _request(app, "PUT", "/api/v1/storage/key", b"value"))[0], 202)
+                process.kill()
+                process.join()
+                with self.assertRaises(StorageUnavailable):
+                    await asyncio.wait_for(app._store.get("key"), 3)
+                status, _ = await asyncio.wait_for(_request(app, "GET", "/api/v1/storage/key"), 3)
+                self.assertEqual(status, 503)
+
+                owner = StorageOwner(LocalStore(StorageEngine(shards=2, max_bytes=1024 * 1024)), path)
+                await owner.start()
+                try:
+                    # the first attempts wait for the reconnect delay
+                    for _ in range(50):
+                        status, _ = await _request(app, "GET", "/api/v1/storage/key")
+                        if status != 503:
+                            break
+                        await asyncio.sleep(0.05)
+                    self.assertEqual(status, 404)
+                finally:
+                    await owner.close()
+            finally:
+                await app._store.close()
+
+        try:
+            asyncio.run(run())
+        finally:
+            process.kill()
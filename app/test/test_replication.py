@@ -0,0 +1,214 @@
+import asyncio
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.settings import Settings
+from app.store import LocalStore
+from app.storage import StorageEngine
+from app.replication import ReplicationLog, Follower, stream
+from app.test.helpers import _call, _body, _headers
+
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+async def _follow(log: ReplicationLog, leader: LocalStore, follower: Follower, since: int, epoch: str, until) -> None:
+    """Stream the log of a leader into a follower until until() holds"""
+    reader = asyncio.StreamReader()
+
+    async def send(frame: bytes) -> None:
+        reader.feed_data(frame)
+
+    streaming = asyncio.create_task(stream(log, leader.storage, since, epoch, send, heartbeat=0.01, chunk_keys=2))
+    consuming = asyncio.create_task(follower.consume(reader))
+    try:
+        for _ in range(200):
+            await asyncio.sleep(0.005)
+            if until():
+                return
+        raise AssertionError("follower didn't catch up")
+    finally:
+        streaming.cancel()
+        consuming.cancel()
+        await asyncio.gather(streaming, consuming, return_exceptions=True)
+
+
+class ReplicationLogTestSuite(TestCase):
+    def test_since_and_trim(self):
+        """Test that entries are returned after a sequence number while the log still holds them"""
+        log = ReplicationLog(max_bytes=200)
+        self.assertEqual(log.since(0), [])
+        self.assertIsNone(log.since(1))
+        for i in range(10):
+            log.log_put(f"key-{i}", b"x" * 20)
+        self.assertEqual(log.seq, 10)
+        self.assertEqual([seq for seq, _, _ in log.since(8)], [9, 10])
+        self.assertEqual(log.since(10), [])
+        # the oldest entries were dropped to stay within max_bytes
+        self.assertIsNone(log.since(0))
+        log.log_delete_many([])
+        self.assertEqual(log.seq, 10)
+
+    def test_wait(self):
+        """Test that waiters wake up on the next append, or time out"""
+        async def run() -> tuple[bool, bool]:
+            log = ReplicationLog()
+            waiting = asyncio.create_task(log.wait(0, 1))
+            await asyncio.sleep(0)
+            log.log_clear()
+            return await waiting, await log.wait(1, 0.01)
+
+        self.assertEqual(asyncio.run(run()), (True, False))
+
+
+class StreamTestSuite(TestCase):
+    def test_snapshot_then_records(self):
+        """Test that a new follower gets a snapshot, then every mutation in order"""
+        async def run() -> None:
+            leader = LocalStore(StorageEngine(shards=2, max_bytes=1024 * 1024))
+            log = leader.replication = ReplicationLog()
+            for i in range(5):
+                await leader.put(f"key-{i}", f"value-{i}".encode())
+            await leader.put("text", "str value", ttl=60)
+
+            replica = LocalStore(StorageEngine(shards=2, max_bytes=1024 * 1024))
+            await replica.put("stale", b"dropped by the snapshot")
+            follower = Follower("http://leader", replica)
+
+            async def writes() -> None:
+                await asyncio.sleep(0.02)
+                await leader.put_many([("a", b"1"), ("b", b"2")])
+                await leader.delete_many(["key-0", "missing"])
+                await leader.put("key-1", b"changed")
+
+            writing = asyncio.create_task(writes())
+            await _follow(log, leader, follower, 0, "", lambda: follower.applied == log.seq and writing.done())
+            self.assertEqual(dict(replica.storage.items()), dict(leader.storage.items()))
+            self.assertNotIn("stale", replica.storage)
+            self.assertEqual(replica.storage.get("text"), "str value")
+            self.assertIsNotNone(replica.storage.expires_at("text"))
+            self.assertEqual(follower.stats["snapshots"], 1)
+            self.assertEqual(follower.stats["lag_entries"], 0)
+
+            # reconnecting with the same epoch continues from the last applied sequence number
+            await leader.clear()
+            await leader.put("after", b"clear")
+            await _follow(log, leader, follower, follower.applied, log.epoch, lambda: follower.applied == log.seq)
+            self.assertEqual(dict(replica.storage.items()), {"after": b"clear"})
+            self.assertEqual(follower.stats["snapshots"], 1)
+
+        asyncio.run(run())
+
+    def test_resync(self):
+        """Test that a follower behind the log or of another epoch gets a fresh snapshot"""
+        async def run() -> None:
+            leader = LocalStore(StorageEngine(shards=2, max_bytes=1024 * 1024))
+            log = leader.replication = ReplicationLog(max_bytes=64)
+            replica = LocalStore(StorageEngine(shards=2, max_bytes=1024 * 1024))
+            follower = Follower("http://leader", replica)
+            await leader.put("first", b"1")
+            await _follow(log, leader, follower, 0, "", lambda: follower.applied == log.seq)
+
+            for i in range(10):
+                await leader.put(f"key-{i}", b"x" * 32)
+            await _follow(log, leader, follower, follower.applied, log.epoch, lambda: follower.applied == log.seq)
+            self.assertEqual(follower.snapshots, 2)
+
+            await _follow(log, leader, follower, follower.applied, "another epoch", lambda: follower.snapshots == 3 and follower.applied == log.seq)
+            self.assertEqual(dict(replica.storage.items()), dict(leader.storage.items()))
+
+        asyncio.run(run())
+
+
+class EndpointTestSuite(TestCase):
+    def test_roles(self):
+        """Test that only a leader streams and that followers redirect writes to it"""
+        app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), settings=Settings())
+        self.assertEqual(_call(app, "GET", "/api/v1/replication")[0]["status"], 404)
+
+        leader = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), settings=Settings(replication_role="leader"))
+        self.assertEqual(_call(leader, "GET", "/api/v1/replication", query_string=b"since=x")[0]["status"], 400)
+        _call(leader, "PUT", "/api/v1/storage/key", b"value")
+        self.assertEqual(json.loads(_body(_call(leader, "GET", "/api/v1/stats")))["replication"]["seq"], 1)
+
+        follower = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), settings=Settings(replication_role="follower", replication_leader="http://leader:5051/"))
+        messages = _call(follower, "PUT", "/api/v1/storage/a key", b"value", query_string=b"ttl=5")
+        self.assertEqual(messages[0]["status"], 307)
+        self.assertEqual(_headers(messages)[b"location"], b"http://leader:5051/api/v1/storage/a%20key?ttl=5")
+        self.assertEqual(_call(follower, "GET", "/api/v1/storage/key")[0]["status"], 404)
+
+        with self.assertRaises(ValueError):
+            ASGIApp(storage=StorageEngine(), settings=Settings(replication_role="follower"))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _request(port: int, method: str, path: str, body: bytes = b"") -> tuple[int, bytes]:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+    try:
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+class TwoProcessTestSuite(TestCase):
+    def _start(self, **env: str) -> subprocess.Popen:
+        server = subprocess.Popen(
+            [sys.executable, "__main__.py"], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env=os.environ | {"WORKERS": "1", "REPLICATION_HEARTBEAT": "0.1"} | env,
+        )
+        self.addCleanup(self._stop, server)
+        return server
+
+    def _stop(self, server: subprocess.Popen) -> None:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(5)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def _until(self, check, timeout: float = 20.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if result := check():
+                    return result
+            except OSError:
+                pass
+            time.sleep(0.05)
+        self.fail("timed out")
+
+    def test_leader_and_follower(self):
+        """Test a follower process catching up with a leader process and following its writes"""
+        leader_port, follower_port = _free_port(), _free_port()
+        self._start(PORT=str(leader_port), REPLICATION_ROLE="leader")
+        self._until(lambda: _request(leader_port, "GET", "/api/v1/stats")[0] == 200)
+        self.assertEqual(_request(leader_port, "PUT", "/api/v1/storage/before", b"1")[0], 202)
+
+        self._start(PORT=str(follower_port), REPLICATION_ROLE="follower", REPLICATION_LEADER=f"http://127.0.0.1:{leader_port}")
+        self._until(lambda: _request(follower_port, "GET", "/api/v1/storage/before") == (200, b"1"))
+
+        self.assertEqual(_request(leader_port, "PUT", "/api/v1/storage/after", b"2")[0], 202)
+        self.assertEqual(_request(leader_port, "DELETE", "/api/v1/storage/before")[0], 200)
+        self._until(lambda: _request(follower_port, "GET", "/api/v1/storage/before")[0] == 404)
+        self.assertEqual(_request(follower_port, "GET", "/api/v1/storage/after"), (200, b"2"))
+        self.assertEqual(_request(follower_port, "PUT", "/api/v1/storage/key", b"v")[0], 307)
+
+        stats = json.loads(_request(follower_port, "GET", "/api/v1/stats")[1])["replication"]
+        self.assertEqual((stats["connected"], stats["applied"], stats["lag_entries"]), (True, 3, 0))
@@ -0,0 +1,42 @@
+import asyncio
+from http import HTTPStatus
+from typing import Any
+from unittest import TestCase
+
+from app import response
+
+
+def _send(*args: Any, **kwargs: Any) -> list[dict[str, Any]]:
+    sent: list[dict[str, Any]] = []
+
+    async def send(msg: dict[str, Any]) -> None:
+        sent.append(msg)
+
+    asyncio.run(response.send_response(send, *args, **kwargs))
+    return sent
+
+
+class ResponseTestSuite(TestCase):
+    def test_headers(self):
+        """Test content-type, content-length and extra headers of responses"""
+        start, body = _send(HTTPStatus.NOT_FOUND, b"missing", response.TEXT, {"ETag": '"1-2"'})
+        self.assertEqual(start["status"], HTTPStatus.NOT_FOUND)
+        self.assertEqual(start["headers"], [(b"content-type", b"text/plain"), (b"content-length", b"7"), (b"etag", b'"1-2"')])
+        self.assertEqual(body, {"type": "http.response.body", "body": b"missing", "more_body": False})
+
+        start, _ = _send(HTTPStatus.OK, b"x" * 100_000)
+        self.assertEqual(start["headers"], [(b"content-length", b"100000")])
+        start, _ = _send(HTTPStatus.NOT_MODIFIED, headers={"etag": '"1-2"'})
+        self.assertEqual(start["headers"], [(b"etag", b'"1-2"')])
+
+    def test_shared_messages(self):
+        """Test that empty responses reuse their messages and memoryview bodies aren't copied"""
+        first = _send(HTTPStatus.ACCEPTED)
+        self.assertEqual(first[0]["headers"], [(b"content-length", b"0")])
+        second = _send(HTTPStatus.ACCEPTED)
+        self.assertIs(first[0], second[0])
+        self.assertIs(first[1], second[1])
+
+        view = memoryview(b"value")
+        _, body = _send(HTTPStatus.OK, view)
+        self.assertIs(body["body"], view)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from app.router import Router, RouteNotFound, MethodNotAllowed
+
+
+async def _collection(scope, receive, send) -> None: ...
+async def _item(scope, receive, send, key) -> None: ...
+
+
+class RouterTestSuite(TestCase):
+    def setUp(self) -> None:
+        self.router = Router()
+        self.router.add_route("GET", "/api/v1/storage", _collection)
+        self.router.add_route("GET", "/api/v1/storage/{key}", _item)
+        self.router.add_route("PUT", "/api/v1/storage/{key}", _item)
+
+    def test_resolve(self):
+        """Test that static and parametrized routes are resolved"""
+        self.assertEqual(self.router.resolve("GET", "/api/v1/storage"), (_collection, ()))
+        self.assertEqual(self.router.resolve("GET", "/api/v1/storage/"), (_collection, ()))
+        self.assertEqual(self.router.resolve("PUT", "/api/v1/storage/book"), (_item, ("book", )))
+
+    def test_not_found(self):
+        """Test unknown paths"""
+        for path in ("/api/v2/storage", "/api/v1/storage/a/b", "/api", "/"):
+            with self.assertRaises(RouteNotFound):
+                self.router.resolve("GET", path)
+
+    def test_method_not_allowed(self):
+        """Test that a known path with unknown method reports allowed methods"""
+        with self.assertRaises(MethodNotAllowed) as ex:
+            self.router.resolve("POST", "/api/v1/storage/book")
+        self.assertEqual(set(ex.exception.allowed), {"GET", "PUT"})
+
+    def test_duplicate_route(self):
+        """Test that registering the same route twice fails"""
+        with self.assertRaises(ValueError):
+            self.router.add_route("GET", "/api/v1/storage/{id}", _item)
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from app.storage import StorageEngine, EntryTooLargeError, entry_size
+
+
+class StorageEngineTestSuite(TestCase):
+    def test_put_get_pop(self):
+        """Test basic storage operations"""
+        storage = StorageEngine(shards=4, max_bytes=1024 * 1024)
+        storage.put("key", b"value")
+        self.assertEqual(storage.get("key"), b"value")
+        self.assertIn("key", storage)
+        self.assertEqual(storage.pop("key"), b"value")
+        self.assertIsNone(storage.get("key"))
+
+        with self.assertRaises(KeyError):
+            storage.pop("key")
+
+    def test_lru_eviction(self):
+        """Test that least recently used entries are evicted once the budget is exceeded"""
+        budget = 3 * entry_size("k0", b"x" * 100)
+        storage = StorageEngine(shards=1, max_bytes=budget, eviction_policy="lru")
+        for i in range(3):
+            storage.put(f"k{i}", b"x" * 100)
+
+        # touch k0 so k1 becomes the oldest one
+        storage.get("k0")
+        storage.put("k3", b"x" * 100)
+
+        self.assertIsNone(storage.get("k1"))
+        self.assertIsNotNone(storage.get("k0"))
+        self.assertEqual(storage.stats.evictions, 1)
+        self.assertLessEqual(storage.stats.bytes_used, budget)
+
+    def test_clock_eviction(self):
+        """Test that CLOCK gives referenced entries a second chance"""
+        budget = 3 * entry_size("k0", b"x" * 100)
+        storage = StorageEngine(shards=1, max_bytes=budget, eviction_policy="clock")
+        for i in range(3):
+            storage.put(f"k{i}", b"x" * 100)
+
+        storage.get("k0")
+        storage.put("k3", b"x" * 100)
+
+        self.assertIsNone(storage.get("k1"))
+        self.assertIsNotNone(storage.get("k0"))
+        self.assertEqual(len(storage), 3)
+
+    def test_memory_stays_bounded(self):
+        """Test that writing many more keys than fit keeps memory usage within the budget"""
+        budget = 64 * 1024
+        storage = StorageEngine(shards=8, max_bytes=budget)
+        for i in range(10_000):
+            storage.put(f"key-{i}", b"v" * 32)
+
+        stats = storage.stats
+        self.assertLessEqual(stats.bytes_used, budget)
+        self.assertGreater(stats.evictions, 0)
+        self.assertEqual(stats.keys, len(storage))
+
+    def test_entry_too_large(self):
+        """Test that entries bigger than a shard budget are rejected"""
+        storage = StorageEngine(shards=2, max_bytes=1024)
+        with self.assertRaises(EntryTooLargeError):
+            storage.put("key", b"x" * 1024)
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+from typing import Any
+from unittest import TestCase
+
+from app.app import ASGIApp
+from app.settings import Settings
+from app.storage import StorageEngine
+from app.watch import WatchHub, DISCONNECT
+from app import etag, watch
+
+
+def _drain(hub_subscriber) -> list[dict[str, Any]]:
+    return [json.loads(text) for text in asyncio.run(hub_subscriber.next_messages())]
+
+
+class WatchHubTestSuite(TestCase):
+    def test_matching(self):
+        """Test that subscribers get changes of their keys and prefixes, each change once"""
+        hub = WatchHub()
+        exact = hub.subscriber()
+        both = hub.subscriber(with_values=True)
+        hub.subscribe(exact, keys=["user:1"])
+        hub.subscribe(both, keys=["user:1"], prefixes=["user:", "u"])
+
+        hub.publish(watch.PUT, "user:1", etag.compute(b"v1"), b"v1")
+        hub.publish(watch.DELETE, "user:2")
+        hub.publish(watch.PUT, "other", 1, b"v")
+        self.assertEqual(_drain(exact), [{"event": "put", "key": "user:1", "etag": etag.format_etag(etag.compute(b"v1"))}])
+        self.assertEqual([(event["event"], event["key"], event.get("value")) for event in _drain(both)],
+                         [("put", "user:1", "v1"), ("delete", "user:2", None)])
+
+        hub.unsubscribe(both, prefixes=["user:", "u"])
+        hub.publish(watch.DELETE, "user:2")
+        hub.publish(watch.CLEAR)
+        self.assertEqual(_drain(both), [{"event": "clear"}])
+        hub.remove(exact)
+        hub.remove(both)
+        self.assertEqual((len(hub), hub._keys, hub._prefixes, hub._prefix_lengths), (0, {}, {}, {}))
+
+    def test_slow_consumers(self):
+        """Test that full queues drop events or disconnect, without blocking the publisher"""
+        hub = WatchHub(max_queue=2)
+        subscriber = hub.subscriber()
+        hub.subscribe(subscriber, prefixes=[""])
+        for i in range(5):
+            hub.publish(watch.DELETE, f"key-{i}")
+        self.assertEqual(_drain(subscriber), [{"event": "dropped", "count": 3}, {"event": "delete", "key": "key-0"}, {"event": "delete", "key": "key-1"}])
+
+        hub = WatchHub(max_queue=2, policy=DISCONNECT)
+        subscriber = hub.subscriber()
+        hub.subscribe(subscriber, keys=["key"])
+        for _ in range(3):
+            hub.publish(watch.DELETE, "key")
+        self.assertTrue(subscriber.overflowed)
+        self.assertEqual(asyncio.run(subscriber.next_messages()), [])
+
+    def test_fan_out_encodes_once(self):
+        """Test that thousands of subscribers share a single encoded event"""
+        hub = WatchHub()
+        subscribers = [hub.subscriber(with_values=True) for _ in range(5000)]
+        for subscriber in subscribers:
+            hub.subscribe(subscriber, keys=["hot"])
+        hub.publish(watch.PUT, "hot", 1, b"value")
+        messages = [asyncio.run(subscriber.next_messages())[0] for subscriber in subscribers[:100]]
+        self.assertTrue(all(message is messages[0] for message in messages))
+
+
+class WatchEndpointTestSuite(TestCase):
+    def test_websocket(self):
+        """Test a watch connection receiving changes made over HTTP, including expiry"""
+        app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), settings=Settings())
+
+        async def http(method: str, path: str, body: bytes = b"", headers: list[tuple[bytes, bytes]] | None = None) -> int:
+            sent: list[dict[str, Any]] = []
+
+            async def receive() -> dict[str, Any]:
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(msg: dict[str, Any]) -> None:
+                sent.append(msg)
+
+            await app({"type": "http", "method": method, "path": path, "query_string": b"", "headers": headers or []}, receive, send)
+            return sent[0]["status"]
+
+        async def run() -> list[dict[str, Any]]:
+            incoming: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+            sent: list[dict[str, Any]] = []
+            await incoming.put({"type": "websocket.connect"})
+
+            async def send(msg: dict[str, Any]) -> None:
+                sent.append(msg)
+
+            scope = {"type": "websocket", "path": "/api/v1/watch", "query_string": b"key=a&values=1", "headers": []}
+            connection = asyncio.create_task(app(scope, incoming.get, send))
+            await asyncio.sleep(0)
+            await incoming.put({"type": "websocket.receive", "text": json.dumps({"op": "subscribe", "prefixes": ["session:"]})})
+            await incoming.put({"type": "websocket.receive", "text": "not json"})
+            await asyncio.sleep(0)
+
+            await http("PUT", "/api/v1/storage/a", b"1")
+            await http("PUT", "/api/v1/storage/b", b"2")
+            await http("PUT", "/api/v1/storage/session:1", b"3", headers=[(b"x-ttl", b"0.01")])
+            await http("DELETE", "/api/v1/storage/a")
+            # as if the expiry loop ran a second later
+            app._storage.expire_due(time.time() + 1)
+            await asyncio.sleep(0)
+
+            await incoming.put({"type": "websocket.disconnect"})
+            await asyncio.wait_for(connection, 1)
+            self.assertEqual(sent[0], {"type": "websocket.accept"})
+            return [json.loads(msg["text"]) for msg in sent[1:]]
+
+        events = asyncio.run(run())
+        self.assertEqual([(event["event"], event["key"], event.get("value")) for event in events],
+                         [("put", "a", "1"), ("put", "session:1", "3"), ("delete", "a", None), ("expire", "session:1", None)])
+        self.assertEqual(len(app._watch), 0)
+
+    def test_unknown_path(self):
+        """Test that a WebSocket handshake on another path is rejected"""
+        app = ASGIApp(storage=StorageEngine(shards=2, max_bytes=1024 * 1024), settings=Settings())
+        sent: list[dict[str, Any]] = []
+
+        async def receive() -> dict[str, Any]:
+            return {"type": "websocket.connect"}
+
+        async def send(msg: dict[str, Any]) -> None:
+            sent.append(msg)
+
+        asyncio.run(app({"type": "websocket", "path": "/other", "query_string": b"", "headers": []}, receive, send))
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 1008}])
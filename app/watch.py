@@ -0,0 +1,215 @@
+import asyncio
+import base64
+import json
+from collections import deque
+from typing import Any, Optional, Protocol
+
+from .settings import Settings
+from .storage import Value
+from . import etag
+
+
+PUT = "put"
+DELETE = "delete"
+EXPIRE = "expire"
+CLEAR = "clear"
+
+# What happens to a subscriber whose queue is full: events are dropped and the count is reported
+# with the next event delivered, or the subscriber is disconnected.
+DROP = "drop"
+DISCONNECT = "disconnect"
+
+
+class ChangeListener(Protocol):
+    """Receives the changes made to a store"""
+
+    def publish(self, kind: str, key: str = "", tag: Optional[int] = None, value: Optional[Value] = None) -> None:
+        ...
+
+
+class ChangeEvent:
+    """Change of a key, encoded at most once per format however many subscribers receive it"""
+
+    __slots__ = ("kind", "key", "etag", "value", "_with_value", "_version_only")
+
+    def __init__(self, kind: str, key: str = "", tag: Optional[int] = None, value: Optional[Value] = None) -> None:
+        self.kind = kind
+        self.key = key
+        self.etag = tag
+        self.value = value
+        self._with_value: Optional[str] = None
+        self._version_only: Optional[str] = None
+
+    def message(self, with_value: bool) -> str:
+        if with_value and self.value is not None:
+            if self._with_value is None:
+                self._with_value = self._encode(True)
+            return self._with_value
+        if self._version_only is None:
+            self._version_only = self._encode(False)
+        return self._version_only
+
+    def _encode(self, with_value: bool) -> str:
+        record: dict[str, Any] = {"event": self.kind}
+        if self.kind != CLEAR:
+            record["key"] = self.key
+        if self.etag is not None:
+            record["etag"] = etag.format_etag(self.etag)
+        if with_value:
+            value = self.value
+            if isinstance(value, str):
+                record["value"] = value
+            else:
+                try:
+                    record["value"] = str(value, "utf-8")
+                except UnicodeDecodeError:
+                    # NOTE: Binary values can't be represented in json directly.
+                    record["value"] = base64.b64encode(value).decode()
+                    record["encoding"] = "base64"
+        return json.dumps(record)
+
+
+class Subscriber:
+    """Connection watching keys, events wait in a bounded queue until they are sent"""
+
+    def __init__(self, with_values: bool = False, max_queue: int = 1000, policy: str = DROP) -> None:
+        self.with_values = with_values
+        self.keys: set[str] = set()
+        self.prefixes: set[str] = set()
+        self.dropped = 0
+        self.closed = False
+        # True if the subscriber was disconnected for falling behind
+        self.overflowed = False
+        self._max_queue = max_queue
+        self._policy = policy
+        self._queue: deque[ChangeEvent] = deque()
+        self._ready = asyncio.Event()
+
+    def offer(self, event: ChangeEvent) -> None:
+        """Queue an event, never blocks"""
+        if len(self._queue) >= self._max_queue:
+            if self._policy == DISCONNECT:
+                self.overflowed = True
+                self.close()
+            else:
+                self.dropped += 1
+            return
+        self._queue.append(event)
+        if not self._ready.is_set():
+            self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def next_messages(self) -> list[str]:
+        """Wait for events, returns their messages, empty once the subscriber is closed"""
+        while not self._queue and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        if self.closed:
+            return []
+        messages: list[str] = []
+        if self.dropped:
+            # NOTE: The client missed events, it has to read the keys it watches again.
+            messages.append(json.dumps({"event": "dropped", "count": self.dropped}))
+            self.dropped = 0
+        queue = self._queue
+        with_values = self.with_values
+        while queue:
+            messages.append(queue.popleft().message(with_values))
+        return messages
+
+
+class WatchHub:
+    """Routes changes of keys to the subscribers watching them.
+
+    Subscribers are indexed by exact key and by prefix, a change looks up its key once and
+    each distinct prefix length once, so a write costs nothing without subscribers and
+    O(matching subscribers) otherwise. Publishing only appends the shared event to the
+    subscribers' queues, the writer never waits for a subscriber.
+    """
+
+    def __init__(self, max_queue: int = 1000, policy: str = DROP, max_value_bytes: int = 64 * 1024) -> None:
+        if policy not in (DROP, DISCONNECT):
+            raise ValueError(f"unknown slow consumer policy {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.max_value_bytes = max_value_bytes
+        self._subscribers: set[Subscriber] = set()
+        self._keys: dict[str, set[Subscriber]] = {}
+        self._prefixes: dict[str, set[Subscriber]] = {}
+        # number of watched prefixes of every length
+        self._prefix_lengths: dict[int, int] = {}
+        self.published = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "WatchHub":
+        return cls(max_queue=settings.watch_queue_size, policy=settings.watch_slow_consumer, max_value_bytes=settings.watch_max_value_bytes)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscriber(self, with_values: bool = False) -> Subscriber:
+        subscriber = Subscriber(with_values, self.max_queue, self.policy)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def subscribe(self, subscriber: Subscriber, keys: list[str] = [], prefixes: list[str] = []) -> None:
+        for key in keys:
+            if key not in subscriber.keys:
+                subscriber.keys.add(key)
+                self._keys.setdefault(key, set()).add(subscriber)
+        for prefix in prefixes:
+            if prefix not in subscriber.prefixes:
+                subscriber.prefixes.add(prefix)
+                watchers = self._prefixes.setdefault(prefix, set())
+                if not watchers:
+                    self._prefix_lengths[len(prefix)] = self._prefix_lengths.get(len(prefix), 0) + 1
+                watchers.add(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber, keys: list[str] = [], prefixes: list[str] = []) -> None:
+        for key in keys:
+            if key in subscriber.keys:
+                subscriber.keys.discard(key)
+                watchers = self._keys[key]
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self._keys[key]
+        for prefix in prefixes:
+            if prefix in subscriber.prefixes:
+                subscriber.prefixes.discard(prefix)
+                watchers = self._prefixes[prefix]
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self._prefixes[prefix]
+                    self._prefix_lengths[len(prefix)] -= 1
+                    if not self._prefix_lengths[len(prefix)]:
+                        del self._prefix_lengths[len(prefix)]
+
+    def remove(self, subscriber: Subscriber) -> None:
+        self.unsubscribe(subscriber, list(subscriber.keys), list(subscriber.prefixes))
+        self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def publish(self, kind: str, key: str = "", tag: Optional[int] = None, value: Optional[Value] = None) -> None:
+        """Notify the subscribers watching key, all of them for CLEAR"""
+        if not self._subscribers:
+            return
+        if kind == CLEAR:
+            targets: Optional[set[Subscriber]] = self._subscribers
+        else:
+            targets = self._keys.get(key)
+            for length in self._prefix_lengths:
+                if length <= len(key) and (watchers := self._prefixes.get(key[:length])):
+                    # NOTE: A subscriber matching the key in several ways gets the event once.
+                    targets = watchers if not targets else targets | watchers
+        if not targets:
+            return
+        if value is not None and len(value) > self.max_value_bytes:
+            # large values are left out, subscribers get the version and read the value if they need it
+            value = None
+        event = ChangeEvent(kind, key, tag, value)
+        for subscriber in targets:
+            subscriber.offer(event)
+        self.published += 1
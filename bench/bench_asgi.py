@@ -0,0 +1,285 @@
+"""In-process benchmarks of the hot paths of the ASGI app, with a stored baseline to catch regressions.
+
+The app is called directly with synthetic scope, receive and send callables, so the figures
+contain no server or socket cost. Every result is the best of several rounds in nanoseconds per call.
+Results are stored relative to a fixed pure Python calibration loop, so a baseline recorded on one
+machine stays meaningful on another. app/test/test_benchmarks.py fails when a path gets slower than
+the baseline by more than BENCH_REGRESSION_THRESHOLD (1.5x by default). Being a timing test, it only
+runs with RUN_BENCH set, e.g. RUN_BENCH=1 python -m pytest app/test/test_benchmarks.py
+
+Run from the repository root:
+python -m bench.bench_asgi           compare against the baseline
+python -m bench.bench_asgi --save    record a new baseline, after a deliberate change in performance
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+from app.admission import AdmissionControl
+from app.app import ASGIApp
+from app.log import LogPipeline
+from app.settings import Settings
+from app.storage import StorageEngine
+
+
+BASELINE = Path(__file__).with_name("baseline.json")
+DEFAULT_THRESHOLD = 1.5
+
+Operation = Callable[[], Awaitable[Any]]
+
+# name -> (calls per round, setup returning the operation to time)
+BENCHMARKS: dict[str, tuple[int, Callable[[ASGIApp], Operation]]] = {}
+
+
+def _benchmark(name: str, number: int) -> Callable[[Callable[[ASGIApp], Operation]], Callable[[ASGIApp], Operation]]:
+    def register(setup: Callable[[ASGIApp], Operation]) -> Callable[[ASGIApp], Operation]:
+        BENCHMARKS[name] = (number, setup)
+        return setup
+    return register
+
+
+def _scope(method: str, path: str, query_string: bytes = b"", headers: Optional[list[tuple[bytes, bytes]]] = None) -> dict[str, Any]:
+    return {"type": "http", "method": method, "path": path, "query_string": query_string, "headers": headers or [], "extensions": {}}
+
+
+async def _discard(message: Any) -> None:
+    pass
+
+
+def _receiver(body: bytes, chunk_size: int) -> Callable[[], Callable[[], Awaitable[dict[str, Any]]]]:
+    """Factory of receive callables delivering body in chunks, one per call"""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+
+    def receiver() -> Callable[[], Awaitable[dict[str, Any]]]:
+        pending = iter(messages)
+
+        async def receive() -> dict[str, Any]:
+            return next(pending)
+        return receive
+    return receiver
+
+
+def _call(app: ASGIApp, scope: dict[str, Any], body: bytes = b"") -> Operation:
+    receiver = _receiver(body, len(body) or 1)
+    return lambda: app(scope, receiver(), _discard)
+
+
+@_benchmark("route GET /api/v1/storage/{key}", 20_000)
+def _get_key(app: ASGIApp) -> Operation:
+    return _call(app, _scope("GET", "/api/v1/storage/key-1"))
+
+
+@_benchmark("route GET missing key", 20_000)
+def _get_missing(app: ASGIApp) -> Operation:
+    return _call(app, _scope("GET", "/api/v1/storage/missing"))
+
+
+@_benchmark("route GET range of a key", 20_000)
+def _get_range(app: ASGIApp) -> Operation:
+    return _call(app, _scope("GET", "/api/v1/storage/key-1", headers=[(b"range", b"bytes=8-15")]))
+
+
+@_benchmark("route GET with admission control", 20_000)
+def _get_admitted(app: ASGIApp) -> Operation:
+    app._admission = AdmissionControl(max_in_flight=1000, rate=1e9, burst=1e9)
+    return _call(app, _scope("GET", "/api/v1/storage/key-1", headers=[(b"x-api-key", b"client")]))
+
+
+@_benchmark("route GET rejected with 503", 20_000)
+def _get_rejected(app: ASGIApp) -> Operation:
+    app._admission = AdmissionControl(max_in_flight=1)
+    app._admission.admit(_scope("GET", "/"))
+    return _call(app, _scope("GET", "/api/v1/storage/key-1"))
+
+
+@_benchmark("route PUT /api/v1/storage/{key}", 20_000)
+def _put_key(app: ASGIApp) -> Operation:
+    return _call(app, _scope("PUT", "/api/v1/storage/key-1", headers=[(b"content-length", b"64")]), b"v" * 64)
+
+
+@_benchmark("route not found", 20_000)
+def _not_found(app: ASGIApp) -> Operation:
+    return _call(app, _scope("GET", "/api/v2/unknown"))
+
+
+@_benchmark("router resolve", 100_000)
+def _resolve(app: ASGIApp) -> Operation:
+    async def resolve() -> None:
+        app._router.resolve("GET", "/api/v1/storage/key-1")
+    return resolve
+
+
+def _read_body(size: int, chunk_size: int, content_length: bool) -> Callable[[ASGIApp], Operation]:
+    def setup(app: ASGIApp) -> Operation:
+        headers = [(b"content-length", str(size).encode())] if content_length else []
+        scope = _scope("PUT", "/api/v1/storage/key", headers=headers)
+        receiver = _receiver(b"x" * size, chunk_size)
+        return lambda: app._read_body(scope, receiver())
+    return setup
+
+
+for _size, _chunk_size, _content_length, _number in (
+    (1024, 1024, True, 50_000),
+    (64 * 1024, 4 * 1024, True, 5_000),
+    (64 * 1024, 4 * 1024, False, 5_000),
+    (1024 * 1024, 64 * 1024, True, 500),
+):
+    _name = f"read_body {_size // 1024} KiB in {_chunk_size // 1024} KiB chunks{'' if _content_length else ', no content-length'}"
+    _benchmark(_name, _number)(_read_body(_size, _chunk_size, _content_length))
+
+
+@_benchmark("send_response empty", 50_000)
+def _send_empty(app: ASGIApp) -> Operation:
+    return lambda: app._send_response(HTTPStatus.ACCEPTED, _discard)
+
+
+@_benchmark("send_response str", 50_000)
+def _send_str(app: ASGIApp) -> Operation:
+    return lambda: app._send_response(HTTPStatus.NOT_FOUND, _discard, body="key missing doesn't exist")
+
+
+@_benchmark("send_response bytes", 50_000)
+def _send_bytes(app: ASGIApp) -> Operation:
+    body = b"v" * 1024
+    return lambda: app._send_response(HTTPStatus.OK, _discard, body=body, headers={"etag": '"400-00000000"'})
+
+
+@_benchmark("send_response memoryview", 50_000)
+def _send_memoryview(app: ASGIApp) -> Operation:
+    body = memoryview(b"v" * 64 * 1024)
+    return lambda: app._send_response(HTTPStatus.OK, _discard, body=body, headers={"etag": '"10000-00000000"'})
+
+
+@_benchmark("send_response dict", 50_000)
+def _send_dict(app: ASGIApp) -> Operation:
+    body = {"storage": {"keys": 1000, "bytes_used": 123456, "max_bytes": 1 << 28}}
+    return lambda: app._send_response(HTTPStatus.OK, _discard, body=body)
+
+
+@_benchmark("dump 1000 keys streamed", 100)
+def _dump(app: ASGIApp) -> Operation:
+    return _call(app, _scope("GET", "/api/v1/storage"))
+
+
+@_benchmark("dump page of 100 keys", 2_000)
+def _dump_page(app: ASGIApp) -> Operation:
+    return _call(app, _scope("GET", "/api/v1/storage", query_string=b"cursor=0&limit=100"))
+
+
+def _app() -> ASGIApp:
+    storage = StorageEngine(shards=16, max_bytes=64 * 1024 * 1024)
+    for i in range(1000):
+        storage.put(f"key-{i}", f"value-{i}".encode() * 8)
+    # NOTE: Request records aren't logged, the pipeline isn't started and would only queue them.
+    return ASGIApp(storage=storage, settings=Settings(), log=LogPipeline(default_sample_rate=0))
+
+
+def _measure(number: int, setup: Callable[[ASGIApp], Operation]) -> float:
+    """Nanoseconds per call of one round"""
+    async def run() -> float:
+        operation = setup(_app())
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            await operation()
+        return (time.perf_counter_ns() - start) / number
+    return asyncio.run(run())
+
+
+def _calibration_loop(number: int) -> None:
+    entries: dict[str, int] = {}
+    for i in range(number):
+        key = f"key-{i & 1023}"
+        entries[key] = entries.get(key, 0) + len(key)
+
+
+def calibrate(rounds: int = 5, number: int = 200_000) -> float:
+    """Nanoseconds per iteration of a fixed pure Python loop, the unit results are stored in"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        _calibration_loop(number)
+        best = min(best, (time.perf_counter_ns() - start) / number)
+    return best
+
+
+def run(names: Optional[list[str]] = None, rounds: int = 5, scale: float = 1.0) -> dict[str, float]:
+    """Best nanoseconds per call of every benchmark, scale shortens or lengthens the rounds"""
+    results: dict[str, float] = {}
+    for name in names or list(BENCHMARKS):
+        number, setup = BENCHMARKS[name]
+        number = max(1, int(number * scale))
+        results[name] = min(_measure(number, setup) for _ in range(rounds))
+    return results
+
+
+def load_baseline(path: Path = BASELINE) -> Optional[dict[str, Any]]:
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results: dict[str, float], calibration: float, path: Path = BASELINE) -> None:
+    baseline = {
+        "calibration_ns": calibration,
+        # results in units of the calibration loop, ns are only kept for reference
+        "relative": {name: ns / calibration for name, ns in results.items()},
+        "ns": results,
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def regressions(results: dict[str, float], calibration: float, baseline: dict[str, Any], threshold: float) -> dict[str, float]:
+    """Benchmarks slower than threshold times their baseline, with their slowdown"""
+    slower: dict[str, float] = {}
+    for name, ns in results.items():
+        expected = baseline["relative"].get(name)
+        if expected is None:
+            continue
+        slowdown = ns / calibration / expected
+        if slowdown > threshold:
+            slower[name] = slowdown
+    return slower
+
+
+def threshold() -> float:
+    value = os.environ.get("BENCH_REGRESSION_THRESHOLD")
+    return float(value) if value else DEFAULT_THRESHOLD
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save", action="store_true", help="record the results as the new baseline")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of the calls per round")
+    parser.add_argument("benchmarks", nargs="*", help="names of the benchmarks to run, all by default")
+    args = parser.parse_args()
+
+    calibration = calibrate()
+    results = run(args.benchmarks or None, args.rounds, args.scale)
+    baseline = load_baseline()
+    print(f"calibration {calibration:.1f} ns")
+    for name, ns in results.items():
+        line = f"{name:<56} {ns:>12,.0f} ns"
+        if baseline is not None and name in baseline["relative"]:
+            line += f"  {ns / calibration / baseline['relative'][name]:>6.2f}x baseline"
+        print(line)
+
+    if args.save:
+        if args.benchmarks and baseline is not None:
+            # keep the baseline of benchmarks which weren't run
+            results = {name: baseline["relative"][name] * calibration for name in baseline["relative"]} | results
+        save_baseline(results, calibration)
+        print(f"saved {BASELINE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Compare process memory with and without the cold tier for a blob-heavy workload.
+
+Run from the repository root: python -m bench.bench_coldtier --blobs 2000 --blob-size 262144
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _memory() -> dict[str, int]:
+    """Resident memory of the current process in kB, split into anonymous and file-backed pages"""
+    fields: dict[str, int] = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon", "RssFile"):
+                fields[name] = int(value.split()[0])
+    return fields
+
+
+def _run_workload(cold_dir: str, blobs: int, blob_size: int) -> None:
+    from app.coldtier import ColdTier
+    from app.storage import StorageEngine
+
+    cold = ColdTier(cold_dir, threshold=64 * 1024) if cold_dir else None
+    storage = StorageEngine(max_bytes=blobs * blob_size * 2, cold=cold)
+    blob = os.urandom(blob_size)
+
+    start = time.perf_counter()
+    for i in range(blobs):
+        # distinct objects, as if every value came from a separate request
+        storage.put(f"blob-{i}", blob[:-1] + bytes([i % 256]))
+    elapsed = time.perf_counter() - start
+
+    # read every value once, the way GET does
+    total = sum(len(storage.get(f"blob-{i}")) for i in range(blobs))
+    assert total == blobs * blob_size
+    memory = _memory()
+    print(f"{'cold tier' if cold_dir else 'heap only':<10} put {blobs / elapsed:>10,.0f}/s  "
+          f"VmRSS {memory['VmRSS'] / 1024:>8.1f} MB  RssAnon {memory['RssAnon'] / 1024:>8.1f} MB  RssFile {memory['RssFile'] / 1024:>8.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blobs", type=int, default=2000)
+    parser.add_argument("--blob-size", type=int, default=256 * 1024)
+    parser.add_argument("--workload", choices=("heap", "cold"))
+    parser.add_argument("--cold-dir", default="")
+    args = parser.parse_args()
+
+    if args.workload:
+        _run_workload(args.cold_dir if args.workload == "cold" else "", args.blobs, args.blob_size)
+        return
+
+    # every mode runs in a fresh process, so memory figures don't influence each other
+    common = [sys.executable, "-m", "bench.bench_coldtier", "--blobs", str(args.blobs), "--blob-size", str(args.blob_size)]
+    subprocess.run(common + ["--workload", "heap"], check=True)
+    with tempfile.TemporaryDirectory() as cold_dir:
+        subprocess.run(common + ["--workload", "cold", "--cold-dir", cold_dir], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Report compression ratio and CPU cost for several thresholds, used to tune COMPRESSION_THRESHOLD.
+
+Run from the repository root: python -m bench.bench_compression
+"""
+import json
+import os
+import random
+
+from app.compression import Compressor
+from app.storage import StorageEngine
+
+
+def _values(count: int) -> list[bytes]:
+    """Mixed workload: json documents of various sizes plus incompressible blobs"""
+    rng = random.Random(42)
+    values: list[bytes] = []
+    for i in range(count):
+        if i % 4 == 0:
+            values.append(os.urandom(rng.choice((512, 4096, 128 * 1024))))
+        else:
+            records = rng.choice((2, 20, 200))
+            values.append(json.dumps([{"id": j, "name": f"user-{rng.randrange(1000)}", "active": j % 2 == 0} for j in range(records)]).encode())
+    return values
+
+
+def main(count: int = 20_000) -> None:
+    values = _values(count)
+    raw_bytes = sum(len(v) for v in values)
+    print(f"{count} values, {raw_bytes / 1024 / 1024:.1f} MB raw")
+    print(f"{'threshold':>10} {'compressed':>11} {'skipped':>8} {'ratio':>6} {'memory MB':>10} {'compress us':>12} {'decompress us':>14}")
+
+    for threshold in (256, 1024, 4096, 16384):
+        compressor = Compressor(threshold=threshold)
+        storage = StorageEngine(max_bytes=raw_bytes * 2, compressor=compressor)
+        for i, value in enumerate(values):
+            storage.put(f"key-{i}", value)
+        for i in range(count):
+            storage.get(f"key-{i}")
+
+        stats = compressor.stats
+        print(f"{threshold:>10} {stats.compressed:>11} {stats.skipped:>8} {stats.ratio:>6.2f} "
+              f"{storage.stats.bytes_used / 1024 / 1024:>10.1f} "
+              f"{stats.compress_seconds / max(stats.attempts, 1) * 1e6:>12.1f} "
+              f"{stats.decompress_seconds / max(stats.decompressions, 1) * 1e6:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
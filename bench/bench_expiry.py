@@ -0,0 +1,42 @@
+"""Measure the cost of keys with a TTL: puts with a deadline, the periodic expiry pass and lazy checks on read.
+
+Run from the repository root: python -m bench.bench_expiry --keys 1000000
+"""
+import argparse
+import time
+
+from app.storage import StorageEngine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    keys = [f"key-{i}" for i in range(args.keys)]
+    for label, ttl in (("no ttl", None), ("ttl", 60.0)):
+        storage = StorageEngine(max_bytes=1 << 32)
+        start = time.perf_counter()
+        now = time.time()
+        for key in keys:
+            storage.put(key, b"value", now + ttl if ttl is not None else None)
+        put = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key in keys:
+            storage.get(key)
+        get = time.perf_counter() - start
+        print(f"{label:<8} put {args.keys / put:>12,.0f}/s  get {args.keys / get:>12,.0f}/s")
+
+    # every key comes due at once, the way a burst of writes with the same TTL expires
+    start = time.perf_counter()
+    expired = 0
+    while (n := storage.expire_due(now + ttl + 1)):
+        expired += n
+    elapsed = time.perf_counter() - start
+    assert expired == args.keys and len(storage) == 0
+    print(f"{'expire':<8} {expired / elapsed:>16,.0f} keys/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Measure the ordered key index: the cost it adds to puts and deletes, and the throughput of range scans.
+
+Run from the repository root: python -m bench.bench_keyindex --keys 10000000
+"""
+import argparse
+import random
+import time
+
+from app.keyindex import KeyIndex, prefix_end
+from app.storage import StorageEngine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=10_000_000)
+    parser.add_argument("--scans", type=int, default=10_000)
+    args = parser.parse_args()
+
+    # keys arrive in random order, the way hashed or user supplied ids do
+    keys = [f"user:{i:09d}" for i in range(args.keys)]
+    random.Random(1).shuffle(keys)
+
+    index = KeyIndex()
+    start = time.perf_counter()
+    for key in keys:
+        index.add(key)
+    elapsed = time.perf_counter() - start
+    print(f"{'index add':<24} {args.keys / elapsed:>14,.0f} keys/s  {elapsed / args.keys * 1e9:>8,.0f} ns per key")
+
+    storage = StorageEngine(max_bytes=1 << 40)
+    start = time.perf_counter()
+    for key in keys:
+        storage.put(key, b"v")
+    elapsed = time.perf_counter() - start
+    print(f"{'storage put':<24} {args.keys / elapsed:>14,.0f} keys/s  {elapsed / args.keys * 1e9:>8,.0f} ns per key, index included")
+
+    rng = random.Random(2)
+    prefixes = [f"user:{rng.randrange(args.keys // 100):07d}" for _ in range(args.scans)]
+    start = time.perf_counter()
+    found = 0
+    for prefix in prefixes:
+        found += len(storage.range_scan(prefix, prefix_end(prefix), count=100)[1])
+    elapsed = time.perf_counter() - start
+    print(f"{'prefix scan of 100':<24} {args.scans / elapsed:>14,.0f} scans/s {found / elapsed:>14,.0f} keys/s")
+
+    start = time.perf_counter()
+    after, scanned = None, 0
+    while True:
+        after, items = storage.range_scan(after=after, count=1000)
+        scanned += len(items)
+        if after is None:
+            break
+    elapsed = time.perf_counter() - start
+    assert scanned == args.keys
+    print(f"{'full ordered scan':<24} {scanned / elapsed:>14,.0f} keys/s")
+
+    start = time.perf_counter()
+    for key in keys[:args.keys // 10]:
+        index.discard(key)
+    elapsed = time.perf_counter() - start
+    print(f"{'index discard':<24} {args.keys // 10 / elapsed:>14,.0f} keys/s")
+
+
+if __name__ == '__main__':
+    main()
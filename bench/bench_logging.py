@@ -0,0 +1,59 @@
+"""Measure requests/sec with logging off, written synchronously, queued, and queued with sampling.
+
+Run from the repository root: python -m bench.bench_logging
+"""
+import asyncio
+import os
+import time
+from typing import Any
+
+from app.app import ASGIApp
+from app.log import LogPipeline
+from app.storage import StorageEngine
+
+
+async def _requests_per_second(app: ASGIApp, iterations: int, keys: int) -> float:
+    scopes = [
+        {"type": "http", "method": "GET", "path": f"/api/v1/storage/key-{i % keys}", "query_string": b"", "headers": []}
+        for i in range(iterations)
+    ]
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg: dict[str, Any]) -> None:
+        pass
+
+    start = time.perf_counter()
+    for scope in scopes:
+        await app(scope, receive, send)
+    return iterations / (time.perf_counter() - start)
+
+
+def main(iterations: int = 200_000, keys: int = 10_000) -> None:
+    storage = StorageEngine()
+    for i in range(keys):
+        storage.put(f"key-{i}", b"value")
+
+    with open(os.devnull, "w") as devnull:
+        modes = (
+            ("off (level WARNING)", LogPipeline(level="WARNING", stream=devnull)),
+            ("sync loguru", LogPipeline(stream=devnull, asynchronous=False)),
+            ("async pipeline", LogPipeline(stream=devnull)),
+            ("async pipeline, 1% sampled", LogPipeline(stream=devnull, sample_rates={"GET /api/v1/storage/{key}": 0.01})),
+        )
+        for name, log in modes:
+            app = ASGIApp(storage=storage, log=log)
+            log.start()
+            try:
+                rate = asyncio.run(_requests_per_second(app, iterations, keys))
+            finally:
+                # NOTE: Includes draining the queue, records written after the loop still cost CPU.
+                start = time.perf_counter()
+                log.stop()
+                drain = time.perf_counter() - start
+            print(f"{name:<32} {rate:>12,.0f} req/s   drain {drain * 1000:>7.1f} ms   dropped {log.dropped}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Measure what recording request metrics costs per request.
+
+Reports the cost of recording a latency and counting a key on their own,
+then the rate of GET requests through the app with and without hot key tracking.
+
+Run from the repository root: python -m bench.bench_metrics
+"""
+import asyncio
+import random
+import time
+from typing import Any
+
+from app.app import ASGIApp
+from app.log import LogPipeline
+from app.metrics import Metrics
+from app.storage import StorageEngine
+
+
+def _per_call(label: str, fn, args: list[Any]) -> None:
+    start = time.perf_counter_ns()
+    for arg in args:
+        fn(arg)
+    print(f"{label:<24} {(time.perf_counter_ns() - start) / len(args):>8.0f} ns/call")
+
+
+async def _app_rate(hot_keys: int, sample_every: int, keys: list[str]) -> float:
+    metrics = Metrics(hot_keys=hot_keys, hot_key_sample_every=sample_every)
+    app = ASGIApp(storage=StorageEngine(), log=LogPipeline(default_sample_rate=0), metrics=metrics)
+    for key in set(keys):
+        await app._store.put(key, b"value")
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg: dict[str, Any]) -> None:
+        pass
+
+    scopes = [{"type": "http", "method": "GET", "path": f"/api/v1/storage/{key}", "query_string": b"", "headers": []} for key in keys]
+    start = time.perf_counter()
+    for scope in scopes:
+        await app(scope, receive, send)
+    return len(scopes) / (time.perf_counter() - start)
+
+
+def main(requests: int = 200_000) -> None:
+    rng = random.Random(1)
+    keys = [f"key-{int(rng.paretovariate(1.2)) % 10_000}" for _ in range(requests)]
+    metrics = Metrics()
+    latencies = [int(rng.lognormvariate(5, 1)) for _ in range(requests)]
+    _per_call("record latency", lambda us: metrics.record("GET", "/api/v1/storage/{key}", 200, us), latencies)
+    _per_call("count hot key", metrics.touch, keys)
+    _per_call("count hot key, 1 in 8", Metrics(hot_key_sample_every=8).touch, keys)
+
+    for hot_keys, sample_every in ((0, 1), (10, 1), (10, 8)):
+        rate = asyncio.run(_app_rate(hot_keys, sample_every, keys))
+        print(f"{f'app, top {hot_keys}, 1 in {sample_every}':<24} {rate:>12,.0f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Compare payroll computations over lists of Person and Employee objects with the columnar tables.
+
+Memory is what tracemalloc sees allocated for the objects or the table, NumPy reports its buffers
+to it. Both are built from rows with strings of their own, as if read from a file, so the objects
+are charged for their strings the way the table is. The objects log in __init__, logging is turned
+off so only the objects themselves are measured.
+
+Run from the repository root: python -m bench.bench_payroll --rows 1000000
+"""
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from functools import reduce
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import numpy as np
+from loguru import logger
+
+from scripts.oop import Employee
+from scripts.payroll import EmployeeTable, PersonTable
+
+# NOTE: scripts/person.py imports its decorators as a top-level module, the way it's run from scripts/.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from person import Person  # noqa: E402
+
+
+TITLES = ["Developer", "Accountant", "Manager", "Designer", "Analyst"]
+FIRST = ["Susan", "Brad", "Boris", "Anna", "John", "Maria"]
+LAST = ["Abbey", "Pitt", "Doe", "Lee", "Smith", "Garcia"]
+
+
+def _rows(count: int) -> Iterator[tuple[str, int, str, str, str, int, float]]:
+    """Rows of employees, every row with strings of its own"""
+    rng = random.Random(1)
+    for i in range(count):
+        yield f"{rng.choice(FIRST)} {rng.choice(LAST)}", rng.randint(18, 70), f"{i} Main Street", f"user{i}@example.com", rng.choice(TITLES), i, rng.uniform(20_000, 120_000)
+
+
+def _person_columns(count: int) -> tuple[tuple[str, ...], tuple[str, ...], tuple[float, ...]]:
+    names, _, _, _, titles, _, salaries = zip(*_rows(count))
+    return names, titles, salaries
+
+
+def _allocated(build: Callable[[], Any]) -> tuple[Any, int]:
+    """Result of build and the bytes it holds on to"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def _timed(label: str, objects: Callable[[], Any], table: Callable[[], Any]) -> None:
+    start = time.perf_counter()
+    objects()
+    per_object = time.perf_counter() - start
+    start = time.perf_counter()
+    table()
+    columnar = time.perf_counter() - start
+    print(f"{label:<24} {per_object * 1e3:>10,.1f} ms {columnar * 1e3:>10,.1f} ms {per_object / columnar:>8,.0f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    logger.remove()
+    taxes = np.random.default_rng(1).uniform(10, 50, args.rows)
+
+    employees, employees_bytes = _allocated(lambda: [Employee(*row) for row in _rows(args.rows)])
+    employee_table, employee_table_bytes = _allocated(lambda: EmployeeTable(*zip(*_rows(args.rows))))
+    people, people_bytes = _allocated(lambda: [Person(name, title, salary) for name, _, _, _, title, _, salary in _rows(args.rows)])
+    person_table, person_table_bytes = _allocated(lambda: PersonTable(*_person_columns(args.rows)))
+
+    print(f"{'memory':<24} {'objects':>13} {'table':>13}")
+    print(f"{'employees':<24} {employees_bytes / 2**20:>10,.1f} MiB {employee_table_bytes / 2**20:>9,.1f} MiB")
+    print(f"{'people':<24} {people_bytes / 2**20:>10,.1f} MiB {person_table_bytes / 2**20:>9,.1f} MiB")
+    print()
+    print(f"{'time':<24} {'objects':>13} {'table':>13} {'speedup':>9}")
+    _timed("annual income", lambda: [person.annual_income for person in people], person_table.annual_income)
+    _timed("last names", lambda: [person.last_name for person in people], lambda: person_table.last_names)
+    _timed("give raise", lambda: [person.give_raise_range_check(0.01) for person in people], lambda: person_table.give_raise(0.01))
+    _timed("raw salary", lambda: [employee.raw_salary(tax) for employee, tax in zip(employees, taxes.tolist())], lambda: employee_table.raw_salary(taxes))
+
+    def totals_by_title() -> dict[str, float]:
+        groups: dict[str, list[Employee]] = {}
+        for employee in employees:
+            groups.setdefault(employee.title, []).append(employee)
+        return {title: reduce(lambda a, b: a + b, group).salary for title, group in groups.items()}
+
+    _timed("salary by title", totals_by_title, employee_table.salary_by_title)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Measure write-ahead log throughput per fsync policy and recovery time.
+
+Run from the repository root: python -m bench.bench_persistence --dataset-mb 1024
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from app.persistence import Persistence, FSYNC_POLICIES
+from app.storage import StorageEngine
+
+
+async def _write_throughput(directory: Path, fsync_policy: str, writes: int, concurrency: int, value_size: int) -> float:
+    persistence = Persistence(directory, fsync_policy=fsync_policy, snapshot_interval=3600)
+    await persistence.open(StorageEngine())
+    value = os.urandom(value_size)
+    queue = iter(range(writes))
+
+    async def writer() -> None:
+        for i in queue:
+            await persistence.log_put(f"key-{i}", value)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+    await persistence.close()
+    return writes / (time.perf_counter() - start)
+
+
+async def _recovery_time(directory: Path, dataset_bytes: int, value_size: int) -> tuple[float, int]:
+    storage = StorageEngine(max_bytes=dataset_bytes * 2)
+    persistence = Persistence(directory, fsync_policy="never", snapshot_interval=3600)
+    await persistence.open(storage)
+
+    value = os.urandom(value_size)
+    keys = dataset_bytes // value_size
+    # half of the dataset goes into the snapshot, the other half stays in the log tail
+    for i in range(keys):
+        storage.put(f"key-{i}", value)
+        await persistence.log_put(f"key-{i}", value)
+        if i == keys // 2:
+            await persistence.snapshot()
+    await persistence.close()
+    del storage
+
+    recovered = StorageEngine(max_bytes=dataset_bytes * 2)
+    persistence = Persistence(directory, snapshot_interval=3600)
+    start = time.perf_counter()
+    await persistence.open(recovered)
+    elapsed = time.perf_counter() - start
+    await persistence.close()
+    return elapsed, len(recovered)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--value-size", type=int, default=1024)
+    parser.add_argument("--dataset-mb", type=int, default=1024)
+    args = parser.parse_args()
+    logger.remove()
+
+    print(f"write throughput, {args.writes} writes of {args.value_size} bytes, {args.concurrency} concurrent writers")
+    for policy in FSYNC_POLICIES:
+        with tempfile.TemporaryDirectory() as directory:
+            rate = asyncio.run(_write_throughput(Path(directory), policy, args.writes, args.concurrency, args.value_size))
+        print(f"  {policy:<8} {rate:>12,.0f} writes/s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed, keys = asyncio.run(_recovery_time(Path(directory), args.dataset_mb * 1024 * 1024, 4096))
+    print(f"recovery of {args.dataset_mb} MB ({keys} keys): {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
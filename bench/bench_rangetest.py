@@ -0,0 +1,104 @@
+"""Compare the compiled rangetest decorators with the per-call implementation they replaced,
+and checking arrays of arguments in one vectorized pass with checking them call by call.
+
+Legacy decorators log every call at INFO, they are measured with a sink which discards records
+the way a deployment logging at INFO would pay for them, and without any sink.
+
+Run from the repository root: python -m bench.bench_rangetest --calls 200000
+"""
+import argparse
+import time
+from typing import Any, Callable
+
+import numpy as np
+from loguru import logger
+
+from scripts.rangetest import rangetest, advance_rangetest
+
+
+def legacy_rangetest(*argranges):
+    """rangetest as it was before checkers were compiled"""
+    def on_decorator(func):
+        def on_call(*args):
+            logger.info({"is_tuple": isinstance(args, tuple), "len(args)": len(args)})
+            for (ix, low, high) in argranges:
+                logger.info({"args[ix]": args[ix], "ix": ix, "low": low, "high": high})
+                if args[ix] < low or args[ix] > high:
+                    raise TypeError(f"Arument {ix} not in a range [{low}, {high}]")
+            return func(*args)
+        return on_call
+    return on_decorator
+
+
+def legacy_advance_rangetest(**argranges):
+    """advance_rangetest as it was before checkers were compiled"""
+    def on_decorator(func):
+        code = func.__code__
+        all_args = code.co_varnames[:code.co_argcount]
+
+        def on_call(*pargs, **kwargs):
+            positionals = list(all_args)[:len(pargs)]
+            for (arg_name, (low, high)) in argranges.items():
+                if arg_name in kwargs:
+                    logger.info({"arg_name": arg_name})
+                    if kwargs[arg_name] < low or kwargs[arg_name] > high:
+                        raise TypeError(f"Argument {arg_name} is out of range [{low}, {high}]")
+                elif arg_name in positionals:
+                    position = positionals.index(arg_name)
+                    if pargs[position] < low or pargs[position] > high:
+                        raise TypeError(f"Argument {arg_name} is out of range [{low}, {high}]")
+                else:
+                    logger.info(f"Argument {arg_name} defaulted")
+            return func(*pargs, **kwargs)
+        return on_call
+    return on_decorator
+
+
+def give_raise(salary: float, percent: float) -> float:
+    return salary * (1.0 + percent)
+
+
+def _per_call(func: Callable[..., Any], calls: int, **kwargs: Any) -> float:
+    """Nanoseconds per call"""
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        func(100.0, 0.1, **kwargs)
+    return (time.perf_counter_ns() - start) / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    logger.remove()
+    variants = {
+        "undecorated": give_raise,
+        "rangetest": rangetest([1, 0.0, 1.0])(give_raise),
+        "advance_rangetest": advance_rangetest(percent=(0.0, 1.0))(give_raise),
+        "legacy rangetest": legacy_rangetest([1, 0.0, 1.0])(give_raise),
+        "legacy advance_rangetest": legacy_advance_rangetest(percent=(0.0, 1.0))(give_raise),
+    }
+    for name, func in variants.items():
+        print(f"{name:<36} {_per_call(func, args.calls):>10,.0f} ns/call")
+    sink = logger.add(lambda message: None, level="INFO")
+    for name in ("legacy rangetest", "legacy advance_rangetest"):
+        print(f"{name + ', INFO sink':<36} {_per_call(variants[name], args.calls // 10):>10,.0f} ns/call")
+    logger.remove(sink)
+
+    checked = variants["advance_rangetest"]
+    percents = np.random.default_rng(1).random(args.rows)
+    start = time.perf_counter_ns()
+    for percent in percents.tolist():
+        checked(100.0, percent)
+    per_row = (time.perf_counter_ns() - start) / args.rows
+    start = time.perf_counter_ns()
+    checked.check_rows(None, percents)
+    batched = (time.perf_counter_ns() - start) / args.rows
+    print(f"{'rows one call each':<36} {per_row:>10,.1f} ns/row")
+    print(f"{'rows in one vectorized pass':<36} {batched:>10,.1f} ns/row")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Measure replication: lag between a write to the leader and its read from a follower, and read
+throughput as followers are added.
+
+Starts a leader and up to --followers follower processes of __main__.py on local ports, each with a
+single worker. Reads are spread over the leader and the followers started so far. On a machine with
+fewer cores than servers the processes compete for CPU and throughput can't scale.
+
+Run from the repository root: python -m bench.bench_replication --followers 2
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start(port: int, **env: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "__main__.py"], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env=os.environ | {"WORKERS": "1", "PORT": str(port), "LOG_LEVEL": "WARNING"} | env,
+    )
+
+
+def _stop(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(5)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def _until(session: aiohttp.ClientSession, url: str, expected: bytes, timeout: float = 30.0) -> float:
+    """Seconds until url answers with expected"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200 and await response.read() == expected:
+                    return time.perf_counter() - start
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.01)
+    raise TimeoutError(f"{url} didn't answer with the expected value within {timeout} s")
+
+
+async def _lag(session: aiohttp.ClientSession, leader: str, follower: str, writes: int) -> list[float]:
+    """Seconds from acknowledged writes to the leader until the follower serves them"""
+    samples = []
+    for i in range(writes):
+        value = f"value-{i}".encode()
+        async with session.put(f"{leader}/api/v1/storage/lag", data=value) as response:
+            response.raise_for_status()
+        samples.append(await _until(session, f"{follower}/api/v1/storage/lag", value))
+    return samples
+
+
+async def _reads(session: aiohttp.ClientSession, servers: list[str], seconds: float, concurrency: int) -> float:
+    """GETs per second spread over servers"""
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(i: int) -> None:
+        nonlocal done
+        url = f"{servers[i % len(servers)]}/api/v1/storage/key-{i % 100}"
+        while time.perf_counter() < deadline:
+            async with session.get(url) as response:
+                await response.read()
+            done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return done / (time.perf_counter() - start)
+
+
+async def run(args: argparse.Namespace) -> None:
+    servers: list[subprocess.Popen] = []
+    try:
+        leader_port = _free_port()
+        leader = f"http://127.0.0.1:{leader_port}"
+        servers.append(_start(leader_port, REPLICATION_ROLE="leader", REPLICATION_HEARTBEAT="0.5"))
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency)) as session:
+            # NOTE: The first puts wait for the leader to come up.
+            for i in range(100):
+                while True:
+                    try:
+                        async with session.put(f"{leader}/api/v1/storage/key-{i}", data=b"x" * args.value_bytes) as response:
+                            response.raise_for_status()
+                        break
+                    except aiohttp.ClientConnectionError:
+                        await asyncio.sleep(0.05)
+
+            urls = [leader]
+            print(f"{'followers':<10} {'reads/s':>12} {'lag p50':>10} {'lag max':>10}")
+            for followers in range(args.followers + 1):
+                if followers:
+                    port = _free_port()
+                    urls.append(f"http://127.0.0.1:{port}")
+                    servers.append(_start(port, REPLICATION_ROLE="follower", REPLICATION_LEADER=leader))
+                    await _until(session, f"{urls[-1]}/api/v1/storage/key-99", b"x" * args.value_bytes)
+                    lag = await _lag(session, leader, urls[-1], args.writes)
+                    lag_text = f"{statistics.median(lag) * 1e3:>8.2f}ms {max(lag) * 1e3:>8.2f}ms"
+                else:
+                    lag_text = f"{'-':>10} {'-':>10}"
+                reads = await _reads(session, urls, args.seconds, args.concurrency)
+                print(f"{followers:<10} {reads:>12,.0f} {lag_text}")
+    finally:
+        for server in servers:
+            _stop(server)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--followers", type=int, default=2)
+    parser.add_argument("--writes", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--value-bytes", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
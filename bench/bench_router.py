@@ -0,0 +1,94 @@
+"""Compare the precompiled router with the per-request yarl based dispatch.
+
+Run from the repository root: python -m bench.bench_router
+"""
+import asyncio
+import time
+from http import HTTPMethod
+from typing import Any, Callable
+
+from loguru import logger
+from yarl import URL
+
+from app.app import ASGIApp
+from app.storage import StorageEngine
+
+
+class LegacyDispatchApp(ASGIApp):
+    """ASGIApp dispatching requests the way it did before the router was introduced"""
+
+    async def _handle_http_protocol(self, scope, receive, send) -> None:
+        method = scope["method"]
+        if method not in (HTTPMethod.PUT, HTTPMethod.GET, HTTPMethod.POST, HTTPMethod.DELETE):
+            raise RuntimeError(f"Unsupported method {scope['method']}")
+
+        if method == HTTPMethod.GET:
+            if scope["path"].removesuffix("/") == "/api/v1/storage":
+                await self._dump_storage(scope, receive, send)
+            else:
+                await self._get_handler(scope, receive, send, URL(scope["path"]).parts[-1])
+        elif method == HTTPMethod.PUT:
+            await self._put_handler(scope, receive, send, URL(scope["path"]).parts[-1])
+        elif method == HTTPMethod.DELETE:
+            if scope["path"].removesuffix("/") == "/api/v1/storage":
+                await self._clear_handler(scope, receive, send)
+            else:
+                await self._del_handler(scope, receive, send, URL(scope["path"]).parts[-1])
+
+
+def _legacy_resolve(method: str, path: str) -> str:
+    if path.removesuffix("/") == "/api/v1/storage":
+        return ""
+    return URL(path).parts[-1]
+
+
+def _measure(name: str, paths: list[str], resolve: Callable[[str, str], Any]) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        resolve("GET", path)
+    rate = len(paths) / (time.perf_counter() - start)
+    print(f"{name:<32} {rate:>14,.0f} ops/s")
+    return rate
+
+
+async def _requests_per_second(app: ASGIApp, iterations: int, keys: int) -> float:
+    scopes = [
+        {"type": "http", "method": "GET", "path": f"/api/v1/storage/key-{i % keys}", "query_string": b"", "headers": []}
+        for i in range(iterations)
+    ]
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg: dict[str, Any]) -> None:
+        pass
+
+    start = time.perf_counter()
+    for scope in scopes:
+        await app(scope, receive, send)
+    return iterations / (time.perf_counter() - start)
+
+
+def main(iterations: int = 200_000, keys: int = 100_000) -> None:
+    logger.remove()
+
+    app = ASGIApp(storage=StorageEngine())
+    # NOTE: yarl caches parsed URLs, distinct keys keep the comparison honest.
+    paths = [f"/api/v1/storage/key-{i % keys}" for i in range(iterations)]
+
+    print("dispatch only")
+    legacy = _measure("legacy yarl dispatch", paths, _legacy_resolve)
+    compiled = _measure("compiled router", paths, app._router.resolve)
+    print(f"speedup: {compiled / legacy:.2f}x\n")
+
+    print("full in-process GET requests")
+    for name, cls in (("legacy dispatch", LegacyDispatchApp), ("compiled router", ASGIApp)):
+        bench_app = cls(storage=StorageEngine())
+        for i in range(keys):
+            bench_app._storage.put(f"key-{i}", b"value")
+        rate = asyncio.run(_requests_per_second(bench_app, iterations, keys))
+        print(f"{name:<32} {rate:>14,.0f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measure the cold start of the server: import time of the app and time to the first served request.
+
+Every round starts a fresh interpreter, the figures include interpreter startup. Time to first
+request runs __main__.py as deployed, with its port, and polls it until a request succeeds.
+
+Run from the repository root: python -m bench.bench_startup --rounds 5
+"""
+import argparse
+import http.client
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+PORT = 5051
+
+
+def _run(code: str) -> float:
+    """Seconds a fresh interpreter takes to run code"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def _first_request(timeout: float) -> float:
+    """Seconds from starting the server to the first successful response"""
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "__main__.py"], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=os.environ | {"WORKERS": "1"})
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}")
+            connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            try:
+                connection.request("GET", "/api/v1/stats")
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.002)
+            finally:
+                connection.close()
+        raise TimeoutError(f"no response within {timeout} s")
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(5)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def _report(label: str, samples: list[float]) -> None:
+    print(f"{label:<28} min {min(samples) * 1e3:>8.1f} ms  median {statistics.median(samples) * 1e3:>8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    _report("interpreter", [_run("pass") for _ in range(args.rounds)])
+    _report("import asyncio and loguru", [_run("import asyncio, loguru") for _ in range(args.rounds)])
+    _report("import app.app", [_run("import app.app") for _ in range(args.rounds)])
+    _report("time to first request", [_first_request(args.timeout) for _ in range(args.rounds)])
+
+
+if __name__ == '__main__':
+    main()
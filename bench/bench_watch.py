@@ -0,0 +1,59 @@
+"""Measure the cost watchers add to writes: publishing without subscribers, to one watched key and fanned out to many.
+
+Run from the repository root: python -m bench.bench_watch --subscribers 10000
+"""
+import argparse
+import asyncio
+import time
+
+from app.store import LocalStore
+from app.storage import StorageEngine
+from app.watch import WatchHub
+
+
+async def _puts(store: LocalStore, keys: list[str]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        await store.put(key, b"value")
+    return len(keys) / (time.perf_counter() - start)
+
+
+async def run(args: argparse.Namespace) -> None:
+    keys = [f"key-{i}" for i in range(args.writes)]
+    store = LocalStore(StorageEngine(max_bytes=1 << 32))
+    print(f"{'no hub':<28} {await _puts(store, keys):>12,.0f} puts/s")
+
+    hub = store.changes = WatchHub(max_queue=args.writes)
+    print(f"{'hub, no subscribers':<28} {await _puts(store, keys):>12,.0f} puts/s")
+
+    subscriber = hub.subscriber()
+    hub.subscribe(subscriber, prefixes=["other:"])
+    print(f"{'one unmatched prefix':<28} {await _puts(store, keys):>12,.0f} puts/s")
+    hub.subscribe(subscriber, prefixes=["key-"])
+    print(f"{'every put matched once':<28} {await _puts(store, keys):>12,.0f} puts/s")
+    hub.remove(subscriber)
+
+    subscribers = [hub.subscriber() for _ in range(args.subscribers)]
+    for subscriber in subscribers:
+        hub.subscribe(subscriber, keys=["hot"])
+    writes = max(1, args.writes // args.subscribers)
+    start = time.perf_counter()
+    for _ in range(writes):
+        await store.put("hot", b"value")
+    elapsed = time.perf_counter() - start
+    print(f"{'fan-out to ' + str(args.subscribers):<28} {writes / elapsed:>12,.0f} puts/s  {elapsed / writes / args.subscribers * 1e9:>8,.0f} ns per subscriber")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(subscriber.next_messages() for subscriber in subscribers))
+    print(f"{'drain':<28} {(time.perf_counter() - start) * 1e3:>12,.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=200_000)
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
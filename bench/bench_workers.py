@@ -0,0 +1,98 @@
+"""Measure how serving scales with the number of Granian workers sharing one storage owner.
+
+Reports the request rate the storage owner sustains on its own (the ceiling of scaling),
+then the end-to-end GET rate of the server started with 1, 2 and 4 workers.
+Scaling is bound by cores, compare runs against os.cpu_count().
+
+Run from the repository root: python -m bench.bench_workers
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from app.remote import StorageOwner, RemoteStore
+from app.store import LocalStore
+from app.storage import StorageEngine
+
+
+async def _owner_rate(requests: int, concurrency: int) -> float:
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, "storage.sock")
+    owner = StorageOwner(LocalStore(StorageEngine()), path)
+    await owner.start()
+    store = RemoteStore(path)
+    await store.open()
+    await store.put_many([(f"key-{i}", b"value") for i in range(1000)])
+
+    async def client(n: int) -> None:
+        for i in range(n):
+            await store.get(f"key-{i % 1000}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(requests // concurrency) for _ in range(concurrency)))
+    rate = requests / (time.perf_counter() - start)
+    await store.close()
+    await owner.close()
+    directory.cleanup()
+    return rate
+
+
+async def _http_rate(duration: float, concurrency: int) -> float:
+    url = "http://127.0.0.1:5051/api/v1/storage/key-{}"
+    async with aiohttp.ClientSession() as session:
+        for i in range(1000):
+            async with session.put(url.format(i), data=b"value"):
+                pass
+
+        done = 0
+        deadline = time.perf_counter() + duration
+
+        async def client() -> None:
+            nonlocal done
+            i = 0
+            while time.perf_counter() < deadline:
+                async with session.get(url.format(i % 1000)) as response:
+                    await response.read()
+                done += 1
+                i += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return done / (time.perf_counter() - start)
+
+
+async def _wait_for_server(timeout: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", 5051)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server didn't start")
+
+
+def main(duration: float = 5.0, concurrency: int = 64) -> None:
+    print(f"cpu count: {os.cpu_count()}")
+    print(f"{'storage owner alone':<24} {asyncio.run(_owner_rate(200_000, concurrency)):>12,.0f} req/s")
+
+    for workers in (1, 2, 4):
+        env = dict(os.environ, WORKERS=str(workers), LOG_LEVEL="WARNING")
+        server = subprocess.Popen([sys.executable, "__main__.py"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            asyncio.run(_wait_for_server())
+            rate = asyncio.run(_http_rate(duration, concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{f'{workers} worker(s)':<24} {rate:>12,.0f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,10 @@ from aiohttp import (
 
 from loguru import logger 
 
+# NOTE: Run from the repository root as a module (python -m scripts.app_example),
+# so the batch framing is shared with the server.
+from app import batch
+
 
 async def on_request_start(session: aiohttp.ClientSession, trace_ctx, params) -> None:
     logger.debug("Request started")
@@ -41,22 +45,31 @@ _trace_config.on_request_end.append(on_request_end)
 class Client:
     """Client session wrapper"""
 
-    def __init__(self, base_url: Optional[URL | str] = None) -> None:
+    def __init__(self, base_url: Optional[URL | str] = None, limit: int = 100, limit_per_host: int = 0, trace: bool = True) -> None:
         self._base_url = URL(base_url) if base_url else URL("http://localhost:5051")
+        # connection pool limits, 0 means no limit
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        # NOTE: Tracing logs every request, load tests turn it off.
+        self._trace = trace
         self._exit_stack: AsyncExitStack = None
         self._session: aiohttp.ClientSession = None
 
-    async def __aenter__(self) -> aiohttp.ClientSession:
+    async def __aenter__(self) -> "Client":
         if self._exit_stack is not None:
             raise RuntimeError("Exist stack already initialized")
         
         self._exit_stack = AsyncExitStack()
         session = await self._exit_stack.enter_async_context(
-            aiohttp.ClientSession(base_url=self._base_url, trace_configs=[_trace_config])
+            aiohttp.ClientSession(
+                base_url=self._base_url,
+                connector=aiohttp.TCPConnector(limit=self._limit, limit_per_host=self._limit_per_host),
+                trace_configs=[_trace_config] if self._trace else None,
+            )
         )
         self._session = session
 
-        return session
+        return self
 
     async def __aexit__(self, exc_type, exc, traceback):
         if self._exit_stack:
@@ -65,10 +78,37 @@ class Client:
     @property
     def base_url(self) -> str:
         return self._base_url.path 
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self._session
+
+    async def mget(self, keys: list[str]) -> dict[str, Optional[bytes]]:
+        """Get values of several keys in a single request, missing keys map to None"""
+        headers = {"content-type": batch.CONTENT_TYPE}
+        async with self._session.post(url="/api/v1/storage:mget", data=batch.encode_keys(keys), headers=headers) as resp:
+            resp.raise_for_status()
+            values = batch.decode_values(await resp.read())
+        return dict(zip(keys, values))
+
+    async def mset(self, items: dict[str, bytes]) -> None:
+        """Put several key-value pairs in a single request"""
+        headers = {"content-type": batch.CONTENT_TYPE}
+        async with self._session.post(url="/api/v1/storage:mset", data=batch.encode_items(list(items.items())), headers=headers) as resp:
+            resp.raise_for_status()
+
+    async def mdel(self, keys: list[str]) -> dict[str, bool]:
+        """Delete several keys in a single request, returns whether each key existed"""
+        headers = {"content-type": batch.CONTENT_TYPE}
+        async with self._session.post(url="/api/v1/storage:mdel", data=batch.encode_keys(keys), headers=headers) as resp:
+            resp.raise_for_status()
+            flags = await resp.read()
+        return {key: bool(flag) for key, flag in zip(keys, flags)}
     
 
 async def main() -> None:
-    async with Client() as client:
+    async with Client() as storage_client:
+        client = storage_client.session
         # make a PUT request
         data: bytes = random.randbytes(1024)  
         headers = {
@@ -95,15 +135,25 @@ async def main() -> None:
             else:
                 resp.raise_for_status() 
             
-        # get the whole storage
-        async with client.get(url="/api/storage/") as resp:
+        # get the whole storage, streamed as newline delimited json
+        async with client.get(url="/api/v1/storage") as resp:
             resp: aiohttp.ClientResponse
             if resp.ok:
-                body = await resp.read()
                 if content_type := resp.headers.get("content-type", None):
-                    if content_type == "application/json":
-                        storage = json.loads(body)
-                        logger.info({"storage": storage})
+                    if content_type == "application/x-ndjson":
+                        async for line in resp.content:
+                            logger.info({"entry": json.loads(line)})
+
+        # get the storage page by page
+        cursor = "0"
+        while cursor is not None:
+            url = URL("/api/v1/storage").with_query({"cursor": cursor, "limit": 100})
+            async with client.get(url=url) as resp:
+                resp: aiohttp.ClientResponse
+                resp.raise_for_status()
+                page = [json.loads(line) for line in (await resp.read()).splitlines()]
+                logger.info({"page": len(page)})
+                cursor = resp.headers.get("x-next-cursor", None)
                         
         # make a DELETE request
         async with client.delete(url="/api/v1/storage/key") as resp:
@@ -111,10 +161,18 @@ async def main() -> None:
             if not resp.ok:
                 await resp.read()
 
+        # batch operations
+        await storage_client.mset({f"batch-{i}": random.randbytes(64) for i in range(100)})
+        values = await storage_client.mget([f"batch-{i}" for i in range(100)] + ["missing"])
+        logger.info({"mget": len(values), "missing": values["missing"]})
+        deleted = await storage_client.mdel([f"batch-{i}" for i in range(100)])
+        logger.info({"mdel": sum(deleted.values())})
+
         # clear the whole storage
         async with client.delete(url="/api/v1/storage") as resp:
             resp.raise_for_status()
             logger.info({"status": resp.status})
 
 
-asyncio.run(main())
\ No newline at end of file
+if __name__ == '__main__':
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""Cluster client spreading keys over several storage servers with consistent hashing.
+
+Every node is placed on a hash ring at many points (virtual nodes), a key belongs to the first
+node clockwise of its hash. Adding or removing a node moves only the keys of the ring segments it
+takes over or gives up, about 1/N of them, and virtual nodes keep the shares of the nodes even.
+
+Multi-key operations are split by node, sent as one batch request per node, all nodes at once,
+and the results merged. A node which fails to answer is marked unhealthy and skipped, its keys go
+to the next healthy node on the ring, until a retry after an exponentially growing backoff succeeds.
+
+Run from the repository root with the servers started:
+python -m scripts.cluster http://localhost:5051 http://localhost:5052 http://localhost:5053
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from bisect import bisect
+from contextlib import AsyncExitStack
+from typing import Any, Awaitable, Callable, Iterator, Optional, TypeVar
+from urllib.parse import quote
+
+import aiohttp
+from loguru import logger
+
+from scripts.app_example import Client
+
+
+T = TypeVar("T")
+
+# Points every node takes on the ring, more of them spread keys more evenly at the cost of a larger ring.
+DEFAULT_VNODES = 160
+
+
+class NodeUnavailable(Exception):
+    """Raised when no node could serve a request"""
+
+
+def _hash(text: str) -> int:
+    # NOTE: The hash has to be stable across processes, unlike hash() of a str.
+    return int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes"""
+
+    def __init__(self, nodes: list[str] = [], vnodes: int = DEFAULT_VNODES) -> None:
+        self._vnodes = vnodes
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        self.nodes: list[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        self._rebuild()
+
+    def remove(self, node: str) -> None:
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(self._vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+    def node(self, key: str) -> str:
+        """Node the key belongs to"""
+        if not self._points:
+            raise NodeUnavailable("the ring has no nodes")
+        return self._owners[bisect(self._points, _hash(key)) % len(self._points)]
+
+    def walk(self, key: str) -> Iterator[str]:
+        """Distinct nodes clockwise from the key, its own node first"""
+        if not self._points:
+            return
+        start = bisect(self._points, _hash(key))
+        seen: set[str] = set()
+        for i in range(len(self._points)):
+            node = self._owners[(start + i) % len(self._points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+
+class ClusterClient:
+    """Storage client over several nodes, one pooled session per node"""
+
+    def __init__(
+        self,
+        nodes: list[str],
+        vnodes: int = DEFAULT_VNODES,
+        limit_per_node: int = 100,
+        timeout: float = 10.0,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        trace: bool = False,
+    ) -> None:
+        if not nodes:
+            raise ValueError("at least one node is needed")
+        self.ring = HashRing(nodes, vnodes)
+        self._limit_per_node = limit_per_node
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._trace = trace
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._clients: dict[str, Client] = {}
+        # consecutive failures of unhealthy nodes and the monotonic time they are tried again at
+        self._failures: dict[str, int] = {}
+        self._retry_at: dict[str, float] = {}
+
+    async def __aenter__(self) -> "ClusterClient":
+        if self._exit_stack is not None:
+            raise RuntimeError("Exit stack already initialized")
+        self._exit_stack = AsyncExitStack()
+        for node in self.ring.nodes:
+            self._clients[node] = await self._exit_stack.enter_async_context(Client(node, limit=self._limit_per_node, trace=self._trace))
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if self._exit_stack:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+            self._clients.clear()
+
+    @property
+    def health(self) -> dict[str, dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            node: {"healthy": self._healthy(node, now), "failures": self._failures.get(node, 0), "retry_in": max(0.0, self._retry_at.get(node, now) - now)}
+            for node in self.ring.nodes
+        }
+
+    def _healthy(self, node: str, now: float) -> bool:
+        return self._retry_at.get(node, 0.0) <= now
+
+    def _mark_down(self, node: str, error: BaseException) -> None:
+        failures = self._failures.get(node, 0) + 1
+        self._failures[node] = failures
+        backoff = min(self._max_backoff, self._base_backoff * 2 ** (failures - 1))
+        # NOTE: Jitter keeps clients which saw a node fail together from retrying it together.
+        self._retry_at[node] = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+        logger.warning({"cluster": "node unhealthy", "node": node, "failures": failures, "backoff": backoff, "error": repr(error)})
+
+    def _mark_up(self, node: str) -> None:
+        if self._failures.pop(node, None) is not None:
+            del self._retry_at[node]
+            logger.info({"cluster": "node healthy again", "node": node})
+
+    def route(self, key: str) -> str:
+        """Node a request for key goes to, the first healthy one on the ring, the key's own if none is"""
+        now = time.monotonic()
+        for node in self.ring.walk(key):
+            if self._healthy(node, now):
+                return node
+        return self.ring.node(key)
+
+    async def _on_node(self, node: str, call: Callable[[Client, T], Awaitable[Any]], arg: T) -> Any:
+        """Run call on a node, the node is marked unhealthy if it can't be reached"""
+        try:
+            result = await call(self._clients[node], arg)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ex:
+            self._mark_down(node, ex)
+            raise NodeUnavailable(f"node {node} failed: {ex!r}") from ex
+        except aiohttp.ClientResponseError as ex:
+            if ex.status < 500:
+                raise
+            self._mark_down(node, ex)
+            raise NodeUnavailable(f"node {node} failed: {ex!r}") from ex
+        self._mark_up(node)
+        return result
+
+    async def _keyed(self, key: str, call: Callable[[Client, str], Awaitable[T]]) -> T:
+        """Run call for a single key, on the next node of the ring while nodes fail"""
+        error: Optional[NodeUnavailable] = None
+        for _ in range(len(self.ring)):
+            try:
+                return await self._on_node(self.route(key), call, key)
+            except NodeUnavailable as ex:
+                error = ex
+        raise NodeUnavailable(f"no node could serve key {key}") from error
+
+    async def _batched(self, keys: list[str], call: Callable[[Client, list[str]], Awaitable[dict[str, T]]]) -> dict[str, T]:
+        """Run call for the keys of every node concurrently and merge the results.
+
+        Keys of nodes which fail are routed again and sent to the next healthy nodes.
+        """
+        results: dict[str, T] = {}
+        pending = list(dict.fromkeys(keys))
+        error: Optional[NodeUnavailable] = None
+        for _ in range(len(self.ring)):
+            groups: dict[str, list[str]] = {}
+            for key in pending:
+                groups.setdefault(self.route(key), []).append(key)
+            outcomes = await asyncio.gather(*(self._on_node(node, call, group) for node, group in groups.items()), return_exceptions=True)
+            pending = []
+            for group, outcome in zip(groups.values(), outcomes):
+                if isinstance(outcome, NodeUnavailable):
+                    error = outcome
+                    pending += group
+                elif isinstance(outcome, BaseException):
+                    raise outcome
+                else:
+                    results.update(outcome)
+            if not pending:
+                return results
+        raise NodeUnavailable(f"no node could serve {len(pending)} of the keys") from error
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Value of a key, None if it doesn't exist"""
+        async def call(client: Client, key: str) -> Optional[bytes]:
+            async with client.session.get(f"/api/v1/storage/{quote(key, safe='')}", timeout=self._timeout) as resp:
+                if resp.status == 404:
+                    return None
+                resp.raise_for_status()
+                return await resp.read()
+
+        return await self._keyed(key, call)
+
+    async def put(self, key: str, value: bytes) -> None:
+        async def call(client: Client, key: str) -> None:
+            async with client.session.put(f"/api/v1/storage/{quote(key, safe='')}", data=value, timeout=self._timeout) as resp:
+                resp.raise_for_status()
+
+        await self._keyed(key, call)
+
+    async def delete(self, key: str) -> bool:
+        """Delete a key, returns whether it existed"""
+        async def call(client: Client, key: str) -> bool:
+            async with client.session.delete(f"/api/v1/storage/{quote(key, safe='')}", timeout=self._timeout) as resp:
+                if resp.status == 404:
+                    return False
+                resp.raise_for_status()
+                return True
+
+        return await self._keyed(key, call)
+
+    async def mget(self, keys: list[str]) -> dict[str, Optional[bytes]]:
+        """Get values of several keys with one request per node, missing keys map to None"""
+        return await self._batched(keys, lambda client, group: client.mget(group))
+
+    async def mset(self, items: dict[str, bytes]) -> None:
+        """Put several key-value pairs with one request per node"""
+        async def call(client: Client, group: list[str]) -> dict[str, None]:
+            await client.mset({key: items[key] for key in group})
+            return {}
+
+        await self._batched(list(items), call)
+
+    async def mdel(self, keys: list[str]) -> dict[str, bool]:
+        """Delete several keys with one request per node, returns whether each key existed"""
+        return await self._batched(keys, lambda client, group: client.mdel(group))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("nodes", nargs="+", help="base urls of the nodes, e.g. http://localhost:5051")
+    parser.add_argument("--keys", type=int, default=1000)
+    args = parser.parse_args()
+
+    async with ClusterClient(args.nodes) as cluster:
+        items = {f"key-{i}": random.randbytes(64) for i in range(args.keys)}
+        start = time.perf_counter()
+        await cluster.mset(items)
+        values = await cluster.mget(list(items))
+        logger.info({"keys": len(values), "seconds": time.perf_counter() - start})
+        shares: dict[str, int] = {}
+        for key in items:
+            shares[cluster.route(key)] = shares.get(cluster.route(key), 0) + 1
+        logger.info({"shares": shares, "health": cluster.health})
+        await cluster.mdel(list(items))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
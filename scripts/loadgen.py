@@ -0,0 +1,288 @@
+"""Load generator for the storage server, built on the example Client.
+
+Sends a mix of GET/PUT/DELETE requests over a Zipf distributed key space, either closed-loop
+(concurrency workers, each sending its next request as soon as the previous one completes)
+or open-loop at a constant --rate. In open-loop mode latency is measured from the time a request
+was due, so a server falling behind shows up in the percentiles instead of lowering the load.
+Throughput and latency percentiles are printed and saved as JSON, --compare prints the
+difference to an earlier run.
+
+Run from the repository root with the server started:
+python -m scripts.loadgen --duration 30 --concurrency 64 --mix get=0.9,put=0.1 --zipf 1.1 --output run.json
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import random
+import time
+from collections import Counter
+from typing import Any, Optional
+
+import aiohttp
+
+from scripts.app_example import Client
+
+
+OPERATIONS = ("get", "put", "delete")
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p999", 0.999))
+# Keys are put in batches of this size before the run
+PRELOAD_BATCH = 1000
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    """Parse "get=0.8,put=0.15,delete=0.05" into ratios summing up to 1"""
+    mix: dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        op, _, ratio = item.partition("=")
+        op = op.strip().lower()
+        if op not in OPERATIONS:
+            raise ValueError(f"unknown operation {op}, expected one of {', '.join(OPERATIONS)}")
+        mix[op] = float(ratio)
+    total = sum(mix.values())
+    if total <= 0 or any(ratio < 0 for ratio in mix.values()):
+        raise ValueError(f"invalid request mix {spec}")
+    return {op: ratio / total for op, ratio in mix.items()}
+
+
+def parse_size(spec: str) -> tuple[int, int]:
+    """Parse a value size, "1024" for a fixed size or "64:65536" for sizes spread evenly on a log scale"""
+    low, _, high = spec.partition(":")
+    sizes = (int(low), int(high or low))
+    if sizes[0] < 1 or sizes[1] < sizes[0]:
+        raise ValueError(f"invalid value size {spec}")
+    return sizes
+
+
+class Workload:
+    """Draws the operation, key and value of the next request"""
+
+    def __init__(self, keys: int, zipf: float, mix: dict[str, float], sizes: tuple[int, int], seed: Optional[int] = None) -> None:
+        self._rng = random.Random(seed)
+        self.keys = keys
+        # NOTE: Ranks are drawn by bisecting cumulative weights 1/rank**s, zipf=0 gives uniform keys.
+        self._cumulative: list[float] = []
+        total = 0.0
+        for rank in range(1, keys + 1):
+            total += rank ** -zipf
+            self._cumulative.append(total)
+        self._ops = list(mix)
+        self._op_weights = [mix[op] for op in self._ops]
+        self._sizes = sizes
+        self._payload = self._rng.randbytes(sizes[1])
+
+    def key(self) -> str:
+        rank = bisect.bisect_left(self._cumulative, self._rng.random() * self._cumulative[-1])
+        return f"key-{min(rank, self.keys - 1)}"
+
+    def op(self) -> str:
+        return self._rng.choices(self._ops, self._op_weights)[0]
+
+    def value(self) -> bytes:
+        low, high = self._sizes
+        if low == high:
+            return self._payload
+        size = int(math.exp(self._rng.uniform(math.log(low), math.log(high + 1))))
+        return self._payload[:min(size, high)]
+
+
+class Recorder:
+    """Latencies, statuses and errors of the requests sent"""
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {op: [] for op in OPERATIONS}
+        self.statuses: Counter[int] = Counter()
+        self.errors: Counter[str] = Counter()
+
+    def record(self, op: str, latency: float, status: int) -> None:
+        self.latencies[op].append(latency)
+        self.statuses[status] += 1
+
+    def fail(self, op: str, latency: float, ex: BaseException) -> None:
+        self.latencies[op].append(latency)
+        self.errors[type(ex).__name__] += 1
+
+
+def _percentiles(latencies: list[float]) -> dict[str, float]:
+    """Latency summary in milliseconds, percentiles by nearest rank"""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    summary = {"mean": sum(ordered) / len(ordered) * 1000}
+    for name, q in PERCENTILES:
+        summary[name] = ordered[max(0, math.ceil(q * len(ordered)) - 1)] * 1000
+    summary["max"] = ordered[-1] * 1000
+    return summary
+
+
+def summarize(recorder: Recorder, elapsed: float, config: dict[str, Any]) -> dict[str, Any]:
+    every = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    server_errors = sum(count for status, count in recorder.statuses.items() if status >= 500)
+    return {
+        "config": config,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(time.time() - elapsed)),
+        "duration": elapsed,
+        "requests": len(every),
+        "errors": sum(recorder.errors.values()) + server_errors,
+        "throughput": len(every) / elapsed if elapsed else 0.0,
+        "latency_ms": _percentiles(every),
+        "operations": {
+            op: {"requests": len(latencies), "latency_ms": _percentiles(latencies)}
+            for op, latencies in recorder.latencies.items() if latencies
+        },
+        "statuses": {str(status): count for status, count in sorted(recorder.statuses.items())},
+        "error_types": dict(recorder.errors),
+    }
+
+
+class LoadGenerator:
+    def __init__(self, client: Client, workload: Workload, concurrency: int, rate: float = 0.0, timeout: float = 10.0) -> None:
+        self._client = client
+        self._workload = workload
+        self._concurrency = concurrency
+        self._rate = rate
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def preload(self) -> None:
+        """Put every key once, so GETs find values from the start"""
+        batches = [
+            {f"key-{i}": self._workload.value() for i in range(start, min(start + PRELOAD_BATCH, self._workload.keys))}
+            for start in range(0, self._workload.keys, PRELOAD_BATCH)
+        ]
+        semaphore = asyncio.Semaphore(max(1, self._concurrency // 8))
+
+        async def put(items: dict[str, bytes]) -> None:
+            async with semaphore:
+                await self._client.mset(items)
+
+        await asyncio.gather(*(put(items) for items in batches))
+
+    async def _request(self, op: str, key: str) -> int:
+        session = self._client.session
+        url = f"/api/v1/storage/{key}"
+        if op == "get":
+            request = session.get(url, timeout=self._timeout)
+        elif op == "put":
+            request = session.put(url, data=self._workload.value(), timeout=self._timeout)
+        else:
+            request = session.delete(url, timeout=self._timeout)
+        async with request as resp:
+            await resp.read()
+            return resp.status
+
+    async def _issue(self, recorder: Recorder, started: float) -> None:
+        """Send the next request, its latency counts from started"""
+        loop = asyncio.get_running_loop()
+        op, key = self._workload.op(), self._workload.key()
+        try:
+            status = await self._request(op, key)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            recorder.fail(op, loop.time() - started, ex)
+            return
+        recorder.record(op, loop.time() - started, status)
+
+    async def run(self, duration: float) -> tuple[Recorder, float]:
+        """Generate load for duration seconds, returns what was recorded and the actual elapsed time"""
+        recorder = Recorder()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        end = start + duration
+
+        if not self._rate:
+            async def worker() -> None:
+                while loop.time() < end:
+                    await self._issue(recorder, loop.time())
+
+            await asyncio.gather(*(worker() for _ in range(self._concurrency)))
+            return recorder, loop.time() - start
+
+        # NOTE: Requests are due at fixed times regardless of responses, concurrency only bounds
+        # how many are in flight, requests waiting for a slot keep counting from their due time.
+        semaphore = asyncio.Semaphore(self._concurrency)
+        tasks: set[asyncio.Task[None]] = set()
+
+        async def issue(due: float) -> None:
+            async with semaphore:
+                await self._issue(recorder, due)
+
+        sent = 0
+        while (due := start + sent / self._rate) < end:
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(issue(due))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            sent += 1
+        await asyncio.gather(*tasks)
+        return recorder, loop.time() - start
+
+
+def _print(summary: dict[str, Any]) -> None:
+    columns = ("requests", "mean", *(name for name, _ in PERCENTILES), "max")
+    print(f"{summary['requests']:,} requests in {summary['duration']:.1f} s, "
+          f"{summary['throughput']:,.0f} req/s, {summary['errors']:,} errors")
+    print(f"{'':<8}" + "".join(f"{column:>10}" for column in columns) + "   (latency in ms)")
+    rows = [(op, stats["requests"], stats["latency_ms"]) for op, stats in summary["operations"].items()]
+    rows.append(("all", summary["requests"], summary["latency_ms"]))
+    for name, requests, latency in rows:
+        print(f"{name:<8}{requests:>10,}" + "".join(f"{latency.get(column, 0.0):>10.2f}" for column in columns[1:]))
+    print(f"statuses {summary['statuses']}" + (f", errors {summary['error_types']}" if summary["error_types"] else ""))
+
+
+def _compare(summary: dict[str, Any], baseline: dict[str, Any]) -> None:
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"against {baseline.get('started_at', 'baseline')}:")
+    print(f"  throughput {baseline['throughput']:,.0f} -> {summary['throughput']:,.0f} req/s ({change(summary['throughput'], baseline['throughput'])})")
+    for name in ("p50", "p99", "p999"):
+        old, new = baseline["latency_ms"].get(name, 0.0), summary["latency_ms"].get(name, 0.0)
+        print(f"  {name:<10} {old:.2f} -> {new:.2f} ms ({change(new, old)})")
+
+
+async def _main(args: argparse.Namespace) -> dict[str, Any]:
+    workload = Workload(args.keys, args.zipf, parse_mix(args.mix), parse_size(args.value_size), seed=args.seed)
+    async with Client(args.url, limit=args.limit, limit_per_host=args.limit_per_host, trace=False) as client:
+        generator = LoadGenerator(client, workload, args.concurrency, args.rate, args.timeout)
+        if args.preload:
+            await generator.preload()
+        if args.warmup:
+            await generator.run(args.warmup)
+        recorder, elapsed = await generator.run(args.duration)
+    return summarize(recorder, elapsed, vars(args))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate load against the storage server")
+    parser.add_argument("--url", default="http://localhost:5051")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=0.0, help="seconds of load before measuring")
+    parser.add_argument("--concurrency", type=int, default=32, help="workers, or requests in flight at most with --rate")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second, open-loop, 0 for closed-loop")
+    parser.add_argument("--mix", default="get=0.8,put=0.15,delete=0.05")
+    parser.add_argument("--keys", type=int, default=10_000, help="size of the key space")
+    parser.add_argument("--zipf", type=float, default=1.0, help="skew of key popularity, 0 for uniform")
+    parser.add_argument("--value-size", default="1024", help='bytes, or "min:max" spread on a log scale')
+    parser.add_argument("--limit", type=int, default=100, help="connection pool size, 0 for no limit")
+    parser.add_argument("--limit-per-host", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds per request")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", help="don't put every key before the run")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    summary = asyncio.run(_main(args))
+    _print(summary)
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(summary, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
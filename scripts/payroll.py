@@ -0,0 +1,288 @@
+"""Columnar tables of people and employees for bulk payroll computations.
+
+Person (scripts/person.py) and Employee (scripts/oop.py) keep every field in the __dict__ of an
+object of their own. A table keeps every field in a single array instead: salaries in a float64
+array, names in a string array, and repeated strings such as job titles as integer codes into
+a list of the distinct titles. Computations run over whole columns at once and rows are read
+through small __slots__ views which copy nothing.
+
+Run from the repository root: python -m scripts.payroll
+"""
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
+
+import numpy as np
+from loguru import logger
+
+from scripts.rangetest import advance_rangetest
+
+
+def _categorize(values: Iterable[str]) -> tuple[np.ndarray, list[str]]:
+    """Codes of values into the list of distinct values, in the order they first appear"""
+    categories: dict[str, int] = {}
+    codes = np.fromiter((categories.setdefault(value, len(categories)) for value in values), dtype=np.int32)
+    return codes, list(categories)
+
+
+# NOTE: Variable width strings (NumPy 2) take 16 bytes per row plus the characters of long ones,
+# fixed width ones take 4 bytes per character of the longest string in every row.
+_STRING = np.dtypes.StringDType()
+
+
+def _strings(values: Iterable[str]) -> np.ndarray:
+    return np.array(list(values), dtype=_STRING)
+
+
+@advance_rangetest(percent=(0.0, 1.0))
+def _raise_percent(percent: float) -> None:
+    """Range of a salary raise, see Person.give_raise_range_check"""
+
+
+class PersonRow:
+    """View of a row of a PersonTable"""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "PersonTable", index: int) -> None:
+        self._table = table
+        self._index = index
+
+    @property
+    def name(self) -> str:
+        return str(self._table.names[self._index])
+
+    @property
+    def first_name(self) -> str:
+        return str(self._table.first_names[self._index])
+
+    @property
+    def last_name(self) -> str:
+        return str(self._table.last_names[self._index])
+
+    @property
+    def job_title(self) -> str:
+        return self._table.job_titles[self._table.job_title_codes[self._index]]
+
+    @property
+    def salary(self) -> float:
+        return float(self._table.salaries[self._index])
+
+    @salary.setter
+    def salary(self, value: float) -> None:
+        self._table.salaries[self._index] = value
+
+    @property
+    def annual_income(self) -> float:
+        return self.salary * 12
+
+    def __str__(self) -> str:
+        return f"[Person: {self.name}, {self.job_title}, {self.salary}]"
+
+
+class PersonTable:
+    """People of scripts/person.py as columns"""
+
+    def __init__(self, names: Iterable[str], job_titles: Iterable[str], salaries: Iterable[float]) -> None:
+        self.names = _strings(names)
+        self.job_title_codes, self.job_titles = _categorize(job_titles)
+        self.salaries = np.asarray(salaries, dtype=np.float64).copy()
+        if not len(self.names) == len(self.job_title_codes) == len(self.salaries):
+            raise ValueError("columns must have the same length")
+        self._first_names: Optional[np.ndarray] = None
+        self._last_names: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_objects(cls, people: Iterable[Any]) -> "PersonTable":
+        """Table of Person objects"""
+        people = list(people)
+        return cls((person.name for person in people), (person.job_title for person in people), [person.salary for person in people])
+
+    def __len__(self) -> int:
+        return len(self.salaries)
+
+    def __getitem__(self, index: int) -> PersonRow:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"row {index} out of range")
+        return PersonRow(self, index % len(self))
+
+    def __iter__(self) -> Iterator[PersonRow]:
+        return (PersonRow(self, index) for index in range(len(self)))
+
+    def _split_names(self) -> None:
+        # NOTE: Names are split once for the whole column, the way Person.first_name and last_name split them.
+        first, sep, rest = np.strings.partition(self.names, np.array(" ", dtype=_STRING))
+        self._first_names = first
+        self._last_names = np.where(sep == " ", rest, first)
+
+    @property
+    def first_names(self) -> np.ndarray:
+        if self._first_names is None:
+            self._split_names()
+        return self._first_names
+
+    @property
+    def last_names(self) -> np.ndarray:
+        if self._last_names is None:
+            self._split_names()
+        return self._last_names
+
+    def annual_income(self) -> np.ndarray:
+        return self.salaries * 12
+
+    def give_raise(self, percent: float | np.ndarray) -> None:
+        """Raise the salaries by percent, one for everybody or one per row.
+
+        Raises TypeError if a percent is out of range, no salary is changed then.
+        """
+        _raise_percent.check_rows(np.broadcast_to(percent, self.salaries.shape))
+        self.salaries *= 1.0 + np.asarray(percent, dtype=np.float64)
+
+
+class EmployeeRow:
+    """View of a row of an EmployeeTable"""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "EmployeeTable", index: int) -> None:
+        self._table = table
+        self._index = index
+
+    @property
+    def name(self) -> str:
+        return str(self._table.names[self._index])
+
+    @property
+    def age(self) -> int:
+        return int(self._table.ages[self._index])
+
+    @property
+    def address(self) -> str:
+        return str(self._table.addresses[self._index])
+
+    @property
+    def email(self) -> str:
+        return str(self._table.emails[self._index])
+
+    @property
+    def title(self) -> str:
+        return self._table.titles[self._table.title_codes[self._index]]
+
+    @property
+    def id(self) -> int:
+        return int(self._table.ids[self._index])
+
+    @property
+    def salary(self) -> float:
+        return float(self._table.salaries[self._index])
+
+    @salary.setter
+    def salary(self, value: float) -> None:
+        self._table.salaries[self._index] = value
+
+    def annual_salary(self) -> float:
+        return self.salary * 12
+
+    def raw_salary(self, tax_percent: float) -> float:
+        if tax_percent < 0 or tax_percent > 100:
+            raise ValueError(f"tax percent out of range {tax_percent}")
+        return self.salary - (self.salary * tax_percent / 100)
+
+    def __str__(self) -> str:
+        return f"{self.name}: age: {self.age}, address: {self.address}, email: {self.email}"
+
+    def __eq__(self, other: object) -> bool:
+        # NOTE: Rows compare the way Person objects of scripts/oop.py do, by the personal fields.
+        if not isinstance(other, EmployeeRow):
+            return NotImplemented
+        return (self.name, self.age, self.address, self.email) == (other.name, other.age, other.address, other.email)
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+class EmployeeTable:
+    """Employees of scripts/oop.py as columns"""
+
+    def __init__(
+        self,
+        names: Iterable[str],
+        ages: Iterable[int],
+        addresses: Iterable[str],
+        emails: Iterable[str],
+        titles: Iterable[str],
+        ids: Iterable[int],
+        salaries: Iterable[float],
+    ) -> None:
+        self.names = _strings(names)
+        self.ages = np.asarray(ages, dtype=np.int16)
+        self.addresses = _strings(addresses)
+        self.emails = _strings(emails)
+        self.title_codes, self.titles = _categorize(titles)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.salaries = np.asarray(salaries, dtype=np.float64).copy()
+        if len({len(self.names), len(self.ages), len(self.addresses), len(self.emails), len(self.title_codes), len(self.ids), len(self.salaries)}) != 1:
+            raise ValueError("columns must have the same length")
+
+    @classmethod
+    def from_objects(cls, employees: Iterable[Any]) -> "EmployeeTable":
+        """Table of Employee objects"""
+        employees = list(employees)
+        return cls(
+            (employee.name for employee in employees),
+            [employee.age for employee in employees],
+            (employee.address for employee in employees),
+            (employee.email for employee in employees),
+            (employee.title for employee in employees),
+            [employee.id for employee in employees],
+            [employee.salary for employee in employees],
+        )
+
+    def __len__(self) -> int:
+        return len(self.salaries)
+
+    def __getitem__(self, index: int) -> EmployeeRow:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"row {index} out of range")
+        return EmployeeRow(self, index % len(self))
+
+    def __iter__(self) -> Iterator[EmployeeRow]:
+        return (EmployeeRow(self, index) for index in range(len(self)))
+
+    def annual_salary(self) -> np.ndarray:
+        return self.salaries * 12
+
+    def raw_salary(self, tax_percent: float | np.ndarray) -> np.ndarray:
+        """Salaries after tax, tax_percent is one for everybody or one per row.
+
+        Raises ValueError if a tax percent is out of range.
+        """
+        tax_percent = np.asarray(tax_percent, dtype=np.float64)
+        if ((tax_percent < 0) | (tax_percent > 100)).any():
+            raise ValueError(f"tax percent out of range {tax_percent[(tax_percent < 0) | (tax_percent > 100)].flat[0]}")
+        return self.salaries - self.salaries * tax_percent / 100
+
+    def salary_by_title(self) -> dict[str, float]:
+        """Total salary of every title, in a single pass instead of adding up Employee objects pairwise"""
+        totals = np.bincount(self.title_codes, weights=self.salaries, minlength=len(self.titles))
+        return dict(zip(self.titles, totals.tolist()))
+
+
+def main() -> None:
+    table = EmployeeTable(
+        ["Susan Abbey", "Brad Pitt", "Boris Johnson"],
+        [56, 25, 24],
+        ["Vest Abbey", "Unknown", "Yew York city"],
+        ["susan@gmail.com", "brad@gmail.com", "boris@gmail.com"],
+        ["Developer", "Developer", "Accountant"],
+        [44, 55, 66],
+        [40000, 77000, 35000],
+    )
+    logger.info({"annual_salary": table.annual_salary().tolist(), "raw_salary": table.raw_salary([30, 30, 25]).tolist()})
+    logger.info({"salary_by_title": table.salary_by_title(), "first": str(table[0])})
+
+    people = PersonTable(table.names, [row.title for row in table], table.salaries)
+    people.give_raise(0.15)
+    logger.info({"last_names": people.last_names.tolist(), "annual_income": people.annual_income().tolist()})
+
+
+if __name__ == '__main__':
+    main()
@@ -1,83 +1,124 @@
+import functools
 from loguru import logger
 from collections.abc import Callable
-from typing import Any
+from typing import Any, Optional
 
 
 __all__ = ["rangetest", "advance_rangetest"]
 
 
-def rangetest(*argranges):
-    """Decorator used to check range boundaries."""
-    logger.info({"argranges is_tuple": isinstance(argranges, tuple)})
-
-    def on_decorator(func: Callable[[Any], Any]):
-        code = func.__code__
-        all_args = code.co_varnames[:code.co_argcount]
-        func_name = func.__name__
-        func_doc_str = func.__doc__
-        expected_args = list(all_args)
+# NOTE: Decorating compiles a checker for the decorated function. Positions of the checked arguments
+# are resolved once and the checks are generated as straight-line code, a call runs nothing but the
+# comparisons. Failed checks raise TypeError, as they always did.
+
+# (position or None, name or None, low, high, message raised when out of range)
+Check = tuple[Optional[int], Optional[str], Any, Any, str]
+
+
+def _arg_names(func: Callable[..., Any]) -> tuple[str, ...]:
+    code = func.__code__
+    return code.co_varnames[:code.co_argcount]
+
+
+def _compile(func: Callable[..., Any], checks: list[Check], required: bool = False) -> Callable[..., Any]:
+    """Generate the wrapper of func running checks before every call.
+
+    With required set a checked argument which isn't passed raises IndexError, otherwise its default isn't checked.
+    """
+    namespace: dict[str, Any] = {"func": func}
+    lines = ["def on_call(*args, **kwargs):"]
+    if any(position is not None for position, *_ in checks):
+        lines.append("    count = len(args)")
+    for i, (position, name, low, high, message) in enumerate(checks):
+        namespace[f"low_{i}"], namespace[f"high_{i}"], namespace[f"message_{i}"] = low, high, message
+        # NOTE: An argument is passed by position or by name.
+        sources = []
+        if position is not None:
+            sources.append((f"count > {position}", f"args[{position}]"))
+        if name is not None:
+            sources.append((f"{name!r} in kwargs", f"kwargs[{name!r}]"))
+        for j, (condition, source) in enumerate(sources):
+            lines.append(f"    {'elif' if j else 'if'} {condition}:")
+            lines.append(f"        value = {source}")
+            lines.append(f"        if value < low_{i} or value > high_{i}:")
+            lines.append(f"            raise TypeError(message_{i})")
+        if required:
+            namespace[f"missing_{i}"] = f"Argument {position if position is not None else name} is missing"
+            lines.append("    else:")
+            lines.append(f"        raise IndexError(missing_{i})")
+    lines.append("    return func(*args, **kwargs)")
+    exec(compile("\n".join(lines), f"<rangetest {func.__qualname__}>", "exec"), namespace)
+
+    on_call = functools.wraps(func)(namespace["on_call"])
+    on_call.valid_rows = functools.partial(_valid_rows, checks)
+    on_call.check_rows = functools.partial(_check_rows, checks)
+    return on_call
+
+
+def _valid_rows(checks: list[Check], *args: Any, **kwargs: Any) -> Any:
+    """Boolean NumPy mask of the rows whose checked arguments are all in range.
+
+    Arguments are passed the way the decorated function takes them, arrays of values in place of values.
+    """
+    # NOTE: NumPy is only needed for batches, it isn't imported with the decorators.
+    import numpy as np
+
+    mask = None
+    for position, name, low, high, _ in checks:
+        if position is not None and len(args) > position:
+            values = np.asarray(args[position])
+        elif name is not None and name in kwargs:
+            values = np.asarray(kwargs[name])
+        else:
+            continue
+        # the same comparisons as a single call, so e.g. NaN passes either way
+        valid = ~((values < low) | (values > high))
+        mask = valid if mask is None else mask & valid
+    if mask is None:
+        raise ValueError("none of the checked arguments was passed")
+    return mask
+
+
+def _check_rows(checks: list[Check], *args: Any, **kwargs: Any) -> None:
+    """Raise TypeError if an argument of any row is out of range, all rows are checked in one pass"""
+    import numpy as np
+
+    invalid = np.flatnonzero(~_valid_rows(checks, *args, **kwargs))
+    if invalid.size:
+        raise TypeError(f"{invalid.size} rows out of range, the first one is row {invalid[0]}")
 
-        logger.info({
-            "func_doc_str": func_doc_str, 
-            "func_name": func_name, 
-            "func.__code__": func.__code__, 
-            "all_args": all_args, 
-            "expected_args": expected_args
-        })
 
-        def on_call(*args):
-            logger.info({"is_tuple": isinstance(args, tuple), "len(args)": len(args)})
+def rangetest(*argranges):
+    """Decorator used to check range boundaries.
 
-            for (ix, low, high) in argranges: 
-                logger.info({"args[ix]": args[ix], "ix": ix, "low": low, "high": high})
+    Every range is a [position, low, high] triple, the argument at position must be within [low, high].
+    It may be passed by name as well, IndexError is raised if it isn't passed at all.
+    """
+    def on_decorator(func: Callable[[Any], Any]):
+        all_args = _arg_names(func)
+        checks: list[Check] = [
+            (ix, all_args[ix] if ix < len(all_args) else None, low, high, f"Argument {ix} not in a range [{low}, {high}]")
+            for (ix, low, high) in argranges
+        ]
+        logger.debug({"func_name": func.__name__, "all_args": all_args, "argranges": argranges})
+        return _compile(func, checks, required=True)
 
-                if args[ix] < low or args[ix] > high:
-                    raise TypeError(f"Arument {ix} not in a range [{low}, {high}]")
-                
-            return func(*args)
-        return on_call
-    
-    return on_decorator 
+    return on_decorator
 
 
 def advance_rangetest(**argranges):
-    """"""
+    """Decorator used to check range boundaries of arguments by name, e.g. age=(0, 120).
+
+    Arguments may be passed by position or by name, defaulted ones aren't checked.
+    """
     def on_decorator(func: Callable[[Any], Any]) -> Callable:
-        code = func.__code__
-        all_args = code.co_varnames[:code.co_argcount]
+        all_args = _arg_names(func)
         func_name = func.__name__
+        checks: list[Check] = [
+            (all_args.index(arg_name) if arg_name in all_args else None, arg_name, low, high, f"{func_name} Argument {arg_name} is out of range [{low}, {high}]")
+            for (arg_name, (low, high)) in argranges.items()
+        ]
+        logger.debug({"func_name": func_name, "all_args": all_args, "argranges": argranges})
+        return _compile(func, checks)
 
-        logger.info({
-            "func_name": func_name, 
-            "func.__code__": func.__code__, 
-            "all_args": all_args, 
-        })
-
-        def on_call(*pargs, **kwargs): 
-            # All pargs match first N expected args by position
-            # the rest must be in kargs or be omitted defaults
-            expected = list(all_args)
-            positionals = expected[:len(pargs)]
-
-            for (arg_name, (low, high)) in argranges.items():
-                if arg_name in kwargs:
-                    # was passed by name
-                    logger.info({"arg_name": arg_name})
-
-                    if kwargs[arg_name] < low or kwargs[arg_name] > high:
-                        raise TypeError(f"{func_name} Argument {arg_name} is out of range [{low}, {high}]")
-
-                elif arg_name in positionals: 
-                    # was passed by position
-                    position = positionals.index(arg_name)
-                    if pargs[position] < low or pargs[position] > high:
-                        raise TypeError(f"{func_name} Argument {arg_name} is out of range [{low}, {high}]")
-                else:
-                    # not passed: default
-                    logger.info(f"Argument {arg_name} defaulted")
-
-            return func(*pargs, **kwargs)
-        
-        return on_call
-    
     return on_decorator
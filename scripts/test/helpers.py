@@ -0,0 +1,40 @@
+"""Helpers shared by the test modules of the scripts"""
+from aiohttp import web
+
+from app import batch
+
+
+async def _serve(storage: dict[str, bytes]) -> web.AppRunner:
+    """Minimal stand-in of the storage server on a free port"""
+    async def get(request: web.Request) -> web.Response:
+        value = storage.get(request.match_info["key"])
+        return web.Response(body=value) if value is not None else web.Response(status=404)
+
+    async def put(request: web.Request) -> web.Response:
+        storage[request.match_info["key"]] = await request.read()
+        return web.Response(status=202)
+
+    async def delete(request: web.Request) -> web.Response:
+        return web.Response(status=200 if storage.pop(request.match_info["key"], None) is not None else 404)
+
+    async def mset(request: web.Request) -> web.Response:
+        storage.update((key, bytes(value)) for key, value in batch.decode_items(await request.read()))
+        return web.Response(status=202)
+
+    async def mget(request: web.Request) -> web.Response:
+        return web.Response(body=batch.encode_values([storage.get(key) for key in batch.decode_keys(await request.read())]))
+
+    async def mdel(request: web.Request) -> web.Response:
+        return web.Response(body=bytes(storage.pop(key, None) is not None for key in batch.decode_keys(await request.read())))
+
+    server = web.Application()
+    server.router.add_get("/api/v1/storage/{key}", get)
+    server.router.add_put("/api/v1/storage/{key}", put)
+    server.router.add_delete("/api/v1/storage/{key}", delete)
+    server.router.add_post("/api/v1/storage:mset", mset)
+    server.router.add_post("/api/v1/storage:mget", mget)
+    server.router.add_post("/api/v1/storage:mdel", mdel)
+    runner = web.AppRunner(server)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
@@ -0,0 +1,73 @@
+import asyncio
+from collections import Counter
+from unittest import TestCase
+
+from scripts.cluster import ClusterClient, HashRing, NodeUnavailable
+from scripts.test.helpers import _serve
+
+
+class HashRingTestSuite(TestCase):
+    def test_balance_and_stability(self):
+        """Test that keys spread evenly and adding a node only moves the keys it takes over"""
+        keys = [f"key-{i}" for i in range(30_000)]
+        ring = HashRing([f"http://node-{i}" for i in range(3)])
+        before = {key: ring.node(key) for key in keys}
+        shares = Counter(before.values())
+        self.assertEqual(len(shares), 3)
+        self.assertTrue(all(abs(share / len(keys) - 1 / 3) < 0.05 for share in shares.values()), shares)
+
+        ring.add("http://node-3")
+        moved = [key for key in keys if ring.node(key) != before[key]]
+        self.assertAlmostEqual(len(moved) / len(keys), 1 / 4, delta=0.05)
+        self.assertTrue(all(ring.node(key) == "http://node-3" for key in moved))
+
+        ring.remove("http://node-3")
+        self.assertEqual({key: ring.node(key) for key in keys}, before)
+        self.assertEqual(list(ring.walk("key-1"))[0], ring.node("key-1"))
+        self.assertEqual(sorted(ring.walk("key-1")), sorted(ring.nodes))
+
+
+class ClusterClientTestSuite(TestCase):
+    def test_spread_and_failover(self):
+        """Test multi-key operations across nodes, and a failed node being skipped and retried"""
+        async def run() -> None:
+            storages: list[dict[str, bytes]] = [{}, {}, {}]
+            runners = [await _serve(storage) for storage in storages]
+            nodes = [f"http://{runner.addresses[0][0]}:{runner.addresses[0][1]}" for runner in runners]
+            try:
+                async with ClusterClient(nodes, base_backoff=0.05, max_backoff=0.05) as cluster:
+                    items = {f"key-{i}": f"value-{i}".encode() for i in range(300)}
+                    await cluster.mset(items)
+                    self.assertEqual(sum(len(storage) for storage in storages), 300)
+                    self.assertTrue(all(storage for storage in storages))
+                    for node, storage in zip(nodes, storages):
+                        self.assertTrue(all(cluster.route(key) == node for key in storage))
+                    self.assertEqual(await cluster.mget([*items, "missing"]), {**items, "missing": None})
+                    self.assertEqual(await cluster.get("key-1"), b"value-1")
+
+                    # the keys of a stopped node go to the next node on the ring
+                    await runners[0].cleanup()
+                    lost = next(key for key in items if cluster.route(key) == nodes[0])
+                    self.assertIsNone(await cluster.get(lost))
+                    self.assertFalse(cluster.health[nodes[0]]["healthy"])
+                    await cluster.put(lost, b"moved")
+                    self.assertEqual(await cluster.get(lost), b"moved")
+                    self.assertNotEqual(cluster.route(lost), nodes[0])
+                    deleted = await cluster.mdel(list(items))
+                    self.assertEqual(sum(deleted.values()), 300 - len(storages[0]) + 1)
+
+                    # the node is tried again once its backoff has passed
+                    await asyncio.sleep(0.06)
+                    self.assertEqual(cluster.route(lost), nodes[0])
+                    self.assertIsNone(await cluster.get(lost))
+                    self.assertEqual(cluster.health[nodes[0]]["failures"], 2)
+
+                    for runner in runners[1:]:
+                        await runner.cleanup()
+                    with self.assertRaises(NodeUnavailable):
+                        await cluster.mget(list(items))
+            finally:
+                for runner in runners:
+                    await runner.cleanup()
+
+        asyncio.run(run())
@@ -0,0 +1,54 @@
+import asyncio
+from collections import Counter
+from unittest import TestCase
+
+from scripts.app_example import Client
+from scripts.loadgen import LoadGenerator, Workload, parse_mix, parse_size, summarize
+from scripts.test.helpers import _serve
+
+
+class LoadGeneratorTestSuite(TestCase):
+    def test_workload(self):
+        """Test the request mix, key skew and value sizes drawn by a workload"""
+        self.assertEqual(parse_mix("get=3, PUT=1"), {"get": 0.75, "put": 0.25})
+        self.assertRaises(ValueError, parse_mix, "scan=1")
+        self.assertEqual(parse_size("64:4096"), (64, 4096))
+        self.assertRaises(ValueError, parse_size, "10:1")
+
+        workload = Workload(keys=1000, zipf=1.2, mix={"get": 0.9, "delete": 0.1}, sizes=(64, 4096), seed=1)
+        keys = Counter(workload.key() for _ in range(20_000))
+        ops = Counter(workload.op() for _ in range(20_000))
+        sizes = [len(workload.value()) for _ in range(1000)]
+        self.assertGreater(keys["key-0"], keys["key-1"] > keys["key-9"] > keys.get("key-999", 0))
+        self.assertAlmostEqual(ops["get"] / 20_000, 0.9, delta=0.02)
+        self.assertTrue(all(64 <= size <= 4096 for size in sizes))
+        # spread on a log scale, half of the values are below the geometric mean
+        self.assertAlmostEqual(sum(size < 512 for size in sizes) / len(sizes), 0.5, delta=0.06)
+
+    def test_closed_and_open_loop(self):
+        """Test both load modes against a server, including the summary saved as JSON"""
+        storage: dict[str, bytes] = {}
+
+        async def run(rate: float) -> dict:
+            runner = await _serve(storage)
+            host, port = runner.addresses[0][:2]
+            try:
+                async with Client(f"http://{host}:{port}", limit=8, trace=False) as client:
+                    workload = Workload(keys=100, zipf=1.0, mix=parse_mix("get=0.7,put=0.2,delete=0.1"), sizes=(16, 16), seed=2)
+                    generator = LoadGenerator(client, workload, concurrency=8, rate=rate)
+                    await generator.preload()
+                    recorder, elapsed = await generator.run(0.5)
+                    return summarize(recorder, elapsed, {"rate": rate})
+            finally:
+                await runner.cleanup()
+
+        closed = asyncio.run(run(0.0))
+        self.assertGreater(closed["requests"], 0)
+        self.assertEqual(closed["errors"], 0)
+        self.assertEqual(set(closed["operations"]), {"get", "put", "delete"})
+        self.assertLessEqual(closed["latency_ms"]["p50"], closed["latency_ms"]["p99"])
+
+        opened = asyncio.run(run(200.0))
+        # every request due within the duration is sent, none are skipped when responses are slow
+        self.assertEqual(opened["requests"], 100)
+        self.assertEqual(sum(opened["statuses"].values()), 100)
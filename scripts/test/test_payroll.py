@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+import numpy as np
+
+from scripts.oop import Employee
+from scripts.payroll import EmployeeTable, PersonTable
+
+
+class PersonTableTestSuite(TestCase):
+    def test_columns_and_rows(self):
+        """Test that names are split and incomes computed the way Person does it"""
+        people = [SimpleNamespace(name=name, job_title="Accountant", salary=1000.0 * i) for i, name in enumerate(["John Doe", "Cher", "Anna Maria Lee"])]
+        table = PersonTable.from_objects(people)
+        self.assertEqual(table.first_names.tolist(), ["John", "Cher", "Anna"])
+        self.assertEqual(table.last_names.tolist(), ["Doe", "Cher", "Maria Lee"])
+        self.assertEqual(table.annual_income().tolist(), [0.0, 12000.0, 24000.0])
+        self.assertEqual(str(table[-1]), "[Person: Anna Maria Lee, Accountant, 2000.0]")
+        self.assertEqual([row.last_name for row in table], ["Doe", "Cher", "Maria Lee"])
+        with self.assertRaises(AttributeError):
+            table[0].nickname = "J"
+
+    def test_give_raise(self):
+        """Test raises for everybody and per row, out of range ones change nothing"""
+        table = PersonTable(["A B", "C D"], ["Developer", "Developer"], [100.0, 200.0])
+        table.give_raise(0.5)
+        self.assertEqual(table.salaries.tolist(), [150.0, 300.0])
+        table.give_raise(np.array([0.0, 1.0]))
+        self.assertEqual(table.salaries.tolist(), [150.0, 600.0])
+        with self.assertRaises(TypeError):
+            table.give_raise(np.array([0.1, 1.5]))
+        with self.assertRaises(TypeError):
+            table.give_raise(-0.1)
+        self.assertEqual(table.salaries.tolist(), [150.0, 600.0])
+
+
+class EmployeeTableTestSuite(TestCase):
+    def test_matches_objects(self):
+        """Test that the table computes what Employee objects do"""
+        employees = [
+            Employee("Susan", 56, "Vest Abbey", "susan@gmail.com", "Developer", 44, 40000),
+            Employee("Brad", 25, "Unknown", "brad@gmail.com", "Developer", 55, 77000),
+            Employee("Boris", 24, "Yew York city", "boris@gmail.com", "Accountant", 66, 35000),
+        ]
+        table = EmployeeTable.from_objects(employees)
+        self.assertEqual(table.annual_salary().tolist(), [employee.annual_salary() for employee in employees])
+        self.assertEqual(table.raw_salary(30).tolist(), [employee.raw_salary(30) for employee in employees])
+        self.assertEqual(table.raw_salary(np.array([0, 50, 100])).tolist(), [40000.0, 38500.0, 0.0])
+        with self.assertRaises(ValueError):
+            table.raw_salary(np.array([10, 116, 10]))
+
+        developers = employees[0] + employees[1]
+        self.assertEqual(table.salary_by_title(), {"Developer": developers.salary, "Accountant": 35000.0})
+        self.assertEqual((table[1].id, table[1].title, table[1].raw_salary(30)), (55, "Developer", employees[1].raw_salary(30)))
+        self.assertEqual(str(table[0]), str(employees[0]))
+        self.assertEqual(table[0], EmployeeTable.from_objects(employees[:1])[0])
+        self.assertNotEqual(table[0], table[1])
+
+        table[2].salary = 36000
+        self.assertEqual(table.salary_by_title()["Accountant"], 36000.0)
+        with self.assertRaises(ValueError):
+            EmployeeTable(["A"], [1, 2], ["x"], ["e"], ["t"], [1], [1.0])
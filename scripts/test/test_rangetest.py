@@ -1,7 +1,7 @@
 from loguru import logger
 from unittest import TestCase  
 
-from ..rangetest import rangetest, advance_rangetest
+from scripts.rangetest import rangetest, advance_rangetest
 
 
 class RangesDecorateTestSuite(TestCase):
@@ -48,4 +48,74 @@ class RangesDecorateTestSuite(TestCase):
         with self.assertRaises(TypeError) as exc:
             pers_info("Ivan", 444)
 
-            
+
+class CompiledRangetestTestSuite(TestCase):
+    def test_arguments_by_position_and_name(self):
+        """Test that checked arguments are found wherever they are passed, defaults aren't checked"""
+        @advance_rangetest(percent=(0.0, 1.0), years=(1, 10))
+        def give_raise(salary: float, percent: float, years: int = 99) -> float:
+            """Salary after a raise"""
+            return salary * (1 + percent)
+
+        self.assertEqual((give_raise.__name__, give_raise.__doc__), ("give_raise", "Salary after a raise"))
+        self.assertEqual(give_raise(100, 0.5), 150)
+        self.assertEqual(give_raise(100, percent=0.5, years=2), 150)
+        for args, kwargs in (((100, 1.5), {}), ((100,), {"percent": -1}), ((100, 0.5, 11), {}), ((100, 0.5), {"years": 0})):
+            with self.assertRaises(TypeError):
+                give_raise(*args, **kwargs)
+
+        @rangetest([1, 0.0, 1.0])
+        def scale(salary: float, percent: float) -> float:
+            return salary * percent
+
+        self.assertEqual(scale(10, percent=0.5), 5)
+        with self.assertRaises(TypeError):
+            scale(10, percent=2)
+
+    def test_missing_argument(self):
+        """Test that rangetest raises IndexError for a missing argument and advance_rangetest leaves defaults unchecked"""
+        @rangetest([1, 0.0, 1.0])
+        def scale(salary: float, percent: float = 0.5) -> float:
+            return salary * percent
+
+        with self.assertRaises(IndexError):
+            scale(10)
+
+        @advance_rangetest(percent=(0.0, 1.0))
+        def scale_default(salary: float, percent: float = 2.0) -> float:
+            return salary * percent
+
+        self.assertEqual(scale_default(10), 20)
+
+    def test_no_logging_on_success(self):
+        """Test that passing checks log nothing"""
+        records: list[str] = []
+        sink = logger.add(records.append, level="DEBUG")
+        try:
+            @rangetest([0, 1, 12])
+            def valid_month(index: int) -> int:
+                return index
+
+            records.clear()
+            self.assertEqual([valid_month(month) for month in range(1, 13)], list(range(1, 13)))
+            self.assertEqual(records, [])
+        finally:
+            logger.remove(sink)
+
+    def test_batch(self):
+        """Test that arrays of arguments are checked in one vectorized pass"""
+        import numpy as np
+
+        @advance_rangetest(age=(0, 120), percent=(0.0, 1.0))
+        def record(name: str, age: int, percent: float = 0.0) -> None:
+            pass
+
+        ages = np.array([30, 121, 45, -1])
+        percents = np.array([0.1, 0.2, 1.5, 0.3])
+        self.assertEqual(record.valid_rows(None, ages, percent=percents).tolist(), [True, False, False, False])
+        self.assertEqual(record.valid_rows(None, ages).tolist(), [True, False, True, False])
+        record.check_rows(None, np.array([0, 120]))
+        with self.assertRaisesRegex(TypeError, "row 1"):
+            record.check_rows(None, ages)
+        with self.assertRaises(ValueError):
+            record.valid_rows("name")